@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+"""
+Benchmark of the Nautobot sync path (the create_nb_* stages of nr_routeros_pull_to_nautobot)
+against the fake Nautobot in nr_nautobot_simulator.
+
+The device facts come from a recorded host.data dump ({host name: host.data} as JSON,
+repeated until there are enough devices) or, by default, from the RouterOS simulator's
+router data.  The stages run three times: into an empty Nautobot, then twice more into
+the populated one like nightly re-syncs (the first also retries the hosts that failed
+initially).  The device, interface and IP stages read from one GraphQL snapshot.  Each stage reports its wall time, requests, requests per
+device and failed hosts.  The fake Nautobot runs in this process, so wall times include
+its own CPU time; requests per device don't depend on it.  It exits with status 1 if any
+host failed, since the requests of a sync that skipped hosts don't measure the sync.
+
+Usage: bench_nautobot_sync.py [--devices 100] [--latency 0.005] [--num-workers 20]
+                              [--host-data host_data.json] [--json results.json]
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+from nornir.core import Nornir
+from nornir.core.inventory import Inventory, Hosts, Host, Groups, Defaults
+from nornir.plugins.runners import ThreadedRunner
+from pynautobot import api
+from nr_routeros_general import INTERFACE_FIELDS, IP_ADDRESS_FIELDS
+from nr_inventory_index import site_from_name, role_from_name
+from nr_routeros_pull_to_nautobot import (
+    sync_nb_sites, sync_nb_device_types, create_nb_device,
+    create_nb_interfaces, sync_nb_prefixes, create_nb_ip_addresses,
+)
+from nr_routeros_simulator import make_router, sim_hostname
+from nr_nautobot_graphql import get_nb_devices
+import nr_nautobot_simulator
+
+# Same order as run_pull_to_nautobot
+STAGES = [
+    sync_nb_sites,
+    sync_nb_device_types,
+    create_nb_device,
+    create_nb_interfaces,
+    sync_nb_prefixes,
+    create_nb_ip_addresses,
+]
+
+# Stages that run once for the whole inventory instead of once per host
+FLEET_STAGES = [sync_nb_sites, sync_nb_device_types, sync_nb_prefixes]
+
+# Stages that read the devices from the GraphQL snapshot (read in the first of them)
+SNAPSHOT_STAGES = [create_nb_device, create_nb_interfaces, create_nb_ip_addresses]
+
+def simulated_host_data(index, hosts, vlans=20):
+    '''
+    Returns the host.data get_mikrotik_info would gather from simulated router index.
+    '''
+    router = make_router(index, hosts, vlans)
+    resource = router['/system/resource'][0]
+    name = sim_hostname(index)
+
+    return {
+        'ros_version': resource['version'].split(' ')[0],
+        'ros_major_version': resource['version'].split('.')[0],
+        'hardware': resource['board-name'],
+        'serial': router['/system/routerboard'][0]['serial-number'],
+        'interfaces': [{key: item[key] for key in INTERFACE_FIELDS if key in item} for item in router['/interface']],
+        'ip_addresses': [{key: item[key] for key in IP_ADDRESS_FIELDS if key in item} for item in router['/ip/address']],
+        'site': site_from_name(name),
+        'role': role_from_name(name),
+    }
+
+def load_host_data(path, devices):
+    '''
+    Loads recorded host.data and repeats it until there are devices hosts.  Copies get
+    a -<n> suffix on their name, which keeps the site and role of the original.
+    '''
+    with open(path) as f:
+        recorded = json.load(f)
+
+    names = sorted(recorded)
+    host_data = {}
+    for index in range(devices):
+        name = names[index % len(names)]
+        copy = index // len(names)
+        host_data[f'{name}-{copy}' if copy else name] = json.loads(json.dumps(recorded[name]))
+
+    return host_data
+
+def build_nornir(host_data, num_workers=20):
+    '''
+    Returns a Nornir object with one host per host.data entry and no connections.
+    '''
+    hosts = Hosts()
+    for name, data in host_data.items():
+        hosts[name] = Host(name=name, hostname=name, data=data)
+
+    inventory = Inventory(hosts=hosts, groups=Groups(), defaults=Defaults())
+    return Nornir(inventory=inventory, runner=ThreadedRunner(num_workers=num_workers))
+
+def run_stages(nr, nautobot, simulator, sync):
+    '''
+    Runs every stage once.  Returns the statistics of each stage.
+    '''
+    devices = len(nr.inventory.hosts)
+    stats = []
+    nb_devices = None
+
+    for stage in STAGES:
+        simulator.reset_counters()
+        started = time.perf_counter()
+        if stage in FLEET_STAGES:
+            stage(nr, nautobot)
+            failed = 0
+        elif stage in SNAPSHOT_STAGES:
+            if nb_devices is None:
+                nb_devices = get_nb_devices(nautobot, names=list(nr.inventory.hosts))
+            failed = len(nr.run(task=stage, nautobot=nautobot, nb_devices=nb_devices).failed_hosts)
+        else:
+            failed = len(nr.run(task=stage, nautobot=nautobot).failed_hosts)
+        wall = time.perf_counter() - started
+        requests = simulator.request_count()
+
+        stats.append({
+            'sync': sync,
+            'stage': stage.__name__,
+            'devices': devices,
+            'wall': wall,
+            'requests': requests,
+            'requests_per_device': requests / devices,
+            'failed': failed,
+        })
+
+    return stats
+
+def print_stats(stats):
+    print(
+        f'{stats["sync"]:<8} {stats["stage"]:<24} {stats["devices"]:>7} {stats["wall"]:>8.2f}s '
+        f'{stats["requests"]:>9} {stats["requests_per_device"]:>8.1f} {stats["failed"]:>6}'
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Nautobot sync stages against a fake Nautobot')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated seconds per Nautobot request')
+    parser.add_argument('--num-workers', type=int, default=20)
+    parser.add_argument('--vlans', type=int, default=20, help='VLAN interfaces per simulated router')
+    parser.add_argument('--host-data', help='JSON file of recorded {host name: host.data}')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.host_data:
+        host_data = load_host_data(args.host_data, args.devices)
+    else:
+        host_data = {sim_hostname(index): simulated_host_data(index, args.devices, args.vlans) for index in range(args.devices)}
+
+    simulator, server = nr_nautobot_simulator.start(port=0, latency=args.latency)
+    nautobot = api(url=simulator.base_url, token='simulated')
+
+    print(f'fake Nautobot latency: {args.latency * 1000:.1f}ms, workers: {args.num_workers}')
+    print(f'{"sync":<8} {"stage":<24} {"devices":>7} {"wall":>9} {"requests":>9} {"req/dev":>8} {"failed":>6}')
+
+    results = []
+    try:
+        for sync in ['initial', 'resync', 'resync']:
+            # The stages change host.data, so each sync starts from freshly gathered data, like a nightly run
+            nr = build_nornir(copy.deepcopy(host_data), args.num_workers)
+            stats = run_stages(nr, nautobot, simulator, sync)
+            for stage_stats in stats:
+                print_stats(stage_stats)
+
+            wall = sum(stage_stats['wall'] for stage_stats in stats)
+            requests = sum(stage_stats['requests'] for stage_stats in stats)
+            print(f'{sync:<8} {"total":<24} {args.devices:>7} {wall:>8.2f}s {requests:>9} {requests / args.devices:>8.1f}')
+            results.extend(stats)
+    finally:
+        server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = [stats for stats in results if stats['failed']]
+    for stats in failed:
+        print(f'FAILED: {stats["sync"]} {stats["stage"]}: {stats["failed"]} hosts failed')
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+"""
+Fleet-scale benchmark against the local RouterOS API simulator.
+
+Starts nr_routeros_simulator in a separate process, builds an in-memory inventory of
+simulated routers, and runs each workload with each engine:
+
+    facts       get_mikrotik_info (threaded), async_get_mikrotik_facts (async)
+    baseline    get_ros_version and the four configure_* baseline tasks (threaded only)
+    neighbors   /ip/neighbor over the API (the SSH based get_neighbors can't be simulated)
+
+For every run it prints the wall time, hosts per second, failed hosts, per-host latency
+percentiles and API requests per host.  It exits with status 1 if any host failed in any
+run, since the timings of failed runs don't measure the workload.
+
+Usage: bench_routeros_fleet.py [--sizes 100,1000,10000] [--workloads facts,baseline,neighbors]
+                               [--engines threaded,async] [--latency 0.02] [--num-workers 100]
+                               [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from nornir.core import Nornir
+from nornir.core.plugins.connections import ConnectionPluginRegister
+from nornir.core.inventory import Inventory, Hosts, Host, Groups, Group, ParentGroups, Defaults, ConnectionOptions
+from nornir.core.task import Task, Result
+from nornir.plugins.runners import ThreadedRunner
+from nr_routeros_general import get_ros_version, routeros_read
+from nr_routeros_baseline import configure_ntp, configure_snmp, configure_remote_logging, configure_ip_services
+from nr_routeros_pull_to_nautobot import get_mikrotik_info
+from nr_routeros_async import run_async, async_get_mikrotik_facts
+from nr_routeros_simulator import RouterOsSimulator, SIM_PORT, sim_hostname, sim_username
+from nr_reachability import probe_port
+from nr_metrics import TimingProcessor, TRANSPORT_METRICS, percentile, QUANTILES
+
+NEIGHBOR_FIELDS = ['mac-address', 'address', 'identity', 'platform', 'version', 'board', 'interface']
+
+def raise_open_files_limit():
+    '''
+    Raises the soft open files limit to the hard limit.  Every in-flight host needs a socket
+    on both the client and the simulator side.
+    '''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+def serve_simulator(hosts, latency, port):
+    raise_open_files_limit()
+    simulator = RouterOsSimulator(hosts=hosts, latency=latency)
+    asyncio.run(simulator.serve('127.0.0.1', port))
+
+def start_simulator(hosts, latency, port=SIM_PORT):
+    '''
+    Starts the simulator in its own process, so it doesn't compete with the client for the GIL,
+    and waits until it accepts connections.
+    '''
+    process = multiprocessing.Process(target=serve_simulator, args=(hosts, latency, port), daemon=True)
+    process.start()
+
+    for _ in range(100):
+        if asyncio.run(probe_port('127.0.0.1', port, timeout=0.5)):
+            return process
+        time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError(f'simulator did not start on port {port}')
+
+def build_nornir(hosts, port=SIM_PORT, num_workers=100):
+    '''
+    Returns a Nornir object with an inventory of simulated routers, all on 127.0.0.1.
+    '''
+    routeros = Group(
+        name='routeros',
+        platform='ros',
+        connection_options={'routerosapi': ConnectionOptions(extras={'use_ssl': False})},
+    )
+
+    inventory_hosts = Hosts()
+    for index in range(hosts):
+        name = sim_hostname(index)
+        inventory_hosts[name] = Host(
+            name=name,
+            hostname='127.0.0.1',
+            username=sim_username(index),
+            password='simulated',
+            port=port,
+            groups=ParentGroups([routeros]),
+        )
+
+    inventory = Inventory(hosts=inventory_hosts, groups=Groups({'routeros': routeros}), defaults=Defaults())
+
+    # InitNornir does this for scripts using config.yaml
+    ConnectionPluginRegister.auto_register()
+    return Nornir(inventory=inventory, runner=ThreadedRunner(num_workers=num_workers))
+
+def baseline(task: Task) -> Result:
+    '''
+    Runs the baseline tasks like nr_routeros_baseline does, for one host.
+    '''
+    task.run(task=get_ros_version)
+    for configure_task in [configure_ntp, configure_snmp, configure_remote_logging, configure_ip_services]:
+        task.run(task=configure_task)
+
+    return Result(host=task.host, result='baseline applied')
+
+def get_neighbors_api(task: Task) -> Result:
+    result = task.run(task=routeros_read, path='/ip/neighbor', proplist=NEIGHBOR_FIELDS)
+    return Result(host=task.host, result=result.result)
+
+async def async_get_neighbors(api, host) -> Result:
+    neighbors = await api.get('/ip/neighbor', proplist=NEIGHBOR_FIELDS)
+    return Result(host=host, result=neighbors)
+
+THREADED_WORKLOADS = {
+    'facts': get_mikrotik_info,
+    'baseline': baseline,
+    'neighbors': get_neighbors_api,
+}
+
+ASYNC_WORKLOADS = {
+    'facts': async_get_mikrotik_facts,
+    'neighbors': async_get_neighbors,
+}
+
+def run_threaded(nr, workload):
+    '''
+    Runs a workload with Nornir's threaded runner.  Returns (result, {host: seconds}).
+    '''
+    timing = TimingProcessor()
+    try:
+        result = nr.with_processors([timing]).run(task=THREADED_WORKLOADS[workload])
+    finally:
+        nr.close_connections(on_failed=True)
+
+    return result, timing.durations_by_host()
+
+def run_in_async_engine(nr, workload, num_workers):
+    '''
+    Runs a workload with the asyncio engine.  Returns (result, {host: seconds}).
+    '''
+    durations = {}
+    task = ASYNC_WORKLOADS[workload]
+
+    async def timed(api, host):
+        started = time.perf_counter()
+        try:
+            return await task(api, host)
+        finally:
+            durations[host.name] = time.perf_counter() - started
+
+    result = asyncio.run(run_async(nr, timed, num_workers=num_workers, name=workload))
+    return result, durations
+
+def benchmark(nr, engine, workload, num_workers):
+    '''
+    Runs one workload and returns its statistics.
+    '''
+    # Start every run from clean counters, and with no hosts skipped by an earlier run
+    with TRANSPORT_METRICS.lock:
+        TRANSPORT_METRICS.counters.clear()
+    nr.data.reset_failed_hosts()
+
+    started = time.perf_counter()
+    if engine == 'threaded':
+        result, durations = run_threaded(nr, workload)
+    else:
+        result, durations = run_in_async_engine(nr, workload, num_workers)
+    wall = time.perf_counter() - started
+
+    hosts = len(nr.inventory.hosts)
+    requests = sum(
+        counters['requests']
+        for transports in TRANSPORT_METRICS.snapshot().values()
+        for counters in transports.values()
+    )
+
+    stats = {
+        'engine': engine,
+        'workload': workload,
+        'hosts': hosts,
+        'wall': wall,
+        'hosts_per_second': hosts / wall,
+        'failed': len(result.failed_hosts),
+        'requests_per_host': requests / hosts,
+    }
+    values = list(durations.values()) or [0]
+    for quantile in QUANTILES:
+        stats[f'p{int(quantile * 100)}'] = percentile(values, quantile)
+    stats['max'] = max(values)
+
+    return stats
+
+def print_stats(stats):
+    print(
+        f'{stats["engine"]:<9} {stats["workload"]:<10} {stats["hosts"]:>6} {stats["wall"]:>8.2f}s '
+        f'{stats["hosts_per_second"]:>9.1f}/s {stats["failed"]:>6} '
+        f'{stats["p50"] * 1000:>8.1f} {stats["p90"] * 1000:>8.1f} {stats["p99"] * 1000:>8.1f} {stats["max"] * 1000:>8.1f} '
+        f'{stats["requests_per_host"]:>8.1f}'
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark workflows against simulated RouterOS fleets')
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated fleet sizes')
+    parser.add_argument('--workloads', default='facts,baseline,neighbors')
+    parser.add_argument('--engines', default='threaded,async')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated seconds per API reply')
+    parser.add_argument('--num-workers', type=int, default=100, help='hosts in flight')
+    parser.add_argument('--port', type=int, default=SIM_PORT)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    limit = raise_open_files_limit()
+    print(f'open files limit: {limit}, simulated latency: {args.latency * 1000:.0f}ms, workers: {args.num_workers}')
+    print(f'{"engine":<9} {"workload":<10} {"hosts":>6} {"wall":>9} {"throughput":>11} {"failed":>6} '
+          f'{"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"req/host":>8}')
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        simulator = start_simulator(size, args.latency, args.port)
+        try:
+            nr = build_nornir(size, args.port, args.num_workers)
+            for engine in args.engines.split(','):
+                for workload in args.workloads.split(','):
+                    if engine == 'async' and workload not in ASYNC_WORKLOADS:
+                        continue
+                    stats = benchmark(nr, engine, workload, args.num_workers)
+                    print_stats(stats)
+                    results.append(stats)
+        finally:
+            simulator.terminate()
+            simulator.join()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # Throughput of runs where hosts failed isn't a result
+    failed = [stats for stats in results if stats['failed']]
+    for stats in failed:
+        print(f'FAILED: {stats["engine"]} {stats["workload"]} with {stats["hosts"]} hosts: {stats["failed"]} hosts failed')
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+"""
+Benchmark of the SwOS tasks against the local SwOS stand-in (nr_swos_simulator).
+
+Runs a workload against N simulated switches once per worker count and reports the
+wall time, switches per second, per-switch latency and the CPU time per switch spent
+in this process and in its children (geckodriver and Firefox).  The maximum useful
+concurrency is the smallest worker count whose throughput is within 10% of the best.
+
+    snmp        get_site and configure_snmp (nr_swos_baseline)
+    identity    set_identity (nr_swos_baseline)
+    upgrade     upgrade_firmware (nr_swos_upgrade, waits 60s per switch)
+    http        the page and data requests behind configure_snmp, without a browser
+
+Usage: bench_swos.py [--switches 50] [--workers 1,2,4,8,16] [--workload snmp]
+                     [--delay 0.05] [--upgrade-duration 30] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import time
+import requests
+from nornir.core import Nornir
+from nornir.core.inventory import Inventory, Hosts, Host, Groups, Group, ParentGroups, Defaults
+from nornir.core.task import Task, Result
+from nornir.plugins.runners import ThreadedRunner
+from nr_swos_baseline import get_site, configure_snmp, set_identity
+from nr_swos_upgrade import upgrade_firmware
+from nr_swos_simulator import start, sim_switch_name, swos_encode, swos_decode, SWOS_SIM_PORT
+from nr_metrics import TimingProcessor, percentile
+
+def snmp(task: Task) -> Result:
+    task.run(task=get_site)
+    return task.run(task=configure_snmp)[0]
+
+def http_snmp(task: Task) -> Result:
+    '''
+    Makes the requests a browser makes for configure_snmp: the page, the SNMP data, and the apply.
+    '''
+    session = requests.Session()
+    session.auth = (task.host.username, task.host.password)
+    base_url = f'http://{task.host.hostname}'
+
+    session.get(f'{base_url}/index.html').raise_for_status()
+    data = swos_decode(session.get(f'{base_url}/snmp.b').text)
+    data.update({'en': 1, 'loc': task.host.name.split('-')[0]})
+    session.post(f'{base_url}/snmp.b', data=swos_encode(data)).raise_for_status()
+    session.close()
+
+    return Result(host=task.host, result=f'Successfully configured SNMP on {task.host.name}')
+
+WORKLOADS = {
+    'snmp': snmp,
+    'identity': set_identity,
+    'upgrade': upgrade_firmware,
+    'http': http_snmp,
+}
+
+def build_nornir(switches, port=SWOS_SIM_PORT, num_workers=1):
+    '''
+    Returns a Nornir object with an inventory of simulated switches, all on 127.0.0.1:port.
+    '''
+    swos = Group(name='swos', platform='swos')
+
+    hosts = Hosts()
+    for index in range(switches):
+        name = sim_switch_name(index)
+        hosts[name] = Host(
+            name=name,
+            hostname=f'127.0.0.1:{port}',
+            username=f'sim-{index}',
+            password='simulated',
+            groups=ParentGroups([swos]),
+        )
+
+    inventory = Inventory(hosts=hosts, groups=Groups({'swos': swos}), defaults=Defaults())
+    return Nornir(inventory=inventory, runner=ThreadedRunner(num_workers=num_workers))
+
+def cpu_time():
+    '''
+    Returns the CPU seconds used by this process and its waited-for children (the browsers).
+    '''
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def benchmark(nr, workload, num_workers):
+    nr.runner.num_workers = num_workers
+    timing = TimingProcessor()
+
+    started = time.perf_counter()
+    cpu_started = cpu_time()
+    result = nr.with_processors([timing]).run(task=WORKLOADS[workload])
+    wall = time.perf_counter() - started
+    cpu = cpu_time() - cpu_started
+
+    # The SwOS tasks report errors in the result text instead of failing
+    switches = len(nr.inventory.hosts)
+    ok = sum(1 for host in result if not result[host].failed and 'Successfully' in str(result[host][0].result))
+    durations = list(timing.durations_by_host().values()) or [0]
+
+    return {
+        'workload': workload,
+        'workers': num_workers,
+        'switches': switches,
+        'wall': wall,
+        'switches_per_second': switches / wall,
+        'ok': ok,
+        'p50': percentile(durations, 0.5),
+        'p90': percentile(durations, 0.9),
+        'cpu_per_switch': cpu / switches,
+    }
+
+def max_useful_concurrency(results):
+    '''
+    Returns the smallest worker count with a throughput within 10% of the best one.
+    '''
+    best = max(stats['switches_per_second'] for stats in results)
+    return min(stats['workers'] for stats in results if stats['switches_per_second'] >= 0.9 * best)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SwOS tasks against the SwOS stand-in')
+    parser.add_argument('--switches', type=int, default=50)
+    parser.add_argument('--workers', default='1,2,4,8,16', help='comma separated worker counts')
+    parser.add_argument('--workload', default='snmp', choices=sorted(WORKLOADS))
+    parser.add_argument('--delay', type=float, default=0.05, help='simulated seconds per HTTP response')
+    parser.add_argument('--upgrade-duration', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=SWOS_SIM_PORT)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    simulator, server = start(args.port, args.switches, args.delay, args.upgrade_duration)
+    nr = build_nornir(args.switches, args.port)
+
+    print(f'{args.workload}: {args.switches} switches, simulated delay {args.delay * 1000:.0f}ms')
+    print(f'{"workers":>7} {"wall":>9} {"throughput":>11} {"ok":>5} {"p50 s":>7} {"p90 s":>7} {"cpu/switch":>10}')
+
+    results = []
+    try:
+        for num_workers in [int(workers) for workers in args.workers.split(',')]:
+            stats = benchmark(nr, args.workload, num_workers)
+            results.append(stats)
+            print(
+                f'{num_workers:>7} {stats["wall"]:>8.2f}s {stats["switches_per_second"]:>9.2f}/s {stats["ok"]:>5} '
+                f'{stats["p50"]:>7.2f} {stats["p90"]:>7.2f} {stats["cpu_per_switch"]:>9.3f}s'
+            )
+    finally:
+        server.shutdown()
+
+    print(f'per-switch cost: {results[0]["wall"] / args.switches:.2f}s wall with {results[0]["workers"]} worker(s), '
+          f'{results[0]["cpu_per_switch"]:.3f}s CPU')
+    print(f'maximum useful concurrency: {max_useful_concurrency(results)} workers')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,25 @@ NB_URL = "http://192.168.1.10:8080"
 NB_TOKEN = "xxxx-xxxx"
 CONFIGS_DIR = "~/network-automation/configs"
 SNMP_COMMUNITY = "public"
-SNMP_CONTACT = "admin@example.net"
\ No newline at end of file
+SNMP_CONTACT = "admin@example.net"
+# Management network allowed to reach SNMP and the ssh, api and winbox services (nr_routeros_baseline)
+TRUSTED_ADDRESSES = "10.0.0.0/8"
+# Syslog server the routers send their logs to
+REMOTE_LOGGING_TARGET = "10.0.0.5"
+FACT_CACHE_DIR = "~/.cache/nornir-mikrotik/facts"
+FACT_TTLS = {"ros_version": 86400, "interfaces": 0, "ip_addresses": 0}
+HOST_BUDGET = 600
+MAX_HOST_FAILURES = 3
+API_TIMEOUT = 15
+SSH_TIMEOUT = 120
+REPORTS_DIR = "~/network-automation/reports"
+# Task timings (<job>.prom), transport counters and spans written by nr_metrics.write_metrics
+METRICS_DIR = "~/network-automation/metrics"
+LOG_DIR = "logs"
+LOG_LEVEL = "INFO"
+SYNC_STATE_DIR = "~/.cache/nornir-mikrotik/sync"
+NB_GRAPHQL_BATCH = 100
+CONFIG_INDEX_PATH = "~/.cache/nornir-mikrotik/config-index.json"
+VOLATILE_LINES = [r"^#.*$"]
+DISCOVERY_DEPTH = 10
+DISCOVERY_WORKERS = 100
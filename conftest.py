@@ -0,0 +1,16 @@
+"""
+The modules read their settings from config.py, which is local to each installation.
+Tests run with the settings of config.example.py when there is no config.py.
+"""
+
+import importlib.util
+import os
+import sys
+
+try:
+    import config
+except ModuleNotFoundError:
+    spec = importlib.util.spec_from_file_location('config', os.path.join(os.path.dirname(__file__), 'config.example.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules['config'] = config
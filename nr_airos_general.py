@@ -11,9 +11,10 @@ from nornir_utils.plugins.functions import print_result
 from nornir.core.filter import F
 from config import *
 from nr_routeros_general import *
+from nr_logging import setup_logging
 import logging
 
-logging.basicConfig(filename='logs/nr_airos.log', level=logging.DEBUG)
+setup_logging('nr_airos')
 
 def get_config(task: Task) -> Result:
     result = task.run(
@@ -0,0 +1,176 @@
+"""
+Per-host time budgets, per-transport timeouts and circuit breakers.
+
+HostGuard is a Nornir processor.  Each host gets HOST_BUDGET seconds for the whole run,
+counted from its first task.  Once the budget is spent, or once the host has failed
+MAX_HOST_FAILURES tasks, the host's remaining sub-tasks fail immediately and the host is
+marked as failed so later stages skip it.  Tasks without sub-tasks (the Nautobot writes)
+call check_deadline() between requests, and a task that ends after the deadline marks the
+host as failed too.  Worker slots are never held by one bad host for longer than its
+budget plus one transport timeout.
+
+The deadlines, failure counts and open circuits belong to the HostGuard instance, so use
+one HostGuard per workflow.  Tasks find the guard of the run among its processors:
+
+    nr = nr.with_processors([HostGuard()])
+
+    guard = find_guard(task.nornir)
+    check_deadline(guard, task.host.name)
+"""
+
+import threading
+import time
+import config
+from nornir.core.exceptions import NornirSubTaskError
+
+# Seconds a host may spend across all tasks of a run
+HOST_BUDGET = getattr(config, 'HOST_BUDGET', 600)
+
+# Failed tasks after which no more work is sent to a host in this run
+MAX_HOST_FAILURES = getattr(config, 'MAX_HOST_FAILURES', 3)
+
+# Per-transport timeouts in seconds
+API_TIMEOUT = getattr(config, 'API_TIMEOUT', 15)
+SSH_TIMEOUT = getattr(config, 'SSH_TIMEOUT', 120)
+SSH_CONNECT_TIMEOUT = getattr(config, 'SSH_CONNECT_TIMEOUT', 10)
+
+# Shortest timeout given to a transport operation, even when the budget is almost used up
+MIN_TIMEOUT = 1
+
+class BudgetExceeded(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    pass
+
+def find_guard(nornir):
+    '''
+    Returns the HostGuard among the processors of a Nornir object, or None if it has none.
+    '''
+    for processor in nornir.processors:
+        if isinstance(processor, HostGuard):
+            return processor
+
+    return None
+
+def remaining_time(guard, host_name, default=None):
+    '''
+    Returns the seconds left in the host's budget, or default if the guard is None or the
+    host has no budget in it.
+    '''
+    deadline = guard.deadlines.get(host_name) if guard is not None else None
+    if deadline is None:
+        return default
+
+    return max(deadline - time.monotonic(), 0)
+
+def transport_timeout(guard, host_name, timeout):
+    '''
+    Returns the timeout to use for one transport operation: the transport's own timeout,
+    shortened to the time left in the host's budget in guard.
+    '''
+    remaining = remaining_time(guard, host_name)
+    if remaining is None:
+        return timeout
+
+    return min(timeout, remaining)
+
+def check_deadline(guard, host_name):
+    '''
+    Raises BudgetExceeded if the host's budget in guard is used up.  For tasks that make many
+    requests without running sub-tasks.
+    '''
+    if remaining_time(guard, host_name, default=1) <= 0:
+        raise BudgetExceeded(f'{host_name}: time budget of {guard.budget}s used up')
+
+def apply_api_timeout(guard, host):
+    '''
+    Sets the socket timeout of the host's open binary API connection to API_TIMEOUT, shortened
+    to the time left in the host's budget.  The routeros_api pool doesn't take a timeout in
+    its connection options, so it is set on the host's own connection once it is open.
+    '''
+    connection = host.connections.get('routerosapi')
+    pool = getattr(connection, '_pool', None)
+    if pool is not None and pool.connected:
+        pool.set_timeout(max(transport_timeout(guard, host.name, API_TIMEOUT), MIN_TIMEOUT))
+
+class HostGuard:
+    '''
+    Nornir processor enforcing per-host budgets and opening a circuit breaker after repeated failures.
+    '''
+    def __init__(self, budget=HOST_BUDGET, max_failures=MAX_HOST_FAILURES):
+        self.budget = budget
+        self.max_failures = max_failures
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the deadlines, failures and open circuits of the previous run.
+        '''
+        # Deadline (time.monotonic()) of each host with a running budget, by host name
+        self.deadlines = {}
+        self.failures = {}
+        self.open_circuits = set()
+
+    def check(self, host):
+        '''
+        Raises if no more work should be sent to the host.
+        '''
+        if host.name in self.open_circuits:
+            raise CircuitOpen(f'{host.name}: skipped after {self.failures[host.name]} failures')
+
+        if remaining_time(self, host.name, default=1) <= 0:
+            raise BudgetExceeded(f'{host.name}: time budget of {self.budget}s used up')
+
+    def open_circuit(self, task, host):
+        self.open_circuits.add(host.name)
+
+        # Hosts in failed_hosts are skipped by every following nr.run()
+        task.nornir.data.failed_hosts.add(host.name)
+
+    def record(self, task, host, result):
+        '''
+        Counts a failed task and opens the host's circuit when it failed too often.
+        '''
+        if not result[0].failed:
+            return
+
+        # A parent task failing because of its sub-task was already counted at the sub-task
+        if isinstance(result[0].exception, NornirSubTaskError):
+            return
+
+        with self.lock:
+            self.failures[host.name] = self.failures.get(host.name, 0) + 1
+
+            if self.failures[host.name] >= self.max_failures or remaining_time(self, host.name, default=1) <= 0:
+                self.open_circuit(task, host)
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        # Start the host's budget on its first task of the run
+        with self.lock:
+            self.deadlines.setdefault(host.name, time.monotonic() + self.budget)
+        apply_api_timeout(self, host)
+
+    def task_instance_completed(self, task, host, result):
+        self.record(task, host, result)
+
+        # A task without sub-tasks is never checked before it runs, so a host that used up
+        # its budget in one is stopped here, before the next stage
+        if remaining_time(self, host.name, default=1) <= 0 and host.name not in self.open_circuits:
+            with self.lock:
+                self.open_circuit(task, host)
+
+    def subtask_instance_started(self, task, host):
+        # Raising here fails the parent task before the sub-task does any work
+        self.check(host)
+        apply_api_timeout(self, host)
+
+    def subtask_instance_completed(self, task, host, result):
+        self.record(task, host, result)
@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+"""
+Offline baseline compliance of the stored config exports.
+
+parse_export() reads a RouterOS export (CONFIGS_DIR/<host>.rsc, as saved by
+nr_routeros_get_config) into a ConfigTree: the items of each section (/ip/service,
+/system/logging, ...) with their properties, indexed by name.  check_fleet() evaluates
+the rules of the nr_routeros_baseline stages against the trees, the way config_item
+would find and compare the items on the router, and returns the violations per host
+and stage without connecting to any router.  Only the sections the rules read are parsed.
+
+    violations = check_fleet(nr)
+    run_baseline(nr.filter(filter_func=lambda host: bool(violations[host.name])), violations=violations)
+
+Usage: nr_compliance.py <hostname|all|selectors> [--json violations.json]
+"""
+
+import json
+import os
+import re
+import sys
+import time
+import config
+from nornir import InitNornir
+from nr_routeros_general import filter_target, command_line_target
+from nr_routeros_baseline import BASELINE_STAGES
+
+# Directory of the stored <host>.rsc exports
+CONFIGS_DIR = getattr(config, 'CONFIGS_DIR', 'configs')
+
+# Commands that can follow a section path on the same line
+COMMANDS = {'add', 'set', 'remove', 'unset', 'enable', 'disable'}
+
+# Properties that exports leave out (passwords), so they can't be checked offline
+SENSITIVE_PROPERTIES = {'authentication-password', 'encryption-password', 'password', 'secret'}
+
+# Values of properties that a compact (non-verbose) export leaves out because they are the default
+PROPERTY_DEFAULTS = {'disabled': 'no'}
+
+# key=value, key="quoted value", or a bare word
+TOKEN_PATTERN = re.compile(r'([^\s=\[\]]+)=("(?:[^"\\]|\\.)*"|\S*)|(\[|\]|[^\s\[\]]+)')
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+def same_value(actual, wanted):
+    '''
+    Compares two property values.  Comma separated lists match in any order.
+    '''
+    if actual == wanted:
+        return True
+    if ',' in actual or ',' in wanted:
+        return set(actual.split(',')) == set(wanted.split(','))
+    return False
+
+class ConfigTree:
+    '''
+    The sections of a RouterOS export.  items[path] holds the properties of each item added
+    or set in the section (positional names as 'name', [ find ... ] selectors merged in),
+    settings[path] the properties set on the section itself (/snmp set enabled=yes), and
+    commands[path] the remove and unset commands, in order.
+    '''
+    def __init__(self):
+        self.items = {}
+        self.settings = {}
+        self.names = {}
+        self.commands = {}
+
+    def add(self, path, command, selector, properties):
+        if command == 'set' and selector is None:
+            self.settings.setdefault(path, {}).update(properties)
+            return
+
+        item = dict(selector or {})
+        item.update(properties)
+
+        # set <name> on a named item, like /ip service set telnet disabled=yes.  Every add is a
+        # new item, even if an earlier one has the same name (/ip dns static add name=...)
+        if command == 'set' and 'name' in item and item['name'] in self.names.get(path, {}):
+            self.names[path][item['name']][0].update(item)
+            return
+
+        self.items.setdefault(path, []).append(item)
+        if 'name' in item:
+            self.names.setdefault(path, {}).setdefault(item['name'], []).append(item)
+
+    def find(self, path, where):
+        '''
+        Returns the items of a section matching all properties of where.  An empty where
+        selects the section's own settings.
+        '''
+        if not where:
+            return [self.settings[path]] if path in self.settings else []
+
+        if 'name' in where:
+            candidates = self.names.get(path, {}).get(where['name'], [])
+        else:
+            candidates = self.items.get(path, [])
+
+        return [
+            item for item in candidates
+            if all(same_value(item.get(key, PROPERTY_DEFAULTS.get(key, '')), value) for key, value in where.items())
+        ]
+
+def parse_command(text):
+    '''
+    Splits a command line into (command, selector, properties).  The selector is the
+    properties of [ find ... ], {'name': ...} for a positional name, or None.
+    '''
+    tokens = TOKEN_PATTERN.findall(text)
+    if not tokens:
+        return None, None, {}
+
+    command = tokens[0][2]
+    selector = None
+    properties = {}
+    in_find = False
+
+    for key, value, word in tokens[1:]:
+        if word == '[':
+            in_find = True
+            selector = {}
+        elif word == ']':
+            in_find = False
+        elif key:
+            if in_find:
+                selector[key] = unquote(value)
+            else:
+                properties[key] = unquote(value)
+        elif word and word != 'find' and not in_find:
+            # Item numbers (set 3 ...) select by position, names select the named item
+            selector = {} if word.isdigit() else {'name': unquote(word)}
+
+    return command, selector, properties
+
+def section_path(header):
+    '''
+    Splits a section line (/ip service, or /ip service set telnet disabled=yes) into the
+    section path (/ip/service) and the command that follows it, if any.
+    '''
+    words = header.split(' ')
+    for index, word in enumerate(words):
+        if word in COMMANDS:
+            break
+    else:
+        index = len(words)
+
+    return '/' + '/'.join(word.strip('/') for word in words[:index] if word and word != '\\'), ' '.join(words[index:])
+
+def export_sections(text):
+    '''
+    Splits a RouterOS export into (section path, section text) pairs in the order they
+    appear.  The section text is everything after the path: a command on the section line,
+    and the lines up to the next section.  A section can appear more than once.
+    '''
+    # Every section starts on a line beginning with /
+    for chunk in re.split(r'\n(?=/)', text):
+        if chunk.startswith('/'):
+            header, _, body = chunk.partition('\n')
+            path, command_line = section_path(header)
+            yield path, command_line + '\n' + body
+
+def parse_section(tree, path, text):
+    '''
+    Adds the commands of a section's text to the tree.  enable and disable set the disabled
+    property of the items they select, remove and unset are kept as they are written.
+    '''
+    pending = ''
+    for line in text.split('\n'):
+        # Join lines continued with a trailing backslash
+        if line.endswith('\\'):
+            pending += line[:-1].lstrip() if pending else line[:-1]
+            continue
+        if pending:
+            line = pending + line.lstrip()
+            pending = ''
+
+        if not line or line.startswith('#'):
+            continue
+
+        command, selector, properties = parse_command(line)
+        if command in ('add', 'set'):
+            tree.add(path, command, selector, properties)
+        elif command in ('enable', 'disable'):
+            tree.add(path, 'set', selector or {}, {'disabled': 'yes' if command == 'disable' else 'no'})
+        elif command in ('remove', 'unset'):
+            tree.commands.setdefault(path, []).append({'command': ' '.join(line.split())})
+
+def parse_export(text, sections=None):
+    '''
+    Parses a RouterOS export into a ConfigTree.  If sections is given, only those section
+    paths (/ip/service) are parsed, and the others are skipped without reading their lines.
+    '''
+    tree = ConfigTree()
+    for path, section_text in export_sections(text):
+        if sections is None or path in sections:
+            parse_section(tree, path, section_text)
+
+    return tree
+
+def export_major_version(tree):
+    '''
+    Returns the routeros major version an export was made on, from the shape of its NTP
+    client configuration, or None if it can't tell.
+    '''
+    ntp_client = tree.settings.get('/system/ntp/client', {})
+    if '/system/ntp/client/servers' in tree.items or 'servers' in ntp_client or 'mode' in ntp_client:
+        return '7'
+    if 'server-dns-names' in ntp_client or 'primary-ntp' in ntp_client:
+        return '6'
+
+    return None
+
+def rule_sections(hosts):
+    '''
+    Returns the section paths the baseline rules of the hosts read, for every routeros version.
+    '''
+    sections = {'/system/ntp/client', '/system/ntp/client/servers'}
+    for host in hosts:
+        for stage, rules in BASELINE_STAGES.values():
+            for version in ('6', '7'):
+                sections.update(rule['path'] for rule in rules(host, version))
+
+    return sections
+
+def check_rule(tree, rule):
+    '''
+    Returns the violations of one config_item rule: the item is missing, or a property differs.
+    '''
+    path = rule['path']
+    where = rule['where']
+    label = path + ''.join(f' {key}={value}' for key, value in where.items())
+
+    items = tree.find(path, where)
+    if not items:
+        return [f'{label}: missing']
+
+    # Compliant if any matching item has every property, otherwise report the first one
+    first = None
+    for item in items:
+        violations = []
+        for key, wanted in rule['properties'].items():
+            actual = item.get(key, PROPERTY_DEFAULTS.get(key))
+            if actual is None:
+                if key not in SENSITIVE_PROPERTIES:
+                    violations.append(f'{label}: {key} is not set, want {wanted}')
+            elif not same_value(actual, str(wanted)):
+                violations.append(f'{label}: {key}={actual}, want {wanted}')
+
+        if not violations:
+            return []
+        if first is None:
+            first = violations
+
+    return first
+
+def check_host(host, tree):
+    '''
+    Returns {stage name: [violations]} for the stages a host's export violates.
+    '''
+    version = export_major_version(tree)
+    violations = {}
+
+    for stage_name, (stage, rules) in BASELINE_STAGES.items():
+        # Rules that depend on the version can't be checked without it
+        if version is None and rules(host, '6') != rules(host, '7'):
+            violations[stage_name] = ['cannot tell the routeros version from the export']
+            continue
+
+        stage_violations = []
+        for rule in rules(host, version):
+            stage_violations.extend(check_rule(tree, rule))
+
+        if stage_violations:
+            violations[stage_name] = stage_violations
+
+    return violations
+
+def check_fleet(nr, configs_dir=CONFIGS_DIR):
+    '''
+    Checks the stored export of every host in the inventory.  Returns {host name: {stage name: [violations]}};
+    compliant hosts have no stages.  Hosts without a stored export violate every stage.
+    '''
+    configs_dir = os.path.expanduser(configs_dir)
+    hosts = list(nr.inventory.hosts.values())
+    sections = rule_sections(hosts)
+    violations = {}
+
+    for host in hosts:
+        try:
+            with open(os.path.join(configs_dir, f'{host.name}.rsc'), 'r') as f:
+                tree = parse_export(f.read(), sections)
+        except FileNotFoundError:
+            violations[host.name] = {stage_name: ['no stored export'] for stage_name in BASELINE_STAGES}
+            continue
+
+        violations[host.name] = check_host(host, tree)
+
+    return violations
+
+def print_violations(violations):
+    '''
+    Prints the violations of each non-compliant host, and the number of compliant hosts.
+    '''
+    for host_name, stages in sorted(violations.items()):
+        for stage_name, stage_violations in stages.items():
+            for violation in stage_violations:
+                print(f'{host_name:<28} {stage_name:<26} {violation}')
+
+    noncompliant = sum(1 for stages in violations.values() if stages)
+    print(f'== compliance: {len(violations) - noncompliant} compliant, {noncompliant} non-compliant')
+
+def main():
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    started = time.perf_counter()
+    violations = check_fleet(nr)
+    print_violations(violations)
+    print(f'checked {len(violations)} exports in {time.perf_counter() - started:.2f}s')
+
+    # Optionally save the violations, for example to feed them to another job
+    if '--json' in sys.argv[2:]:
+        with open(sys.argv[sys.argv.index('--json') + 1], 'w') as f:
+            json.dump(violations, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+"""
+Semantic diff of two RouterOS exports.
+
+diff_exports() drops the volatile lines (the export header with its timestamp, comments),
+compares the exports section by section and only parses the sections whose text differs,
+with the nr_compliance parser.  The items of a section are matched by their key (name,
+default-name, or the properties ITEM_KEYS lists for the section), so reordered items are
+not a change, except in ORDERED_SECTIONS like the firewall, where the order of the rules
+matters and items are matched in sequence.  The result is a list of changes:
+
+    {'path': '/ip/service', 'action': 'modified', 'key': 'name=telnet',
+     'properties': {...}, 'changes': {'disabled': ('no', 'yes')}}
+
+find_config_and_commit only commits a config that has changes, so a new export timestamp
+or a reordered verbose export doesn't make a commit.
+
+Usage: nr_config_diff.py <old.rsc> <new.rsc>
+       nr_config_diff.py --since <git revision>   (every export in CONFIGS_DIR)
+"""
+
+import difflib
+import os
+import re
+import subprocess
+import sys
+import time
+import config
+from nr_compliance import ConfigTree, export_sections, parse_section
+
+# Directory of the stored <host>.rsc exports
+CONFIGS_DIR = getattr(config, 'CONFIGS_DIR', 'configs')
+
+# Lines that change without a configuration change: the header with the export time, comments
+VOLATILE_LINES = getattr(config, 'VOLATILE_LINES', [r'^#.*$'])
+
+# Properties that change without a configuration change, per section
+VOLATILE_PROPERTIES = getattr(config, 'VOLATILE_PROPERTIES', {
+    '/system/clock': ['date', 'time'],
+})
+
+# The properties that identify an item in sections where it has no name
+ITEM_KEYS = {
+    '/interface/bridge/port': ('bridge', 'interface'),
+    '/interface/bridge/vlan': ('bridge', 'vlan-ids'),
+    '/ip/address': ('address', 'interface'),
+    '/ip/dhcp-server/lease': ('mac-address',),
+    '/ip/dhcp-server/network': ('address',),
+    '/ip/firewall/address-list': ('list', 'address'),
+    '/ip/route': ('dst-address', 'gateway', 'routing-table'),
+    '/ipv6/address': ('address', 'interface'),
+    '/ipv6/firewall/address-list': ('list', 'address'),
+    '/system/logging': ('topics', 'action'),
+    '/system/ntp/client/servers': ('address',),
+}
+
+# Sections where the order of the items is part of the configuration: rules evaluated top
+# to bottom, queues matched in order, and static DNS entries, where the first match wins.
+# Address lists are not ordered; their entries are matched on ITEM_KEYS.
+ORDERED_SECTIONS = {
+    '/interface/bridge/filter', '/interface/bridge/nat',
+    '/ip/dns/static', '/ip/hotspot/walled-garden', '/ip/ipsec/policy', '/ip/proxy/access',
+    '/ip/firewall/filter', '/ip/firewall/nat', '/ip/firewall/mangle', '/ip/firewall/raw',
+    '/ipv6/firewall/filter', '/ipv6/firewall/nat', '/ipv6/firewall/mangle', '/ipv6/firewall/raw',
+    '/ip/route/rule', '/queue/simple', '/queue/tree', '/routing/filter', '/routing/rule',
+}
+
+VOLATILE_PATTERN = re.compile('|'.join(VOLATILE_LINES), re.MULTILINE) if VOLATILE_LINES else None
+
+def strip_volatile(text):
+    '''
+    Returns the export without its volatile lines.
+    '''
+    if VOLATILE_PATTERN is not None:
+        text = VOLATILE_PATTERN.sub('', text)
+    return text
+
+def section_texts(text):
+    '''
+    Returns {section path: [section texts]} of an export, without the volatile lines.
+    '''
+    sections = {}
+    for path, section_text in export_sections(strip_volatile(text)):
+        sections.setdefault(path, []).append(section_text.strip())
+
+    return sections
+
+def item_key(path, item):
+    '''
+    Returns the key an item is matched on, like 'name=ether1', or None if it has none.
+    '''
+    fields = ITEM_KEYS.get(path)
+    if fields is None:
+        fields = ('name',) if 'name' in item else ('default-name',) if 'default-name' in item else None
+    if fields is None:
+        return None
+
+    return ' '.join(f'{field}={item.get(field, "")}' for field in fields)
+
+def describe(item):
+    return ' '.join(f'{key}={value}' for key, value in item.items())
+
+def property_changes(path, old, new):
+    '''
+    Returns {property: (old value, new value)} of the properties that differ, None for a
+    property that is missing on one side.
+    '''
+    volatile = VOLATILE_PROPERTIES.get(path, ())
+    return {
+        key: (old.get(key), new.get(key))
+        for key in list(old) + [key for key in new if key not in old]
+        if key not in volatile and old.get(key) != new.get(key)
+    }
+
+def change(path, action, key, properties, changes=None):
+    return {'path': path, 'action': action, 'key': key, 'properties': properties, 'changes': changes or {}}
+
+def diff_keyed(path, old_items, new_items):
+    '''
+    Returns the changes between two lists of items matched on their key.  Items without a
+    key, and items whose key repeats, are matched on all their properties.
+    '''
+    def keyed(items):
+        by_key = {}
+        for item in items:
+            key = item_key(path, item) or describe(item)
+            # Repeated keys get a counter, so both are kept
+            count = 1
+            unique_key = key
+            while unique_key in by_key:
+                count += 1
+                unique_key = f'{key} #{count}'
+            by_key[unique_key] = item
+        return by_key
+
+    old_by_key = keyed(old_items)
+    new_by_key = keyed(new_items)
+
+    changes = []
+    for key, item in old_by_key.items():
+        if key not in new_by_key:
+            changes.append(change(path, 'removed', key, item))
+        else:
+            differences = property_changes(path, item, new_by_key[key])
+            if differences:
+                changes.append(change(path, 'modified', key, new_by_key[key], differences))
+
+    for key, item in new_by_key.items():
+        if key not in old_by_key:
+            changes.append(change(path, 'added', key, item))
+
+    return changes
+
+def diff_ordered(path, old_items, new_items):
+    '''
+    Returns the changes between two ordered lists of items, with their positions as keys.
+    Items replaced one for one are reported as modified.
+    '''
+    old_lines = [describe(item) for item in old_items]
+    new_lines = [describe(item) for item in new_items]
+
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for operation, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if operation == 'equal':
+            continue
+
+        if operation == 'replace' and old_end - old_start == new_end - new_start:
+            for offset in range(old_end - old_start):
+                old_item = old_items[old_start + offset]
+                new_item = new_items[new_start + offset]
+                changes.append(change(path, 'modified', f'#{new_start + offset}', new_item, property_changes(path, old_item, new_item)))
+            continue
+
+        for position in range(old_start, old_end):
+            changes.append(change(path, 'removed', f'#{position}', old_items[position]))
+        for position in range(new_start, new_end):
+            changes.append(change(path, 'added', f'#{position}', new_items[position]))
+
+    return changes
+
+def section_lines(section_texts):
+    '''
+    Returns the sorted lines of a section's texts, with continued lines joined.
+    '''
+    return sorted(
+        ' '.join(line.split())
+        for text in section_texts
+        for line in re.sub(r'\\\n\s*', '', text).split('\n')
+        if line.strip()
+    )
+
+def diff_exports(old_text, new_text):
+    '''
+    Returns the list of semantic changes between two exports.  Sections whose text is the
+    same in both are not parsed.  A section whose lines differ in more than their order
+    always has a change, even if the parser can't tell what changed.
+    '''
+    old_sections = section_texts(old_text)
+    new_sections = section_texts(new_text)
+
+    changes = []
+    for path in list(old_sections) + [path for path in new_sections if path not in old_sections]:
+        if old_sections.get(path) == new_sections.get(path):
+            continue
+
+        old_tree = ConfigTree()
+        for section_text in old_sections.get(path, []):
+            parse_section(old_tree, path, section_text)
+        new_tree = ConfigTree()
+        for section_text in new_sections.get(path, []):
+            parse_section(new_tree, path, section_text)
+
+        # Properties set on the section itself (/snmp set enabled=yes)
+        old_settings = old_tree.settings.get(path, {})
+        new_settings = new_tree.settings.get(path, {})
+        differences = property_changes(path, old_settings, new_settings)
+        if differences:
+            changes.append(change(path, 'modified', None, new_settings, differences))
+
+        old_items = old_tree.items.get(path, [])
+        new_items = new_tree.items.get(path, [])
+        if path in ORDERED_SECTIONS:
+            section_changes = diff_ordered(path, old_items, new_items)
+        else:
+            section_changes = diff_keyed(path, old_items, new_items)
+
+        # remove and unset commands are compared in order
+        section_changes.extend(diff_ordered(path, old_tree.commands.get(path, []), new_tree.commands.get(path, [])))
+
+        # Sections with volatile properties differ in their text without a change
+        if not differences and not section_changes and path not in VOLATILE_PROPERTIES:
+            old_lines = section_lines(old_sections.get(path, []))
+            new_lines = section_lines(new_sections.get(path, []))
+            if old_lines != new_lines:
+                section_changes.append(change(path, 'modified', None, {}, {'lines': (len(old_lines), len(new_lines))}))
+
+        changes.extend(section_changes)
+
+    return changes
+
+def format_change(change):
+    '''
+    Returns a change as one line: + added, - removed, ~ modified.
+    '''
+    label = change['path'] + (f' {change["key"]}' if change['key'] else '')
+
+    if change['action'] == 'added':
+        return f'+ {change["path"]} {describe(change["properties"])}'
+    if change['action'] == 'removed':
+        return f'- {change["path"]} {describe(change["properties"])}'
+
+    differences = ', '.join(f'{key}: {old} -> {new}' for key, (old, new) in change['changes'].items())
+    return f'~ {label}: {differences}'
+
+def summarize(changes):
+    '''
+    Returns a short count of the changes, like '2 added, 1 modified'.
+    '''
+    counts = {}
+    for change in changes:
+        counts[change['action']] = counts.get(change['action'], 0) + 1
+
+    return ', '.join(f'{counts[action]} {action}' for action in ('added', 'removed', 'modified') if action in counts)
+
+def git_versions(configs_dir, revision, file_names):
+    '''
+    Returns {file name: text at revision} for the files, read with one git cat-file process.
+    Files that didn't exist at the revision are ''.
+    '''
+    request = ''.join(f'{revision}:{file_name}\n' for file_name in file_names)
+    output = subprocess.run(['git', 'cat-file', '--batch'], cwd=configs_dir, input=request.encode(), capture_output=True, check=True).stdout
+
+    versions = {}
+    position = 0
+    for file_name in file_names:
+        header_end = output.index(b'\n', position)
+        header = output[position:header_end].split()
+        position = header_end + 1
+        if header[-1] == b'missing':
+            versions[file_name] = ''
+            continue
+
+        size = int(header[2])
+        versions[file_name] = output[position:position + size].decode(errors='replace')
+        position += size + 1
+
+    return versions
+
+def diff_since(revision, configs_dir=CONFIGS_DIR):
+    '''
+    Returns {host name: changes} of the exports in configs_dir that changed since the git revision.
+    '''
+    configs_dir = os.path.expanduser(configs_dir)
+    changed_files = subprocess.run(
+        ['git', 'diff', '--name-only', revision, '--', '*.rsc'],
+        cwd=configs_dir, capture_output=True, text=True, check=True,
+    ).stdout.split()
+
+    old_versions = git_versions(configs_dir, revision, changed_files)
+    host_changes = {}
+    for file_name in changed_files:
+        try:
+            with open(os.path.join(configs_dir, file_name), 'r') as f:
+                new_text = f.read()
+        except FileNotFoundError:
+            new_text = ''
+
+        host_changes[os.path.basename(file_name)[:-4]] = diff_exports(old_versions[file_name], new_text)
+
+    return host_changes
+
+def main():
+    started = time.perf_counter()
+
+    if len(sys.argv) == 3 and sys.argv[1] == '--since':
+        host_changes = diff_since(sys.argv[2])
+        for host_name, changes in sorted(host_changes.items()):
+            if changes:
+                print(f'{host_name}: {summarize(changes)}')
+                for change in changes:
+                    print(f'    {format_change(change)}')
+
+        changed = sum(1 for changes in host_changes.values() if changes)
+        print(f'== {changed} hosts changed, {len(host_changes) - changed} only in volatile lines, in {time.perf_counter() - started:.2f}s')
+
+    elif len(sys.argv) == 3:
+        with open(sys.argv[1], 'r') as f:
+            old_text = f.read()
+        with open(sys.argv[2], 'r') as f:
+            new_text = f.read()
+
+        for change in diff_exports(old_text, new_text):
+            print(format_change(change))
+
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/python3
+"""
+Search index over the stored config exports (CONFIGS_DIR/<host>.rsc).
+
+The index maps every word of the exports (lowercased, key=value split into the value and
+its comma separated parts) to the hosts whose export contains it, and every IPv4 address
+and prefix to the hosts that reference it.  It is saved to CONFIG_INDEX_PATH and updated
+incrementally: run_get_config passes the hosts whose config it committed, and
+'update' without host names re-reads the exports whose size or modification time changed.
+
+Queries are words ANDed together, each one of:
+
+    accept              hosts with the word
+    *fire*              hosts with a word containing the text
+    dst-port=*          hosts with a word starting with the text
+    within:10.20.0.0/16 hosts with an address or prefix inside the network
+    contains:10.20.1.5  hosts with a prefix covering the address or network
+
+Usage: nr_config_index.py update [hostname ...]
+       nr_config_index.py search <query> ... [--lines]
+"""
+
+import bisect
+import ipaddress
+import json
+import os
+import re
+import sys
+import time
+import config
+
+# Directory of the stored <host>.rsc exports
+CONFIGS_DIR = getattr(config, 'CONFIGS_DIR', 'configs')
+
+# The index file
+CONFIG_INDEX_PATH = getattr(config, 'CONFIG_INDEX_PATH', '~/.cache/nornir-mikrotik/config-index.json')
+
+# Words are separated by whitespace, quotes and brackets
+WORD_PATTERN = re.compile(r'[^\s"\[\]\\{}]+')
+
+# IPv4 addresses, with an optional prefix length
+IP_PATTERN = re.compile(r'(?<![\d.])(\d{1,3}(?:\.\d{1,3}){3})(?:/(\d{1,2}))?(?![\d.])')
+
+def export_terms(text):
+    '''
+    Returns (words, networks) of an export: its set of lowercase words, and the set of
+    IPv4 addresses and prefixes it references, as written (10.20.1.5/24, 10.0.0.1).
+    '''
+    # Join lines continued with a trailing backslash, which can break a word
+    text = re.sub(r'\\\n\s*', '', text).lower()
+
+    # Exports repeat most words, so only the distinct ones are split and searched for addresses
+    words = set(WORD_PATTERN.findall(text))
+    for word in [word for word in words if '=' in word]:
+        value = word.partition('=')[2]
+        if value:
+            words.add(value)
+            if ',' in value:
+                words.update(part for part in value.split(',') if part)
+
+    networks = set()
+    for address, length in set(IP_PATTERN.findall('\n'.join(word for word in words if '.' in word))):
+        try:
+            networks.add(str(ipaddress.IPv4Interface(f'{address}/{length}' if length else address)))
+        except ValueError:
+            continue
+
+    return words, networks
+
+class ConfigIndex:
+    '''
+    Inverted index of the stored exports.  Hosts are numbered, and each word or network
+    maps to a bitmap (an int with bit n set for host n) of the hosts whose export has it,
+    so most words, which are in most exports, take a few hundred bytes for the fleet.
+    '''
+    def __init__(self, configs_dir=CONFIGS_DIR, index_path=CONFIG_INDEX_PATH):
+        self.configs_dir = os.path.expanduser(configs_dir)
+        self.index_path = os.path.expanduser(index_path)
+        self.hosts = []
+        self.host_ids = {}
+        self.files = {}
+        self.words = {}
+        self.networks = {}
+        self.loaded = self.load()
+
+    def load(self):
+        '''
+        Reads the saved index.  Returns False if there is none for configs_dir.
+        '''
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        # An index built from another directory starts over
+        if index.get('configs_dir') != self.configs_dir:
+            return False
+
+        self.hosts = index['hosts']
+        self.host_ids = {name: host_id for host_id, name in enumerate(self.hosts) if name is not None}
+        self.files = index['files']
+        self.words = {word: int(bitmap, 16) for word, bitmap in index['words'].items()}
+        self.networks = {network: int(bitmap, 16) for network, bitmap in index['networks'].items()}
+        self.reset_lookups()
+        return True
+
+    def save(self):
+        index = {
+            'configs_dir': self.configs_dir,
+            'hosts': self.hosts,
+            'files': self.files,
+            'words': {word: format(bitmap, 'x') for word, bitmap in self.words.items()},
+            'networks': {network: format(bitmap, 'x') for network, bitmap in self.networks.items()},
+        }
+
+        # Write to a temporary file and rename it, so a crash never leaves a half written file
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    def reset_lookups(self):
+        # Built on the first query that needs them
+        self.sorted_words = None
+        self.network_ranges = None
+        self.network_masks = None
+
+    def stale_hosts(self):
+        '''
+        Returns the names of the hosts whose export was added, changed or removed since it was indexed.
+        '''
+        current = {}
+        for file_name in os.listdir(self.configs_dir):
+            if file_name.endswith('.rsc'):
+                stat = os.stat(os.path.join(self.configs_dir, file_name))
+                current[file_name[:-4]] = [stat.st_mtime, stat.st_size]
+
+        return {name for name in current.keys() | self.files.keys() if current.get(name) != self.files.get(name)}
+
+    def update(self, host_names=None):
+        '''
+        Indexes the exports of the given hosts again, or of the stale hosts if host_names is None.
+        Hosts without an export are removed from the index.  Returns the number of hosts updated.
+        '''
+        host_names = self.stale_hosts() if host_names is None else set(host_names)
+        if not host_names:
+            return 0
+
+        # Remove the old entries of the hosts, in one pass over the index
+        old_bits = sum(1 << self.host_ids[name] for name in host_names if name in self.host_ids)
+        if old_bits:
+            for postings in (self.words, self.networks):
+                for term, bitmap in list(postings.items()):
+                    bitmap &= ~old_bits
+                    if bitmap:
+                        postings[term] = bitmap
+                    else:
+                        del postings[term]
+
+        for name in host_names:
+            path = os.path.join(self.configs_dir, f'{name}.rsc')
+            try:
+                with open(path, 'r') as f:
+                    words, networks = export_terms(f.read())
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if name in self.host_ids:
+                    self.hosts[self.host_ids.pop(name)] = None
+                self.files.pop(name, None)
+                continue
+
+            if name not in self.host_ids:
+                self.host_ids[name] = len(self.hosts)
+                self.hosts.append(name)
+            bit = 1 << self.host_ids[name]
+            self.files[name] = [stat.st_mtime, stat.st_size]
+
+            for word in words:
+                self.words[word] = self.words.get(word, 0) | bit
+            for network in networks:
+                self.networks[network] = self.networks.get(network, 0) | bit
+
+        self.reset_lookups()
+        return len(host_names)
+
+    def names(self, bitmap):
+        # The set bits of the bitmap, lowest host number first
+        bits = bin(bitmap)[:1:-1]
+        return {self.hosts[host_id] for host_id, bit in enumerate(bits) if bit == '1'}
+
+    def word(self, word):
+        '''
+        Returns the bitmap of the hosts whose export has the word.
+        '''
+        return self.words.get(word.lower(), 0)
+
+    def substring(self, text):
+        '''
+        Returns the bitmap of the hosts whose export has a word containing the text.
+        '''
+        text = text.lower()
+        bitmap = 0
+        for word, word_bitmap in self.words.items():
+            if text in word:
+                bitmap |= word_bitmap
+
+        return bitmap
+
+    def prefix(self, text):
+        '''
+        Returns the bitmap of the hosts whose export has a word starting with the text.
+        '''
+        if self.sorted_words is None:
+            self.sorted_words = sorted(self.words)
+
+        text = text.lower()
+        bitmap = 0
+        for position in range(bisect.bisect_left(self.sorted_words, text), len(self.sorted_words)):
+            word = self.sorted_words[position]
+            if not word.startswith(text):
+                break
+            bitmap |= self.words[word]
+
+        return bitmap
+
+    def build_network_lookups(self):
+        # (address, prefix length, network) sorted by address, and {(prefix length, network address): [networks]}
+        self.network_ranges = []
+        self.network_masks = {}
+        for network in self.networks:
+            interface = ipaddress.IPv4Interface(network)
+            self.network_ranges.append((int(interface.ip), interface.network.prefixlen, network))
+            key = (interface.network.prefixlen, int(interface.network.network_address))
+            self.network_masks.setdefault(key, []).append(network)
+
+        self.network_ranges.sort()
+
+    def within(self, network):
+        '''
+        Returns the bitmap of the hosts referencing an address or prefix inside the network.
+        '''
+        if self.network_ranges is None:
+            self.build_network_lookups()
+
+        network = ipaddress.IPv4Network(network, strict=False)
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+
+        bitmap = 0
+        position = bisect.bisect_left(self.network_ranges, (first,))
+        while position < len(self.network_ranges) and self.network_ranges[position][0] <= last:
+            address, prefix_length, indexed = self.network_ranges[position]
+            if prefix_length >= network.prefixlen:
+                bitmap |= self.networks[indexed]
+            position += 1
+
+        return bitmap
+
+    def contains(self, network):
+        '''
+        Returns the bitmap of the hosts referencing a prefix that covers the address or network.
+        '''
+        if self.network_masks is None:
+            self.build_network_lookups()
+
+        network = ipaddress.IPv4Network(network, strict=False)
+        address = int(network.network_address)
+
+        # Look up the covering network of every prefix length up to the queried one
+        bitmap = 0
+        for prefix_length in range(network.prefixlen + 1):
+            mask = (0xffffffff << (32 - prefix_length)) & 0xffffffff
+            for indexed in self.network_masks.get((prefix_length, address & mask), []):
+                bitmap |= self.networks[indexed]
+
+        return bitmap
+
+    def term(self, term):
+        '''
+        Returns the bitmap of the hosts matching one query term.
+        '''
+        if term.startswith('within:'):
+            return self.within(term[len('within:'):])
+        if term.startswith('contains:'):
+            return self.contains(term[len('contains:'):])
+        if len(term) > 2 and term.startswith('*') and term.endswith('*'):
+            return self.substring(term[1:-1])
+        if len(term) > 1 and term.endswith('*'):
+            return self.prefix(term[:-1])
+
+        return self.word(term)
+
+    def search(self, terms):
+        '''
+        Returns the sorted names of the hosts matching every query term.
+        '''
+        bitmap = None
+        for term in terms:
+            bitmap = self.term(term) if bitmap is None else bitmap & self.term(term)
+            if not bitmap:
+                break
+
+        return sorted(self.names(bitmap or 0))
+
+def matching_lines(path, terms):
+    '''
+    Returns the lines of an export that have any of the plain word terms.  Used to show
+    where the hosts found by the index match.
+    '''
+    texts = [
+        term.strip('*').lower() for term in terms
+        if not term.startswith(('within:', 'contains:'))
+    ]
+
+    with open(path, 'r') as f:
+        text = re.sub(r'\\\n\s*', '', f.read())
+
+    return [line for line in text.splitlines() if any(t in line.lower() for t in texts)]
+
+def update_config_index(host_names=None, configs_dir=CONFIGS_DIR):
+    '''
+    Updates the index for the given hosts (or the stale ones) and saves it.  Without a saved
+    index, every stored export is indexed, so searches never see only the given hosts.
+    '''
+    index = ConfigIndex(configs_dir)
+    if not index.loaded:
+        host_names = None
+    if index.update(host_names):
+        index.save()
+
+    return index
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == 'update':
+        started = time.perf_counter()
+        index = ConfigIndex()
+        updated = index.update(sys.argv[2:] if index.loaded and sys.argv[2:] else None)
+        if updated:
+            index.save()
+        print(f'updated {updated} hosts, {len(index.host_ids)} indexed, in {time.perf_counter() - started:.2f}s')
+
+    elif command == 'search':
+        terms = [arg for arg in sys.argv[2:] if arg != '--lines']
+        index = ConfigIndex()
+
+        started = time.perf_counter()
+        hosts = index.search(terms)
+        took = time.perf_counter() - started
+
+        for host_name in hosts:
+            print(host_name)
+            if '--lines' in sys.argv[2:]:
+                for line in matching_lines(os.path.join(index.configs_dir, f'{host_name}.rsc'), terms):
+                    print(f'    {line}')
+        print(f'== {len(hosts)} of {len(index.host_ids)} hosts match, in {took * 1000:.1f}ms')
+
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
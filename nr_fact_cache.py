@@ -0,0 +1,175 @@
+"""
+Persistent on-disk cache of slow-changing host facts (routeros version, hardware, serial, ...).
+
+Facts are stored per host as JSON in FACT_CACHE_DIR, each with the time it was fetched.
+A fact is only fetched from the device again when its entry is missing or older than its TTL.
+"""
+
+import json
+import os
+import time
+import config
+from nornir.core.task import Task, Result
+from nr_routeros_general import *
+from nr_host_records import compact, json_default
+
+# Directory holding one <host>.json file per host
+FACT_CACHE_DIR = getattr(config, 'FACT_CACHE_DIR', '~/.cache/nornir-mikrotik/facts')
+
+# Time to live of each fact in seconds.  A TTL of 0 disables caching for that fact.
+FACT_TTLS = {
+    'ros_version': 24 * 3600,
+    'ros_major_version': 24 * 3600,
+    'hardware': 7 * 24 * 3600,
+    'serial': 30 * 24 * 3600,
+    'interfaces': 0,
+    'ip_addresses': 0,
+}
+FACT_TTLS.update(getattr(config, 'FACT_TTLS', {}))
+
+# The task that fetches each fact from the device (and sets it in host.data)
+FACT_TASKS = {
+    'ros_version': get_ros_version,
+    'ros_major_version': get_ros_version,
+    'hardware': get_hardware,
+    'serial': get_serial,
+    'interfaces': get_interfaces,
+    'ip_addresses': get_ip_addresses,
+}
+
+class FactCache:
+    '''
+    Reads and writes cached facts for hosts.  Each host has its own file, so hosts running
+    in different Nornir worker threads never write the same file.
+    '''
+    def __init__(self, cache_dir=FACT_CACHE_DIR, ttls=None):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttls = ttls if ttls is not None else FACT_TTLS
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, host_name):
+        return os.path.join(self.cache_dir, f'{host_name}.json')
+
+    def load(self, host_name):
+        '''
+        Returns all cached entries for a host as {fact: {'value': ..., 'fetched': timestamp}}.
+        '''
+        try:
+            with open(self.path(host_name), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, host_name, fact):
+        '''
+        Returns the cached value of a fact.  Raises KeyError if it is missing, stale, or not cacheable.
+        '''
+        ttl = self.ttls.get(fact, 0)
+        entries = self.load(host_name)
+        entry = entries.get(fact)
+
+        if not ttl or entry is None or time.time() - entry['fetched'] > ttl:
+            raise KeyError(fact)
+
+        # A value fetched before a scheduled change (an upgrade reboot) is stale once the change is due
+        expires = entries.get('_expires', {}).get(fact)
+        if expires is not None and entry['fetched'] < expires <= time.time():
+            raise KeyError(fact)
+
+        return entry['value']
+
+    def set(self, host_name, facts):
+        '''
+        Stores the given {fact: value} dictionary for a host.  Facts with a TTL of 0 are not stored.
+        '''
+        entries = self.load(host_name)
+        now = time.time()
+
+        for fact, value in facts.items():
+            if self.ttls.get(fact, 0):
+                entries[fact] = {'value': value, 'fetched': now}
+
+        self.write(host_name, entries)
+
+    def write(self, host_name, entries):
+        # Write to a temporary file and rename it, so a crash never leaves a half written file
+        tmp_path = self.path(host_name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, default=json_default)
+        os.replace(tmp_path, self.path(host_name))
+
+    def invalidate(self, host_name, facts=None, at=None):
+        '''
+        Removes all cached facts for a host, or only the given facts.  If at (a timestamp) is
+        given, values of the facts fetched from now on are also stale once at has passed, for
+        facts that will change then, like the version after a scheduled upgrade reboot.
+        '''
+        if facts is None:
+            try:
+                os.remove(self.path(host_name))
+            except FileNotFoundError:
+                pass
+            return
+
+        entries = self.load(host_name)
+        for fact in facts:
+            entries.pop(fact, None)
+            if at is not None:
+                entries.setdefault('_expires', {})[fact] = at
+
+        self.write(host_name, entries)
+
+def get_cached_facts(task: Task, facts, cache=None, refresh=False) -> Result:
+    '''
+    Sets the given facts in the host's data, reading them from the fact cache when possible.
+    Facts that are missing or stale are fetched from the device and written back to the cache.
+    Set refresh to True to ignore the cache and always fetch from the device.
+    '''
+    cache = cache or FactCache()
+    missing = []
+
+    # Use fresh cached facts, and note which ones have to be fetched
+    for fact in facts:
+        try:
+            if refresh:
+                raise KeyError(fact)
+            task.host.data[fact] = compact(fact, cache.get(task.host.name, fact))
+        except KeyError:
+            missing.append(fact)
+
+    # Run each fetching task only once, even if it provides several missing facts
+    fetch_tasks = []
+    for fact in missing:
+        if FACT_TASKS[fact] not in fetch_tasks:
+            fetch_tasks.append(FACT_TASKS[fact])
+
+    for fetch_task in fetch_tasks:
+        task.run(
+            task=fetch_task,
+        )
+
+    # Save the freshly fetched facts
+    if missing:
+        cache.set(task.host.name, {fact: task.host.data[fact] for fact in missing})
+
+    return Result(
+        host=task.host,
+        result={fact: task.host.data[fact] for fact in facts},
+    )
+
+def get_cached_ros_version(task: Task, cache=None, refresh=False) -> Result:
+    '''
+    Returns the version of the routeros software running on the device, using the fact cache.
+    Sets ros_version and ros_major_version in the host's data like get_ros_version.
+    '''
+    task.run(
+        task=get_cached_facts,
+        facts=['ros_version', 'ros_major_version'],
+        cache=cache,
+        refresh=refresh,
+    )
+
+    return Result(
+        host=task.host,
+        result=task.host.data['ros_version'],
+    )
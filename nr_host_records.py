@@ -0,0 +1,135 @@
+"""
+Compact records for the per-host lists kept in host.data for a whole run: interfaces, IP
+addresses and IP neighbors.
+
+A record only holds the RouterOS properties its class lists, in __slots__ instead of a
+per-item dictionary, and values that repeat across items and hosts (types, MAC addresses,
+yes/no flags, default interface names) are interned so all hosts share one copy.  Records
+support the dictionary operations the tasks use (record['mac-address'], get, keys, in,
+items, assignment), so code written for the dictionaries routeros_read returns works
+unchanged.  Properties the router didn't send are missing, as they are in the dictionary.
+
+release_host_data() drops large per-host payloads once the last stage that reads them is done.
+"""
+
+import sys
+
+class HostRecord:
+    '''
+    Base class of the records.  Subclasses set __slots__ to the RouterOS property names with
+    dashes replaced by underscores, and INTERNED to the properties whose values repeat.
+    '''
+    __slots__ = ()
+    FIELDS = ()
+    INTERNED = frozenset()
+
+    def __init__(self, item):
+        for field in self.FIELDS:
+            if field in item:
+                self[field] = item[field]
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field.replace('-', '_'))
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        if field in self.INTERNED and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, field.replace('-', '_'), value)
+
+    def __delitem__(self, field):
+        try:
+            delattr(self, field.replace('-', '_'))
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __contains__(self, field):
+        return field in self.FIELDS and hasattr(self, field.replace('-', '_'))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (HostRecord, dict)):
+            return self.as_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [field for field in self.FIELDS if field in self]
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def as_dict(self):
+        return dict(self.items())
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        for field, value in state.items():
+            self[field] = value
+
+class Interface(HostRecord):
+    __slots__ = ('name', 'type', 'default_name', 'mac_address', 'comment', 'disabled')
+    FIELDS = tuple(slot.replace('_', '-') for slot in __slots__)
+    INTERNED = frozenset({'name', 'type', 'default-name', 'mac-address', 'disabled'})
+
+class IpAddress(HostRecord):
+    __slots__ = ('address', 'network', 'interface', 'disabled', 'comment')
+    FIELDS = tuple(slot.replace('_', '-') for slot in __slots__)
+    INTERNED = frozenset({'interface', 'disabled'})
+
+class Neighbor(HostRecord):
+    __slots__ = ('mac_address', 'address', 'identity', 'platform', 'version', 'board', 'neighbor_of', 'interface')
+    FIELDS = tuple(slot.replace('_', '-') for slot in __slots__)
+    INTERNED = frozenset({'platform', 'version', 'board', 'neighbor-of', 'interface'})
+
+# The record class of each host.data list
+RECORD_TYPES = {
+    'interfaces': Interface,
+    'ip_addresses': IpAddress,
+}
+
+def compact(fact, items):
+    '''
+    Returns the items of a host.data list as records, if the fact has a record class.
+    '''
+    record_type = RECORD_TYPES.get(fact)
+    if record_type is None or items is None:
+        return items
+
+    return [item if isinstance(item, record_type) else record_type(item) for item in items]
+
+def json_default(value):
+    '''
+    json.dumps default= that writes records as objects, and anything else as its string.
+    '''
+    if isinstance(value, HostRecord):
+        return value.as_dict()
+    return str(value)
+
+def release_host_data(nr, keys):
+    '''
+    Removes the given keys from the data of every host in the inventory, so large payloads
+    don't stay in memory after the last stage that reads them.
+    '''
+    for host in nr.inventory.hosts.values():
+        for key in keys:
+            host.data.pop(key, None)
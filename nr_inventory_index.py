@@ -0,0 +1,173 @@
+"""
+Indexed views of the inventory.
+
+InventoryIndex derives each host's site and role from its name (hosts that set them in
+hosts.yaml keep theirs, and names without a role get none), and keeps a dictionary from
+each value to the set of host names, for the name, site, role, group and platform of the
+hosts.  inventory_index() builds it the first time an inventory is filtered and keeps it
+with the inventory's hosts, so later filters of the same inventory reuse it.  The routeros version is indexed from the fact cache the first time a selector
+uses it, so hosts whose version was never fetched don't match a version selector.
+
+Targets are a host name, 'all', or selectors: field=pattern words, ANDed together.
+Patterns are shell-style globs and a comma separates alternatives:
+
+    site=dal role=core version=6.*
+    site=dal,atl group=routeros_rest
+
+The scripts pass their first argument and the selector words after it as the target:
+
+    nr = filter_target(nr, command_line_target(), group='routeros')
+"""
+
+import fnmatch
+import sys
+
+# Fields that can be used in selectors
+SELECTOR_FIELDS = ('name', 'site', 'role', 'group', 'platform', 'version')
+
+def site_from_name(name):
+    '''
+    Returns the site of a host from its name: everything preceding the first dash.
+    '''
+    return name.split('-')[0]
+
+def role_from_name(name):
+    '''
+    Returns the role of a host from its name: the part after the first dash, without the
+    trailing host index (site1-core2 is core).  Returns None if the name has no role.
+    '''
+    parts = name.split('-')
+    if len(parts) < 2:
+        return None
+
+    return parts[1].rstrip('0123456789')
+
+def parse_selectors(target):
+    '''
+    Returns [(field, [patterns])] of a target made of field=pattern words.
+    '''
+    selectors = []
+    for word in target.split():
+        field, separator, patterns = word.partition('=')
+        if not separator or field not in SELECTOR_FIELDS:
+            raise ValueError(f'invalid selector {word!r}, use field=pattern with field one of {", ".join(SELECTOR_FIELDS)}')
+        selectors.append((field, patterns.split(',')))
+
+    return selectors
+
+class InventoryIndex:
+    '''
+    Hash indexes of an inventory's hosts by name, site, role, group, platform and version.
+    '''
+    def __init__(self, inventory, cache=None):
+        self.inventory = inventory
+        self.cache = cache
+        self.indexes = {field: {} for field in SELECTOR_FIELDS if field != 'version'}
+
+        for name, host in inventory.hosts.items():
+            # Derived fields are computed once, and kept in host.data for the tasks.
+            # A name without a role leaves it unset, for get_role to report.
+            if 'site' not in host.data:
+                host.data['site'] = site_from_name(name)
+            if 'role' not in host.data and role_from_name(name) is not None:
+                host.data['role'] = role_from_name(name)
+
+            self.add('name', name, name)
+            self.add('site', host.data['site'], name)
+            self.add('role', host.data['role'] if 'role' in host.data else None, name)
+            self.add('platform', host.platform, name)
+            for group in host.groups:
+                self.add('group', group.name, name)
+
+    def add(self, field, value, name):
+        if value is not None:
+            self.indexes[field].setdefault(str(value), set()).add(name)
+
+    def index(self, field):
+        '''
+        Returns {value: set of host names} of a field.
+        '''
+        if field == 'version' and field not in self.indexes:
+            self.indexes['version'] = {}
+
+            # The last fetched version of each host, however old, is good enough to select hosts
+            from nr_fact_cache import FactCache
+            cache = self.cache or FactCache()
+            for name in self.inventory.hosts:
+                entry = cache.load(name).get('ros_version')
+                if entry is not None:
+                    self.add('version', entry['value'], name)
+
+        return self.indexes[field]
+
+    def lookup(self, field, patterns):
+        '''
+        Returns the names of the hosts whose field matches any of the patterns.
+        '''
+        index = self.index(field)
+        names = set()
+        for pattern in patterns:
+            if any(character in pattern for character in '*?['):
+                for value, value_names in index.items():
+                    if fnmatch.fnmatchcase(value, pattern):
+                        names |= value_names
+            else:
+                names |= index.get(pattern, set())
+
+        return names
+
+    def select(self, target):
+        '''
+        Returns the names of the hosts matching a target: 'all', a host name, or selectors.
+        '''
+        if target == 'all':
+            return set(self.inventory.hosts)
+        if target is None:
+            return set()
+        if '=' not in target:
+            return self.lookup('name', [target])
+
+        names = None
+        for field, patterns in parse_selectors(target):
+            matched = self.lookup(field, patterns)
+            names = matched if names is None else names & matched
+            if not names:
+                break
+
+        return names
+
+def inventory_index(inventory):
+    '''
+    Returns the InventoryIndex of an inventory.  It is built on the first call and kept on
+    the inventory's Hosts dictionary (the Inventory itself has __slots__) for later calls.
+    '''
+    index = getattr(inventory.hosts, 'index', None)
+    if index is None:
+        index = inventory.hosts.index = InventoryIndex(inventory)
+
+    return index
+
+def command_line_target(argv=None):
+    '''
+    Returns the target passed on the command line: the first argument, with the selector
+    words (field=pattern) that follow it, so selectors can be passed as separate words.
+    '''
+    argv = sys.argv if argv is None else argv
+    if len(argv) < 2 or argv[1].startswith('--'):
+        return None
+
+    return ' '.join([argv[1]] + [arg for arg in argv[2:] if '=' in arg and not arg.startswith('--')])
+
+def filter_target(nr, target, group='routeros'):
+    '''
+    Filters the inventory based on the target passed on the command line.
+    If target is 'all', all hosts in the group are kept.  Otherwise, target is a hostname or
+    selectors like 'site=dal role=core version=6.*', resolved through the indexes of the
+    inventory instead of a scan per selector.
+    '''
+    index = inventory_index(nr.inventory)
+    names = index.select(target) & index.lookup('group', [group])
+
+    if target != 'all':
+        print(f'filtered inventory to {target}: {len(names)} hosts')
+    return nr.filter(filter_func=lambda host: host.name in names)
@@ -0,0 +1,88 @@
+"""
+Lazy host facts.  After install_lazy_facts(nr), reading a fact such as
+task.host.data['ros_major_version'] runs the matching get_* task the first time
+it is read, and keeps the value in host.data for every later read.
+Workflows only pay for the facts they actually use.
+
+The fetch runs with the processors of the run, except those with a false
+lazy_facts attribute (processors that report the stages of the run set it).
+"""
+
+from nornir.core.exceptions import NornirSubTaskError
+from nornir.core.processor import Processors
+from nornir.core.task import Task
+from nr_routeros_general import *
+from nr_host_records import compact
+
+# The task that sets each lazy fact in host.data
+LAZY_FACT_TASKS = {
+    'ros_version': get_ros_version,
+    'ros_major_version': get_ros_version,
+    'hardware': get_hardware,
+    'serial': get_serial,
+    'interfaces': get_interfaces,
+    'ip_addresses': get_ip_addresses,
+    'vlans': get_vlans,
+    'site': get_site,
+    'role': get_role,
+}
+
+class LazyHostData(dict):
+    '''
+    A host.data dictionary that fetches missing facts from the device on first access.
+    If a FactCache is given, fresh cached facts are used before contacting the device.
+    '''
+    def __init__(self, host, nornir, data, cache=None):
+        super().__init__(data)
+        self.host = host
+        self.nornir = nornir
+        self.cache = cache
+
+    def __missing__(self, key):
+        if key not in LAZY_FACT_TASKS:
+            raise KeyError(key)
+
+        # Use the fact cache if the fact is fresh there, as the same records get_cached_facts returns
+        if self.cache is not None:
+            try:
+                self[key] = compact(key, self.cache.get(self.host.name, key))
+                return dict.__getitem__(self, key)
+            except KeyError:
+                pass
+
+        # Run the fact task for this host.  It sets the fact (and any related facts) in host.data.
+        # The fetch isn't a stage of the run, it belongs to the task reading the fact, so
+        # processors that opted out with lazy_facts = False don't see it.
+        task = Task(
+            LAZY_FACT_TASKS[key],
+            nornir=self.nornir,
+            global_dry_run=self.nornir.data.dry_run,
+            processors=Processors([processor for processor in self.nornir.processors if getattr(processor, 'lazy_facts', True)]),
+        )
+        result = task.start(self.host)
+
+        # Fail the reading task like a failed sub-task, so the failure is only counted once (at the fetch)
+        if result.failed:
+            raise NornirSubTaskError(task=task, result=result)
+
+        if self.cache is not None:
+            self.cache.set(self.host.name, {key: dict.__getitem__(self, key)})
+
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def install_lazy_facts(nr, cache=None):
+    '''
+    Replaces the data dictionary of every host in the inventory with a LazyHostData.
+    Facts already present in host.data are kept as they are.
+    '''
+    for host in nr.inventory.hosts.values():
+        if not isinstance(host.data, LazyHostData):
+            host.data = LazyHostData(host, nr, host.data, cache=cache)
+
+    return nr
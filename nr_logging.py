@@ -0,0 +1,100 @@
+"""
+Logging for the scripts, kept off the hot path of the worker threads.
+
+setup_logging() replaces logging.basicConfig().  Worker threads only put log records on a
+queue; one background thread formats them and writes them to LOG_DIR/<name>.log, which is
+rotated when it reaches LOG_MAX_BYTES.  Each line is a JSON object with the time, level,
+logger, thread, host and message of the record, plus any other extra fields.
+
+Log with %-style arguments instead of f-strings, so a message is only built when its
+level is enabled, and in the background thread.  Pass the host a record is about as
+extra={'host': ...}:
+
+    setup_logging('nr_pull_to_nautobot')
+    logging.debug('Creating interface %s', name, extra={'host': task.host.name})
+
+The arguments are formatted after the call returns, so don't pass objects that the task
+changes afterwards.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import config
+
+# Directory for the log files
+LOG_DIR = getattr(config, 'LOG_DIR', 'logs')
+
+# Records below this level are dropped before they are built
+LOG_LEVEL = getattr(config, 'LOG_LEVEL', 'INFO')
+
+# Size at which a log file is rotated, and the number of rotated files kept
+LOG_MAX_BYTES = getattr(config, 'LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = getattr(config, 'LOG_BACKUP_COUNT', 5)
+
+# Attributes every LogRecord has; anything else was passed as extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats a record as one JSON object.
+    '''
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'host': getattr(record, 'host', None),
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    '''
+    Puts records on the queue as they are.  QueueHandler would format them first, in the
+    logging thread; the listener is in the same process and formats them itself.
+    '''
+    def prepare(self, record):
+        return record
+
+def setup_logging(name, level=None, log_dir=LOG_DIR):
+    '''
+    Sends the records of every logger to LOG_DIR/<name>.log through a background writer.
+    Like logging.basicConfig(), does nothing if the root logger already has handlers.
+    '''
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    log_dir = os.path.expanduser(log_dir)
+    os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, f'{name}.log'),
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8',
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    # Unbounded, so logging never blocks a task
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+
+    # Write out the queued records when the script exits
+    atexit.register(listener.stop)
+
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level or LOG_LEVEL)
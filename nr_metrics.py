@@ -0,0 +1,330 @@
+"""
+Run instrumentation.  TimingProcessor is a Nornir processor that records the wall time of
+every task and sub-task per host (for example get_mikrotik_info/get_facts_batched), and
+aggregates percentiles per task.  Timings are exported as a Prometheus textfile (for the
+node_exporter textfile collector) and as OTLP-compatible JSON spans.
+
+TRANSPORT_METRICS counts requests, bytes, round trip times, connections and authentication
+failures per host and transport.  The transports record into it themselves.
+
+    timing = TimingProcessor()
+    nr = nr.with_processors([timing])
+    ...
+    write_metrics(timing, 'nr_routeros_baseline')
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+import config
+
+# Directory for the .prom textfiles and .spans.json files
+METRICS_DIR = getattr(config, 'METRICS_DIR', 'metrics')
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+def percentile(values, quantile):
+    '''
+    Returns the quantile of a list of values (nearest rank).
+    '''
+    ordered = sorted(values)
+    index = min(int(quantile * len(ordered)), len(ordered) - 1)
+    return ordered[index]
+
+def prometheus_labels(labels):
+    '''
+    Formats a {label: value} dictionary as Prometheus labels, escaping backslashes and quotes.
+    '''
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        pairs.append(f'{key}="{value}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+def write_atomic(path, text):
+    '''
+    Writes a file through a temporary file, so readers never see a partial file.
+    '''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class TimingProcessor:
+    '''
+    Nornir processor recording task and sub-task wall times per host as spans.
+    '''
+    def __init__(self, service_name='nornir-mikrotik'):
+        self.service_name = service_name
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.stacks = {}
+        self.lock = threading.Lock()
+
+    def start_span(self, task, host):
+        stack = self.stacks.setdefault(host.name, [])
+        parent = stack[-1] if stack else None
+
+        span = {
+            'name': task.name,
+            'path': f'{parent["path"]}/{task.name}' if parent else task.name,
+            'host': host.name,
+            'span_id': secrets.token_hex(8),
+            'parent_id': parent['span_id'] if parent else '',
+            'start': time.time_ns(),
+            'start_monotonic': time.perf_counter(),
+        }
+        stack.append(span)
+
+    def end_span(self, host, result):
+        span = self.stacks[host.name].pop()
+        span['duration'] = time.perf_counter() - span.pop('start_monotonic')
+        span['end'] = span['start'] + int(span['duration'] * 1e9)
+        span['failed'] = bool(result[0].failed)
+
+        with self.lock:
+            self.spans.append(span)
+
+    def task_started(self, task):
+        pass
+
+    def task_completed(self, task, result):
+        pass
+
+    def task_instance_started(self, task, host):
+        with self.lock:
+            self.start_span(task, host)
+
+    def task_instance_completed(self, task, host, result):
+        self.end_span(host, result)
+
+    def subtask_instance_started(self, task, host):
+        with self.lock:
+            self.start_span(task, host)
+
+    def subtask_instance_completed(self, task, host, result):
+        self.end_span(host, result)
+
+    def durations_by_task(self):
+        '''
+        Returns {task path: [durations]} over all hosts.
+        '''
+        durations = {}
+        with self.lock:
+            for span in self.spans:
+                durations.setdefault(span['path'], []).append(span['duration'])
+
+        return durations
+
+    def durations_by_host(self):
+        '''
+        Returns {host: total seconds spent in top level tasks}.
+        '''
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                if not span['parent_id']:
+                    totals[span['host']] = totals.get(span['host'], 0) + span['duration']
+
+        return totals
+
+    def summary(self):
+        '''
+        Returns {task path: {'count', 'sum', 'max', 'p50', 'p90', 'p99'}}.
+        '''
+        summary = {}
+        for path, durations in self.durations_by_task().items():
+            stats = {'count': len(durations), 'sum': sum(durations), 'max': max(durations)}
+            for quantile in QUANTILES:
+                stats[f'p{int(quantile * 100)}'] = percentile(durations, quantile)
+            summary[path] = stats
+
+        return summary
+
+    def to_prometheus(self, job):
+        '''
+        Returns the timings in the Prometheus text exposition format.
+        '''
+        lines = [
+            '# HELP nornir_task_duration_seconds Wall time of a task or sub-task per host.',
+            '# TYPE nornir_task_duration_seconds summary',
+        ]
+        for path, stats in sorted(self.summary().items()):
+            for quantile in QUANTILES:
+                labels = prometheus_labels({'job_name': job, 'task': path, 'quantile': quantile})
+                lines.append(f'nornir_task_duration_seconds{labels} {stats[f"p{int(quantile * 100)}"]:.6f}')
+            labels = prometheus_labels({'job_name': job, 'task': path})
+            lines.append(f'nornir_task_duration_seconds_sum{labels} {stats["sum"]:.6f}')
+            lines.append(f'nornir_task_duration_seconds_count{labels} {stats["count"]}')
+
+        lines.append('# HELP nornir_host_duration_seconds Wall time of all top level tasks of a host.')
+        lines.append('# TYPE nornir_host_duration_seconds gauge')
+        for host, total in sorted(self.durations_by_host().items()):
+            lines.append(f'nornir_host_duration_seconds{prometheus_labels({"job_name": job, "host": host})} {total:.6f}')
+
+        return '\n'.join(lines) + '\n'
+
+    def to_otlp(self):
+        '''
+        Returns the spans as an OTLP/JSON ExportTraceServiceRequest dictionary.
+        '''
+        with self.lock:
+            spans = list(self.spans)
+
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span['span_id'],
+                'name': span['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(span['start']),
+                'endTimeUnixNano': str(span['end']),
+                'attributes': [
+                    {'key': 'host.name', 'value': {'stringValue': span['host']}},
+                    {'key': 'nornir.task.path', 'value': {'stringValue': span['path']}},
+                ],
+                'status': {'code': 2 if span['failed'] else 1},
+            }
+            if span['parent_id']:
+                otlp_span['parentSpanId'] = span['parent_id']
+            otlp_spans.append(otlp_span)
+
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'nr_metrics'}, 'spans': otlp_spans}],
+            }],
+        }
+
+
+# Upper bounds in seconds of the round trip time histogram buckets
+RTT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+
+TRANSPORT_COUNTERS = ['requests', 'bytes_sent', 'bytes_received', 'connections', 'auth_failures', 'errors']
+
+class TransportMetrics:
+    '''
+    Connection level counters per host and transport: requests, bytes sent and received,
+    connections, authentication failures, errors, and a round trip time histogram.
+    Transports are 'routeros_api', 'routeros_rest', 'ssh', 'nautobot_http' and 'swos_http'.
+    '''
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def entry(self, host, transport):
+        key = (host, transport)
+        if key not in self.counters:
+            self.counters[key] = dict.fromkeys(TRANSPORT_COUNTERS, 0)
+            self.counters[key].update({'rtt_buckets': [0] * len(RTT_BUCKETS), 'rtt_sum': 0.0})
+
+        return self.counters[key]
+
+    def record(self, host, transport, bytes_sent=0, bytes_received=0, rtt=None, requests=1, error=False):
+        '''
+        Records one or more requests on a transport.
+        '''
+        with self.lock:
+            entry = self.entry(host, transport)
+            entry['requests'] += requests
+            entry['bytes_sent'] += bytes_sent
+            entry['bytes_received'] += bytes_received
+            entry['errors'] += int(error)
+
+            if rtt is not None:
+                entry['rtt_sum'] += rtt
+                for index, bound in enumerate(RTT_BUCKETS):
+                    if rtt <= bound:
+                        entry['rtt_buckets'][index] += 1
+                        break
+
+    def connected(self, host, transport):
+        with self.lock:
+            self.entry(host, transport)['connections'] += 1
+
+    def auth_failure(self, host, transport):
+        with self.lock:
+            self.entry(host, transport)['auth_failures'] += 1
+
+    def snapshot(self):
+        '''
+        Returns a copy of all counters as {host: {transport: counters}}.  Reconnects are the
+        connections after the first one.
+        '''
+        snapshot = {}
+        with self.lock:
+            for (host, transport), entry in self.counters.items():
+                counters = dict(entry, rtt_buckets=list(entry['rtt_buckets']))
+                counters['reconnects'] = max(entry['connections'] - 1, 0)
+                snapshot.setdefault(host, {})[transport] = counters
+
+        return snapshot
+
+    def to_prometheus(self, job):
+        '''
+        Returns the counters in the Prometheus text exposition format.
+        '''
+        lines = []
+        snapshot = self.snapshot()
+
+        for counter in TRANSPORT_COUNTERS + ['reconnects']:
+            lines.append(f'# TYPE nornir_transport_{counter}_total counter')
+            for host, transports in sorted(snapshot.items()):
+                for transport, counters in sorted(transports.items()):
+                    labels = prometheus_labels({'job_name': job, 'host': host, 'transport': transport})
+                    lines.append(f'nornir_transport_{counter}_total{labels} {counters[counter]}')
+
+        lines.append('# TYPE nornir_transport_rtt_seconds histogram')
+        for host, transports in sorted(snapshot.items()):
+            for transport, counters in sorted(transports.items()):
+                labels = {'job_name': job, 'host': host, 'transport': transport}
+                cumulative = 0
+                for bound, count in zip(RTT_BUCKETS, counters['rtt_buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(f'nornir_transport_rtt_seconds_bucket{prometheus_labels(dict(labels, le=le))} {cumulative}')
+                lines.append(f'nornir_transport_rtt_seconds_sum{prometheus_labels(labels)} {counters["rtt_sum"]:.6f}')
+                lines.append(f'nornir_transport_rtt_seconds_count{prometheus_labels(labels)} {cumulative}')
+
+        return '\n'.join(lines) + '\n'
+
+# Counters shared by all transports of the process
+TRANSPORT_METRICS = TransportMetrics()
+
+def instrument_nautobot(nautobot):
+    '''
+    Counts every request made by a pynautobot api object in TRANSPORT_METRICS.
+    '''
+    def record_response(response, *args, **kwargs):
+        body = response.request.body or b''
+        TRANSPORT_METRICS.record(
+            'nautobot',
+            'nautobot_http',
+            bytes_sent=len(body),
+            bytes_received=len(response.content),
+            rtt=response.elapsed.total_seconds(),
+            error=response.status_code >= 400,
+        )
+        if response.status_code in (401, 403):
+            TRANSPORT_METRICS.auth_failure('nautobot', 'nautobot_http')
+
+    nautobot.http_session.hooks['response'].append(record_response)
+    return nautobot
+
+def write_metrics(timing, job, metrics_dir=METRICS_DIR, transport_metrics=TRANSPORT_METRICS):
+    '''
+    Writes task timings and transport counters to METRICS_DIR/<job>.prom, the transport counters to
+    METRICS_DIR/<job>.transport.json, and appends the run's spans to METRICS_DIR/<job>.spans.json (one run per line).
+    '''
+    metrics_dir = os.path.expanduser(metrics_dir)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    write_atomic(os.path.join(metrics_dir, f'{job}.prom'), timing.to_prometheus(job) + transport_metrics.to_prometheus(job))
+    write_atomic(os.path.join(metrics_dir, f'{job}.transport.json'), json.dumps(transport_metrics.snapshot(), indent=2))
+
+    with open(os.path.join(metrics_dir, f'{job}.spans.json'), 'a') as f:
+        f.write(json.dumps(timing.to_otlp()) + '\n')
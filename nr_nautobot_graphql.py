@@ -0,0 +1,150 @@
+"""
+Bulk reads from Nautobot through its GraphQL API.
+
+get_nb_devices() fetches devices together with their interfaces (with the default_name
+custom field) and the IP addresses assigned to them, for a list of device names or for a
+whole site, in one query per NB_GRAPHQL_BATCH devices.  The devices are returned as
+dictionaries shaped like the REST API's, so the sync stages can compare them with the
+gathered data and only write what differs:
+
+    nb_devices = get_nb_devices(nautobot, names=['site1-core1', 'site1-edge2'])
+    nb_devices = get_nb_devices(nautobot, site='site1')
+"""
+
+import re
+import config
+from pynautobot import api
+
+# Device names per GraphQL query
+NB_GRAPHQL_BATCH = getattr(config, 'NB_GRAPHQL_BATCH', 100)
+
+# %s is the device filter, name or site.  Nautobot 1.x filters devices by the site's slug.
+DEVICES_QUERY = '''
+query ($values: [String]) {
+  devices(%s: $values) {
+    id
+    name
+    serial
+    status { slug }
+    site { id name slug }
+    device_type { id model }
+    device_role { id name }
+    interfaces {
+      id
+      name
+      type
+      mac_address
+      description
+      status { slug }
+      cf_default_name
+      ip_addresses {
+        id
+        address
+        description
+        role
+        status { slug }
+      }
+    }
+  }
+}
+'''
+
+def graphql_choice(value):
+    '''
+    Returns the REST value of a choice field.  GraphQL returns choices as enum names
+    (A_1000BASE_T for 1000base-t, VIRTUAL for virtual).
+    '''
+    if not isinstance(value, str) or not re.fullmatch(r'[A-Z0-9_]+', value):
+        return value
+
+    value = value.lower()
+    if re.match(r'a_[0-9]', value):
+        value = value[2:]
+
+    return value.replace('_', '-')
+
+def graphql_status(status):
+    return status.get('slug') if isinstance(status, dict) else status
+
+def normalize_device(device):
+    '''
+    Reshapes a device from the GraphQL response like the REST API returns it.
+    '''
+    interfaces = []
+    for interface in device.get('interfaces') or []:
+        interfaces.append({
+            'id': interface['id'],
+            'name': interface['name'],
+            'type': graphql_choice(interface.get('type')),
+            'mac_address': interface.get('mac_address'),
+            'description': interface.get('description') or '',
+            'status': graphql_status(interface.get('status')),
+            'custom_fields': {'default_name': interface.get('cf_default_name')},
+            'ip_addresses': [
+                {
+                    'id': ip_address['id'],
+                    'address': ip_address['address'],
+                    'description': ip_address.get('description') or '',
+                    'role': graphql_choice(ip_address.get('role')),
+                    'status': graphql_status(ip_address.get('status')),
+                    'assigned_object_type': 'dcim.interface',
+                    'assigned_object_id': interface['id'],
+                }
+                for ip_address in interface.get('ip_addresses') or []
+            ],
+        })
+
+    return {
+        'id': device['id'],
+        'name': device['name'],
+        'serial': device.get('serial') or '',
+        'status': graphql_status(device.get('status')),
+        'site': device.get('site'),
+        'device_type': device.get('device_type'),
+        'device_role': device.get('device_role'),
+        'interfaces': interfaces,
+    }
+
+def query_devices(nautobot: api, field, values):
+    response = nautobot.graphql.query(query=DEVICES_QUERY % field, variables={'values': values})
+    if response.json.get('errors'):
+        raise ValueError(f'GraphQL query failed: {response.json["errors"]}')
+
+    return [normalize_device(device) for device in response.json['data']['devices']]
+
+def get_nb_devices(nautobot: api, names=None, site=None, batch=NB_GRAPHQL_BATCH):
+    '''
+    Returns {device name: device} for the named devices, or for every device of a site (by
+    its name).  Devices that don't exist in Nautobot are left out.
+    '''
+    if site is not None:
+        # The site filter takes slugs, which can differ from the name, so look the slug up
+        nb_site = nautobot.dcim.sites.get(name=site)
+        devices = query_devices(nautobot, 'site', [nb_site.slug]) if nb_site else []
+    else:
+        names = list(names or [])
+        devices = []
+        for start in range(0, len(names), batch):
+            devices.extend(query_devices(nautobot, 'name', names[start:start + batch]))
+
+    return {device['name']: device for device in devices}
+
+def nb_changes(current, wanted):
+    '''
+    Returns the items of wanted that differ from the current object.  Nested objects
+    ({'name': ...}) and custom fields only have to match on the given keys.
+    '''
+    changes = {}
+    for key, value in wanted.items():
+        actual = current.get(key)
+
+        if isinstance(value, dict):
+            if not isinstance(actual, dict) or any(actual.get(k) != v for k, v in value.items()):
+                changes[key] = value
+        elif key == 'mac_address':
+            if str(actual or '').lower() != str(value or '').lower():
+                changes[key] = value
+        elif actual != value:
+            changes[key] = value
+
+    return changes
@@ -0,0 +1,454 @@
+#!/usr/bin/python3
+"""
+Local fake of the Nautobot REST API used by nr_routeros_pull_to_nautobot.
+
+Serves dcim/sites, dcim/device-types, dcim/devices, dcim/interfaces, ipam/prefixes and
+ipam/ip-addresses from memory, with list filters, pagination, single and bulk
+create/update/delete, and the uniqueness rules the sync runs into (site and device
+names, device type models, interface names per device).  /api/graphql/ answers the
+device queries of nr_nautobot_graphql, and nothing else.  Every request is counted
+per method and endpoint, and can be delayed to simulate a remote Nautobot.
+
+Run it in-process with start() or from the command line:
+
+Usage: nr_nautobot_simulator.py [--port 18080] [--latency 0.01]
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+NB_SIM_PORT = 18080
+NB_SIM_VERSION = '1.6.0'
+
+# Default page size of list views
+PAGE_SIZE = 50
+
+ENDPOINTS = [
+    'dcim/sites',
+    'dcim/device-types',
+    'dcim/devices',
+    'dcim/interfaces',
+    'ipam/prefixes',
+    'ipam/ip-addresses',
+]
+
+# Fields that must be unique on an endpoint, together
+UNIQUE_FIELDS = {
+    'dcim/sites': ['name'],
+    'dcim/device-types': ['model'],
+    'dcim/devices': ['name'],
+    'dcim/interfaces': ['device', 'name'],
+}
+
+# Endpoints that nested objects ({'name': ...}) of a field are looked up in
+RELATED_ENDPOINTS = {
+    'site': 'dcim/sites',
+    'device_type': 'dcim/device-types',
+    'device': 'dcim/devices',
+}
+
+# Fields with an index, so filtering on them doesn't scan the whole endpoint
+INDEXED_FIELDS = ['name', 'model', 'device', 'prefix', 'address', 'site', 'assigned_object_id']
+
+# Query parameters that aren't filters
+CONTROL_PARAMETERS = {'limit', 'offset', 'depth', 'exclude_m2m', 'include', 'brief'}
+
+class NautobotError(Exception):
+    '''
+    Raised for requests Nautobot would refuse.  Answered with status and the message.
+    '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class NautobotSimulator:
+    '''
+    In-memory Nautobot objects and request counters.
+    '''
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.objects = {endpoint: {} for endpoint in ENDPOINTS}
+        self.indexes = {endpoint: {field: {} for field in INDEXED_FIELDS} for endpoint in ENDPOINTS}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.base_url = ''
+
+    def count(self, method, endpoint):
+        with self.lock:
+            key = (method, endpoint)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+
+    def slugify(self, name):
+        '''
+        Returns the slug Nautobot derives from a name, like Django's slugify.
+        '''
+        slug = re.sub(r'[^\w\s-]', '', str(name).lower())
+        return re.sub(r'[-\s]+', '-', slug).strip('-_')
+
+    def nested(self, field, value):
+        '''
+        Resolves a nested object given by its attributes ({'name': ...}) to a reference to the stored object.
+        '''
+        endpoint = RELATED_ENDPOINTS.get(field)
+        if endpoint is None or not isinstance(value, dict) or 'id' in value:
+            return value
+
+        for record in self.objects[endpoint].values():
+            if all(record.get(key) == wanted for key, wanted in value.items()):
+                reference = {'id': record['id'], 'url': record['url'], 'display': record['display'], **value}
+                if 'slug' in record:
+                    reference['slug'] = record['slug']
+                return reference
+
+        raise NautobotError(400, f'{field}: related object not found using the provided attributes: {value}')
+
+    def index_values(self, record, field):
+        value = record.get(field)
+        if isinstance(value, dict):
+            return {str(value.get('name')), str(value.get('id')), str(value.get('model'))}
+        return {str(value)} if value is not None else set()
+
+    def store(self, endpoint, record):
+        '''
+        Stores a record and updates the indexes.  Call with the lock held.
+        '''
+        self.remove(endpoint, record['id'])
+        self.objects[endpoint][record['id']] = record
+        for field, index in self.indexes[endpoint].items():
+            for value in self.index_values(record, field):
+                index.setdefault(value, set()).add(record['id'])
+
+    def remove(self, endpoint, object_id):
+        '''
+        Removes a record and its index entries.  Call with the lock held.  Returns the removed record.
+        '''
+        record = self.objects[endpoint].pop(object_id, None)
+        if record is not None:
+            for field, index in self.indexes[endpoint].items():
+                for value in self.index_values(record, field):
+                    index[value].discard(object_id)
+
+        return record
+
+    def candidates(self, endpoint, filters):
+        '''
+        Returns the records that can match the filters, narrowed down by the first indexed filter.
+        '''
+        for field, values in filters.items():
+            if field in self.indexes[endpoint]:
+                index = self.indexes[endpoint][field]
+                ids = set().union(*[index.get(value, set()) for value in values])
+                return [self.objects[endpoint][object_id] for object_id in ids]
+
+        return list(self.objects[endpoint].values())
+
+    def matches(self, record, filters):
+        for key, values in filters.items():
+            if key.startswith('cf_'):
+                actual = (record.get('custom_fields') or {}).get(key[3:])
+            else:
+                actual = record.get(key)
+
+            # Nested objects match by name or id
+            if isinstance(actual, dict):
+                actual_values = {str(actual.get('name')), str(actual.get('id')), str(actual.get('model'))}
+            else:
+                actual_values = {str(actual).lower() if key == 'mac_address' else str(actual)}
+
+            wanted = {value.lower() if key == 'mac_address' else value for value in values}
+            if not actual_values & wanted:
+                return False
+
+        return True
+
+    def check_unique(self, endpoint, record):
+        fields = UNIQUE_FIELDS.get(endpoint)
+        if not fields:
+            return
+
+        def key(item):
+            return tuple(str(item.get(field, {}).get('id') if isinstance(item.get(field), dict) else item.get(field)) for field in fields)
+
+        for other in self.candidates(endpoint, {'name': [str(record.get('name'))]} if 'name' in fields else {}):
+            if other['id'] != record['id'] and key(other) == key(record):
+                raise NautobotError(400, f'{endpoint}: an object with this {" and ".join(fields)} already exists')
+
+    def create(self, endpoint, data):
+        object_id = str(uuid.uuid4())
+        record = {'id': object_id, 'url': f'{self.base_url}/api/{endpoint}/{object_id}/', 'custom_fields': {}}
+        for field, value in data.items():
+            record[field] = self.nested(field, value)
+        record['display'] = str(record.get('name') or record.get('model') or record.get('prefix') or record.get('address') or object_id)
+        if endpoint == 'dcim/sites' and not record.get('slug'):
+            record['slug'] = self.slugify(record['name'])
+
+        with self.lock:
+            self.check_unique(endpoint, record)
+            self.store(endpoint, record)
+
+        return record
+
+    def update(self, endpoint, object_id, data):
+        record = self.objects[endpoint].get(object_id)
+        if record is None:
+            raise NautobotError(404, 'Not found.')
+
+        updated = dict(record)
+        for field, value in data.items():
+            if field == 'custom_fields':
+                updated['custom_fields'] = {**record.get('custom_fields', {}), **(value or {})}
+            elif field not in ('id', 'url'):
+                updated[field] = self.nested(field, value)
+
+        with self.lock:
+            self.check_unique(endpoint, updated)
+            self.store(endpoint, updated)
+
+        return updated
+
+    def delete(self, endpoint, object_id):
+        with self.lock:
+            if self.remove(endpoint, object_id) is None:
+                raise NautobotError(404, 'Not found.')
+
+    def list(self, endpoint, params, path):
+        '''
+        Returns one page of the objects matching the filters in params.
+        '''
+        # Like Nautobot, empty filter values are ignored
+        filters = {
+            key: values for key, values in params.items()
+            if key not in CONTROL_PARAMETERS and any(values)
+        }
+        with self.lock:
+            records = [record for record in self.candidates(endpoint, filters) if self.matches(record, filters)]
+
+        limit = int(params.get('limit', [PAGE_SIZE])[0])
+        offset = int(params.get('offset', [0])[0])
+        page = records[offset:offset + limit] if limit else records[offset:]
+
+        next_url = None
+        if limit and offset + limit < len(records):
+            next_params = {key: values[0] for key, values in params.items()}
+            next_params.update({'limit': limit, 'offset': offset + limit})
+            next_url = f'{self.base_url}{path}?{urlencode(next_params)}'
+
+        return {'count': len(records), 'next': next_url, 'previous': None, 'results': page}
+
+    def graphql(self, body):
+        '''
+        Answers a devices(name: $values) or devices(site: $values) query with every field
+        nr_nautobot_graphql asks for, choice fields as GraphQL enum names.  Like Nautobot 1.x,
+        the site filter matches site slugs only.
+        '''
+        match = re.search(r'devices\((name|site): \$values\)', body.get('query', ''))
+        if not match:
+            raise NautobotError(400, 'only the device queries of nr_nautobot_graphql are supported')
+
+        filters = {match.group(1): [str(value) for value in (body.get('variables') or {}).get('values') or []]}
+
+        def enum(value):
+            if not value:
+                return value
+            return ('A_' if value[0].isdigit() else '') + value.upper().replace('-', '_')
+
+        def status(record):
+            return {'slug': record.get('status')} if record.get('status') else None
+
+        def nested(value, *keys):
+            return {key: value.get(key) for key in keys} if isinstance(value, dict) else None
+
+        devices = []
+        with self.lock:
+            # The site index holds names and ids, not slugs
+            for device in self.candidates('dcim/devices', {} if 'site' in filters else filters):
+                if 'site' in filters:
+                    if (device.get('site') or {}).get('slug') not in filters['site']:
+                        continue
+                elif not self.matches(device, filters):
+                    continue
+
+                interfaces = []
+                for interface in self.candidates('dcim/interfaces', {'device': [device['id']]}):
+                    ip_addresses = [
+                        {
+                            'id': ip_address['id'],
+                            'address': ip_address['address'],
+                            'description': ip_address.get('description', ''),
+                            'role': enum(ip_address.get('role')),
+                            'status': status(ip_address),
+                        }
+                        for ip_address in self.candidates('ipam/ip-addresses', {'assigned_object_id': [interface['id']]})
+                    ]
+                    interfaces.append({
+                        'id': interface['id'],
+                        'name': interface['name'],
+                        'type': enum(interface.get('type')),
+                        'mac_address': interface.get('mac_address'),
+                        'description': interface.get('description', ''),
+                        'status': status(interface),
+                        'cf_default_name': interface['custom_fields'].get('default_name'),
+                        'ip_addresses': ip_addresses,
+                    })
+
+                devices.append({
+                    'id': device['id'],
+                    'name': device['name'],
+                    'serial': device.get('serial', ''),
+                    'status': status(device),
+                    'site': nested(device.get('site'), 'id', 'name', 'slug'),
+                    'device_type': nested(device.get('device_type'), 'id', 'model'),
+                    'device_role': nested(device.get('device_role'), 'id', 'name'),
+                    'interfaces': interfaces,
+                })
+
+        return {'data': {'devices': devices}}
+
+    def handle(self, method, path, params, body):
+        '''
+        Answers one API request.  Returns (status, response body).
+        '''
+        parts = [part for part in path.split('/') if part]
+
+        # /api/ and /api/status/
+        if parts in (['api'], ['api', 'status']):
+            return 200, {'nautobot-version': NB_SIM_VERSION}
+
+        if parts == ['api', 'graphql'] and method == 'POST':
+            self.count(method, 'graphql')
+            return 200, self.graphql(body)
+
+        if len(parts) < 3 or parts[0] != 'api':
+            raise NautobotError(404, 'Not found.')
+
+        endpoint = f'{parts[1]}/{parts[2]}'
+        if endpoint not in self.objects:
+            raise NautobotError(404, 'Not found.')
+        self.count(method, endpoint)
+        object_id = parts[3] if len(parts) > 3 else None
+
+        if method == 'GET':
+            if object_id:
+                record = self.objects[endpoint].get(object_id)
+                if record is None:
+                    raise NautobotError(404, 'Not found.')
+                return 200, record
+            return 200, self.list(endpoint, params, path)
+
+        if method == 'POST':
+            if isinstance(body, list):
+                return 201, [self.create(endpoint, data) for data in body]
+            return 201, self.create(endpoint, body)
+
+        if method in ('PATCH', 'PUT'):
+            if object_id:
+                return 200, self.update(endpoint, object_id, body)
+            return 200, [self.update(endpoint, data['id'], data) for data in body]
+
+        if method == 'DELETE':
+            if object_id:
+                self.delete(endpoint, object_id)
+            else:
+                for data in body:
+                    self.delete(endpoint, data['id'])
+            return 204, None
+
+        raise NautobotError(405, f'Method "{method}" not allowed.')
+
+def make_handler(simulator):
+    class NautobotRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        # Headers and body are written separately, don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def answer(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+
+            if simulator.latency:
+                time.sleep(simulator.latency)
+
+            try:
+                status, response = simulator.handle(method, url.path, parse_qs(url.query), body)
+            except NautobotError as e:
+                status, response = e.status, {'detail': str(e)}
+            except (KeyError, TypeError, ValueError) as e:
+                status, response = 400, {'detail': f'{type(e).__name__}: {e}'}
+
+            data = json.dumps(response).encode() if response is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('API-Version', NB_SIM_VERSION.rsplit('.', 1)[0])
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.answer('GET')
+
+        def do_POST(self):
+            self.answer('POST')
+
+        def do_PATCH(self):
+            self.answer('PATCH')
+
+        def do_PUT(self):
+            self.answer('PUT')
+
+        def do_DELETE(self):
+            self.answer('DELETE')
+
+    return NautobotRequestHandler
+
+def start(port=NB_SIM_PORT, latency=0.0, simulator=None):
+    '''
+    Starts the fake Nautobot in a background thread.  Returns (simulator, server); stop it with server.shutdown().
+    Point pynautobot at simulator.base_url.
+    '''
+    simulator = simulator or NautobotSimulator(latency=latency)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(simulator))
+    server.daemon_threads = True
+    simulator.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return simulator, server
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Nautobot REST API')
+    parser.add_argument('--port', type=int, default=NB_SIM_PORT)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response')
+    args = parser.parse_args()
+
+    simulator, server = start(args.port, args.latency)
+    print(f'fake Nautobot on {simulator.base_url}, any token is accepted')
+    try:
+        while True:
+            time.sleep(60)
+            for (method, endpoint), count in sorted(simulator.requests.items()):
+                print(f'{method:<6} {endpoint:<20} {count}')
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Fast pre-flight reachability check.  TCP-probes the management ports of every host in the
+inventory concurrently with a short timeout, so unreachable hosts can be reported up front
+and left out of the remaining stages instead of timing out in each one.
+"""
+
+import asyncio
+from nr_routeros_general import get_transport, REST_CONNECTION_NAME
+
+# Timeout in seconds for each TCP connection attempt
+PROBE_TIMEOUT = 2
+SSH_PORT = 22
+
+def service_ports(host, services):
+    '''
+    Returns the TCP ports to probe on a host for the given services ('api', 'ssh').
+    REST hosts are probed on their HTTPS port for 'api', and don't need SSH.
+    '''
+    ports = []
+
+    if 'api' in services:
+        if get_transport(host) == 'rest':
+            ports.append(host.get_connection_parameters(REST_CONNECTION_NAME).port or 443)
+        else:
+            ports.append(host.port or 8728)
+
+    if 'ssh' in services and get_transport(host) != 'rest':
+        ports.append(SSH_PORT)
+
+    return ports
+
+async def probe_port(hostname, port, timeout=PROBE_TIMEOUT):
+    '''
+    Returns True if a TCP connection to hostname:port can be opened within the timeout.
+    '''
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(hostname, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+    return True
+
+async def probe_inventory_async(nr, services=('api', 'ssh'), timeout=PROBE_TIMEOUT, num_workers=500):
+    '''
+    Probes all hosts concurrently.  Returns {host name: [unreachable ports]}, empty for reachable hosts.
+    '''
+    semaphore = asyncio.Semaphore(num_workers)
+
+    async def probe_host(host):
+        async with semaphore:
+            ports = service_ports(host, services)
+            reachable = await asyncio.gather(*[probe_port(host.hostname, port, timeout) for port in ports])
+        return host.name, [port for port, ok in zip(ports, reachable) if not ok]
+
+    results = await asyncio.gather(*[probe_host(host) for host in nr.inventory.hosts.values()])
+    return dict(results)
+
+def probe_inventory(nr, services=('api', 'ssh'), timeout=PROBE_TIMEOUT, num_workers=500):
+    return asyncio.run(probe_inventory_async(nr, services=services, timeout=timeout, num_workers=num_workers))
+
+def prune_unreachable(nr, services=('api', 'ssh'), timeout=PROBE_TIMEOUT, num_workers=500):
+    '''
+    Probes the inventory and returns it filtered to the hosts where every service port is reachable.
+    Unreachable hosts are printed before any stage runs.
+    '''
+    results = probe_inventory(nr, services=services, timeout=timeout, num_workers=num_workers)
+    unreachable = {name: ports for name, ports in results.items() if ports}
+
+    # Print a bulleted list of unreachable hosts
+    if unreachable:
+        print(f'{len(unreachable)} of {len(results)} hosts unreachable, skipping them:')
+        for name, ports in sorted(unreachable.items()):
+            print(f'- {name}: no answer on port {", ".join(str(port) for port in ports)}')
+
+    return nr.filter(filter_func=lambda host: host.name not in unreachable)
@@ -0,0 +1,178 @@
+"""
+Compact streaming result reporter, used instead of print_result at fleet scale.
+
+StreamReporter is a Nornir processor.  It prints one line per host as soon as the host's
+task finishes, a one-line total after each stage, and a summary table of successes,
+failures and changes per task at the end.  Full results, sub-tasks included, are written
+as JSON lines to REPORTS_DIR/<job>-<date>.jsonl as they arrive, so they are never all
+held in memory.
+
+    reporter = StreamReporter('nr_routeros_baseline')
+    nr = nr.with_processors([reporter])
+    ...
+    reporter.print_summary()
+    reporter.close()
+"""
+
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import config
+from nornir.core.exceptions import NornirSubTaskError
+from nr_host_records import json_default
+
+# Directory for the .jsonl result files
+REPORTS_DIR = getattr(config, 'REPORTS_DIR', 'reports')
+
+# Maximum length of the message on a host's line
+MESSAGE_WIDTH = 80
+
+def result_status(result):
+    if result.failed:
+        return 'FAILED'
+    if result.changed:
+        return 'changed'
+    return 'ok'
+
+def result_message(multi_result):
+    '''
+    Returns a short message for a host's result: the error that made it fail, or the first line of its result.
+    '''
+    if multi_result.failed:
+        for result in reversed(multi_result):
+            if result.exception is not None and not isinstance(result.exception, NornirSubTaskError):
+                message = f'{type(result.exception).__name__}: {result.exception}'
+                break
+        else:
+            message = str(multi_result[0].exception or multi_result[0].result)
+    else:
+        message = str(multi_result[0].result) if multi_result[0].result is not None else ''
+
+    message = message.strip().split('\n')[0]
+    return message if len(message) <= MESSAGE_WIDTH else message[:MESSAGE_WIDTH - 3] + '...'
+
+class StreamReporter:
+    '''
+    Nornir processor printing one compact line per host and task, and writing full results as JSON lines.
+    '''
+    # Facts fetched lazily inside a task aren't a task of the run (nr_lazy_facts)
+    lazy_facts = False
+
+    def __init__(self, job=None, reports_dir=REPORTS_DIR, stream=None):
+        self.job = job
+        self.stream = stream or sys.stdout
+        self.counts = {}
+        self.started = {}
+        self.stage_started = {}
+        self.lock = threading.Lock()
+
+        # Without a job name only the terminal output is produced
+        self.jsonl = None
+        self.jsonl_path = None
+        if job:
+            reports_dir = os.path.expanduser(reports_dir)
+            os.makedirs(reports_dir, exist_ok=True)
+            now = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+            self.jsonl_path = os.path.join(reports_dir, f'{job}-{now}.jsonl')
+            self.jsonl = open(self.jsonl_path, 'a')
+
+    def write_line(self, line):
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def record(self, task_name, host_name, multi_result, duration=None):
+        '''
+        Counts, prints and saves the result of one task on one host.
+        '''
+        status = result_status(multi_result)
+        duration_text = f'{duration:>6.2f}s' if duration is not None else ' ' * 7
+        self.write_line(f'{status:<7} {host_name:<28} {task_name:<28} {duration_text}  {result_message(multi_result)}')
+
+        with self.lock:
+            counts = self.counts.setdefault(task_name, {'ok': 0, 'failed': 0, 'changed': 0})
+            counts['failed' if multi_result.failed else 'ok'] += 1
+            counts['changed'] += int(multi_result.changed)
+
+            if self.jsonl is not None:
+                for result in multi_result:
+                    self.jsonl.write(json.dumps({
+                        'job': self.job,
+                        'task': task_name,
+                        'host': host_name,
+                        'name': result.name,
+                        'failed': result.failed,
+                        'changed': result.changed,
+                        'duration': duration if result is multi_result[0] else None,
+                        'result': result.result,
+                        'exception': repr(result.exception) if result.exception is not None else None,
+                    }, default=json_default) + '\n')
+
+    def report(self, aggregated):
+        '''
+        Reports an AggregatedResult that was produced without this processor (for example by
+        the asyncio engine).
+        '''
+        for host_name, multi_result in aggregated.items():
+            self.record(aggregated.name, host_name, multi_result)
+
+        self.print_stage(aggregated.name)
+
+    def print_stage(self, task_name, duration=None):
+        counts = self.counts.get(task_name, {'ok': 0, 'failed': 0, 'changed': 0})
+        took = f' in {duration:.1f}s' if duration is not None else ''
+        self.write_line(f'== {task_name}: {counts["ok"]} ok, {counts["failed"]} failed, {counts["changed"]} changed{took}')
+
+    def summary(self):
+        '''
+        Returns {task name: {'ok', 'failed', 'changed'}} for every task reported so far.
+        '''
+        with self.lock:
+            return {task_name: dict(counts) for task_name, counts in self.counts.items()}
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+
+        width = max(len(task_name) for task_name in summary)
+        lines = [f'{"task":<{width}} {"ok":>7} {"failed":>7} {"changed":>7}']
+        for task_name, counts in summary.items():
+            lines.append(f'{task_name:<{width}} {counts["ok"]:>7} {counts["failed"]:>7} {counts["changed"]:>7}')
+        if self.jsonl_path:
+            lines.append(f'full results: {self.jsonl_path}')
+
+        self.write_line('\n'.join(lines))
+
+    def close(self):
+        if self.jsonl is not None:
+            self.jsonl.close()
+            self.jsonl = None
+
+    def task_started(self, task):
+        self.stage_started[task.name] = time.perf_counter()
+        # Hosts that failed in an earlier stage are skipped
+        hosts = [name for name in task.nornir.inventory.hosts if name not in task.nornir.data.failed_hosts]
+        self.write_line(f'== {task.name}: {len(hosts)} hosts')
+
+    def task_completed(self, task, result):
+        self.print_stage(task.name, time.perf_counter() - self.stage_started.pop(task.name, time.perf_counter()))
+
+    def task_instance_started(self, task, host):
+        # Tasks can start inside another task of the same host, so keep a stack per host
+        with self.lock:
+            self.started.setdefault(host.name, []).append(time.perf_counter())
+
+    def task_instance_completed(self, task, host, result):
+        with self.lock:
+            duration = time.perf_counter() - self.started[host.name].pop()
+        self.record(task.name, host.name, result, duration)
+
+    def subtask_instance_started(self, task, host):
+        pass
+
+    def subtask_instance_completed(self, task, host, result):
+        pass
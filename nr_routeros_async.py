@@ -0,0 +1,500 @@
+"""
+Asyncio execution engine for the RouterOS binary API.
+
+Nornir's threaded runner needs one OS thread per in-flight host.  This module runs
+async tasks against thousands of routers from a single thread instead, using a small
+async RouterOS API client.  Results are returned as a Nornir AggregatedResult, so
+StreamReporter.report, print_result and failed_hosts work as usual.
+
+Async tasks take the API client and the host:
+
+    async def my_task(api, host, **kwargs) -> Result
+"""
+
+import asyncio
+import hashlib
+import ssl
+import time
+from binascii import unhexlify
+from nornir.core.task import AggregatedResult, MultiResult, Result, Task
+from nr_routeros_general import RESOURCE_FIELDS, INTERFACE_FIELDS, IP_ADDRESS_FIELDS, routeros_batch_read
+from nr_metrics import TRANSPORT_METRICS
+from nr_budget import API_TIMEOUT, find_guard, transport_timeout
+from nr_host_records import compact
+
+# Reads sent together by async_get_mikrotik_facts, by tag, as (path, query, proplist)
+FACT_READS = {
+    'resource': ('/system/resource', None, RESOURCE_FIELDS),
+    'routerboard': ('/system/routerboard', None, ['serial-number']),
+    'interfaces': ('/interface', None, INTERFACE_FIELDS),
+    'ip_addresses': ('/ip/address', None, IP_ADDRESS_FIELDS),
+}
+
+# Default RouterOS API ports.  The timeout for connecting and for each reply is nr_budget's API_TIMEOUT.
+API_PORT = 8728
+API_SSL_PORT = 8729
+
+class RouterOsApiError(Exception):
+    '''
+    Raised when the router replies with !trap or !fatal.
+    '''
+    pass
+
+def encode_length(length):
+    '''
+    Encodes the length of a word as described in the RouterOS API documentation.
+    '''
+    if length < 0x80:
+        return bytes([length])
+    elif length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    elif length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    elif length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    else:
+        return b'\xf0' + length.to_bytes(4, 'big')
+
+def encode_sentence(words):
+    '''
+    Encodes a list of words as a sentence, terminated by a zero length word.
+    '''
+    sentence = b''
+    for word in words:
+        encoded = word.encode('utf-8')
+        sentence += encode_length(len(encoded)) + encoded
+
+    return sentence + b'\x00'
+
+async def read_length(reader):
+    '''
+    Reads the length of the next word from the stream.
+    '''
+    first = (await reader.readexactly(1))[0]
+
+    if first < 0x80:
+        return first
+    elif first < 0xC0:
+        rest = await reader.readexactly(1)
+        return int.from_bytes(bytes([first]) + rest, 'big') & 0x3FFF
+    elif first < 0xE0:
+        rest = await reader.readexactly(2)
+        return int.from_bytes(bytes([first]) + rest, 'big') & 0x1FFFFF
+    elif first < 0xF0:
+        rest = await reader.readexactly(3)
+        return int.from_bytes(bytes([first]) + rest, 'big') & 0xFFFFFFF
+    else:
+        return int.from_bytes(await reader.readexactly(4), 'big')
+
+def length_size(length):
+    '''
+    Returns the number of bytes encode_length uses for a length.
+    '''
+    for size, limit in enumerate([0x80, 0x4000, 0x200000, 0x10000000], start=1):
+        if length < limit:
+            return size
+    return 5
+
+async def read_sentence(reader, sizes=None):
+    '''
+    Reads one sentence from the stream and returns it as a list of words.
+    If a sizes list is given, the number of bytes read is appended to it.
+    '''
+    words = []
+    size = 1
+    while True:
+        length = await read_length(reader)
+        if length == 0:
+            if sizes is not None:
+                sizes.append(size)
+            return words
+        size += length_size(length) + length
+        words.append((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+
+def parse_sentence(words):
+    '''
+    Splits a reply sentence into its type (!re, !done, ...), tag, and attribute dictionary.
+    '''
+    reply_type = words[0] if words else ''
+    tag = None
+    attributes = {}
+
+    for word in words[1:]:
+        if word.startswith('.tag='):
+            tag = word[5:]
+        elif word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attributes[key] = value
+
+    return reply_type, tag, attributes
+
+def query_words(query):
+    '''
+    Turns a {property: value} dictionary into RouterOS API query words (?property=value).
+    '''
+    return [f'?{key}={value}' for key, value in (query or {}).items()]
+
+def proplist_words(proplist):
+    '''
+    Turns a list of property names into a .proplist attribute word, so only those properties are returned.
+    '''
+    return [f'=.proplist={",".join(proplist)}'] if proplist else []
+
+def attribute_words(properties):
+    '''
+    Turns a {property: value} dictionary into RouterOS API attribute words (=property=value).
+    '''
+    return [f'={key}={value}' for key, value in (properties or {}).items()]
+
+class AsyncRouterOsApi:
+    '''
+    Minimal async client for the RouterOS binary API.  Commands on one client are sent one after another.
+    '''
+    def __init__(self, hostname, username, password, port=None, use_ssl=False, timeout=API_TIMEOUT):
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.port = port or (API_SSL_PORT if use_ssl else API_PORT)
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        '''
+        Opens the connection and logs in.
+        '''
+        ssl_context = None
+        if self.use_ssl:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.hostname, self.port, ssl=ssl_context),
+            timeout=self.timeout,
+        )
+        TRANSPORT_METRICS.connected(self.hostname, 'routeros_api')
+
+        # Log in using the post-6.43 method.  Older routers answer with a challenge instead.
+        try:
+            replies = await self.talk(['/login', f'=name={self.username}', f'=password={self.password}'])
+            challenge = replies[-1][1].get('ret') if replies else None
+            if challenge:
+                digest = hashlib.md5(b'\x00' + self.password.encode('utf-8') + unhexlify(challenge)).hexdigest()
+                await self.talk(['/login', f'=name={self.username}', f'=response=00{digest}'])
+        except RouterOsApiError:
+            TRANSPORT_METRICS.auth_failure(self.hostname, 'routeros_api')
+            raise
+
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            self.writer = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def send(self, words):
+        await self.send_bytes(encode_sentence(words))
+
+    async def send_bytes(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+        TRANSPORT_METRICS.record(self.hostname, 'routeros_api', bytes_sent=len(data), requests=0)
+
+    async def receive(self):
+        sizes = []
+        sentence = await asyncio.wait_for(read_sentence(self.reader, sizes), timeout=self.timeout)
+        TRANSPORT_METRICS.record(self.hostname, 'routeros_api', bytes_received=sizes[0], requests=0)
+        return parse_sentence(sentence)
+
+    async def talk(self, words):
+        '''
+        Sends one command and returns its replies as a list of (type, attributes), up to and including !done.
+        '''
+        started = time.perf_counter()
+        await self.send(words)
+
+        replies = []
+        while True:
+            reply_type, tag, attributes = await self.receive()
+            if reply_type == '!trap':
+                error = attributes.get('message', 'unknown error')
+                # The router still sends !done after a trap, read it before raising
+                await self.receive()
+                raise RouterOsApiError(f'{self.hostname}: {words[0]}: {error}')
+            if reply_type == '!fatal':
+                raise RouterOsApiError(f'{self.hostname}: fatal: {attributes or words}')
+
+            replies.append((reply_type, attributes))
+            if reply_type == '!done':
+                TRANSPORT_METRICS.record(self.hostname, 'routeros_api', rtt=time.perf_counter() - started)
+                return replies
+
+    async def get(self, path, query=None, proplist=None):
+        '''
+        Returns the items of a menu (print) as a list of dictionaries, optionally filtered by query
+        and limited to the properties in proplist.
+        '''
+        replies = await self.talk([f'{path}/print'] + proplist_words(proplist) + query_words(query))
+        return [attributes for reply_type, attributes in replies if reply_type == '!re']
+
+    async def set(self, path, properties, item_id=None):
+        '''
+        Sets properties on an item (or on a menu without items if item_id is None).
+        '''
+        words = [f'{path}/set'] + attribute_words(properties)
+        if item_id is not None:
+            words.append(f'=.id={item_id}')
+        await self.talk(words)
+
+    async def add(self, path, properties):
+        '''
+        Adds an item to a menu and returns its id.
+        '''
+        replies = await self.talk([f'{path}/add'] + attribute_words(properties))
+        return replies[-1][1].get('ret')
+
+    async def command(self, path, command, **kwargs):
+        '''
+        Runs a command (check-for-updates, enable, ...) on a menu.
+        '''
+        replies = await self.talk([f'{path}/{command}'] + attribute_words(kwargs))
+        return [attributes for reply_type, attributes in replies if reply_type == '!re']
+
+    async def batch(self, reads):
+        '''
+        Sends several print commands at once, each with its own .tag, and collects the replies by tag.
+        reads is a {name: path} or {name: (path, query, proplist)} dictionary.  Returns {name: [items]}.
+        All commands are in flight together, so the batch costs about one round trip in total.
+        '''
+        sentences = b''
+        for name, read in reads.items():
+            path, query, proplist = (read, None, None) if isinstance(read, str) else read
+            words = [f'{path}/print'] + proplist_words(proplist) + query_words(query)
+            sentences += encode_sentence(words + [f'.tag={name}'])
+
+        started = time.perf_counter()
+        await self.send_bytes(sentences)
+
+        # Replies for different tags can arrive interleaved, so sort them by tag until every command is done
+        results = {name: [] for name in reads}
+        errors = {}
+        pending = set(reads)
+        while pending:
+            reply_type, tag, attributes = await self.receive()
+            if reply_type == '!fatal':
+                raise RouterOsApiError(f'{self.hostname}: fatal: {attributes}')
+            if tag not in pending:
+                continue
+
+            if reply_type == '!re':
+                results[tag].append(attributes)
+            elif reply_type == '!trap':
+                errors[tag] = attributes.get('message', 'unknown error')
+            elif reply_type == '!done':
+                pending.discard(tag)
+
+        TRANSPORT_METRICS.record(self.hostname, 'routeros_api', rtt=time.perf_counter() - started, requests=len(reads))
+
+        if errors:
+            raise RouterOsApiError(f'{self.hostname}: {errors}')
+
+        return results
+
+async def async_get_ros_version(api, host) -> Result:
+    '''
+    Async version of get_ros_version.  Sets ros_version and ros_major_version in the host's data.
+    '''
+    resource = await api.get('/system/resource', proplist=['version'])
+
+    version = resource[0]['version'].split(' ')[0]
+    host.data['ros_version'] = version
+    host.data['ros_major_version'] = version.split('.')[0]
+
+    return Result(
+        host=host,
+        result=version,
+    )
+
+async def async_get_interfaces(api, host) -> Result:
+    '''
+    Async version of get_interfaces.  Sets interfaces in the host's data.
+    '''
+    host.data['interfaces'] = compact('interfaces', await api.get('/interface', proplist=INTERFACE_FIELDS))
+
+    return Result(
+        host=host,
+        result=True,
+    )
+
+async def async_get_mikrotik_facts(api, host) -> Result:
+    '''
+    Gets the routeros version, hardware, serial, interfaces and IP addresses in one batch of
+    tagged reads, and sets them in the host's data like the matching get_* tasks.
+    '''
+    replies = await api.batch(FACT_READS)
+
+    set_mikrotik_facts(host, replies)
+
+    return Result(
+        host=host,
+        result=host.data['ros_version'],
+    )
+
+def set_mikrotik_facts(host, replies):
+    '''
+    Sets the facts read with FACT_READS in the host's data, the same way as the get_* tasks.
+    '''
+    resource = replies['resource'][0]
+    version = resource['version'].split(' ')[0]
+    host.data['ros_version'] = version
+    host.data['ros_major_version'] = version.split('.')[0]
+    host.data['hardware'] = resource['board-name']
+    host.data['serial'] = replies['routerboard'][0].get('serial-number', '')
+    host.data['interfaces'] = compact('interfaces', replies['interfaces'])
+    host.data['ip_addresses'] = compact('ip_addresses', replies['ip_addresses'])
+
+async def async_config_item(api, host, path, where, properties, add_if_missing=False) -> Result:
+    '''
+    Async version of routeros_config_item.  Finds the item matching where and sets the properties
+    that differ.  If no item matches and add_if_missing is True, the item is added.
+    '''
+    items = await api.get(path, query=where)
+
+    if len(items) > 1:
+        raise ValueError(f'{len(items)} items in {path} match {where}')
+
+    # Add the item if it doesn't exist
+    if not items:
+        if not add_if_missing:
+            return Result(host=host, result=f'no item in {path} matches {where}', changed=False)
+        await api.add(path, properties)
+        return Result(host=host, result=f'added to {path}: {properties}', changed=True)
+
+    # Only set the properties that differ from the current config
+    current = items[0]
+    changes = {key: value for key, value in properties.items() if current.get(key) != value}
+    if changes:
+        await api.set(path, changes, item_id=current.get('.id'))
+
+    return Result(
+        host=host,
+        result=f'set in {path}: {changes}' if changes else f'{path} already configured',
+        changed=bool(changes),
+    )
+
+def api_client_for_host(host, guard=None):
+    '''
+    Builds an AsyncRouterOsApi for a host using the same inventory settings as the routerosapi
+    connection, with the API_TIMEOUT of nr_budget shortened to the time left in the host's budget
+    in guard (a HostGuard, or None).
+    '''
+    extras = host.get_connection_parameters('routerosapi').extras or {}
+
+    return AsyncRouterOsApi(
+        hostname=host.hostname,
+        username=host.username,
+        password=host.password,
+        port=host.port,
+        use_ssl=extras.get('use_ssl', True),
+        timeout=transport_timeout(guard, host.name, API_TIMEOUT),
+    )
+
+def get_facts_batched(task: Task) -> Result:
+    '''
+    Gets the same facts as async_get_mikrotik_facts for threaded workflows, in one round trip
+    window instead of one round trip per get_* task.  The reads are pipelined over the host's
+    shared routerosapi connection, so the host keeps one connection for the whole run.
+    '''
+    replies = task.run(
+        task=routeros_batch_read,
+        reads=FACT_READS,
+    )
+
+    set_mikrotik_facts(task.host, replies.result)
+
+    return Result(
+        host=task.host,
+        result=task.host.data['ros_version'],
+    )
+
+async def _run_host(task, host, semaphore, name, guard, kwargs):
+    '''
+    Connects to a host, runs the async task, and returns the host's MultiResult.
+    '''
+    multi_result = MultiResult(name)
+
+    async with semaphore:
+        try:
+            async with api_client_for_host(host, guard) as api:
+                result = await task(api, host, **kwargs)
+            if not isinstance(result, Result):
+                result = Result(host=host, result=result)
+            result.name = name
+        except Exception as e:
+            result = Result(host=host, result=f'{type(e).__name__}: {e}', exception=e, failed=True)
+            result.name = name
+
+    multi_result.append(result)
+    return host.name, multi_result
+
+async def run_async(nr, task, num_workers=1000, name=None, **kwargs):
+    '''
+    Runs an async task against every host of the inventory, with at most num_workers hosts in flight.
+    '''
+    name = name or task.__name__
+    semaphore = asyncio.Semaphore(num_workers)
+
+    guard = find_guard(nr)
+    aggregated = AggregatedResult(name)
+    host_results = await asyncio.gather(*[
+        _run_host(task, host, semaphore, name, guard, kwargs) for host in nr.inventory.hosts.values()
+    ])
+
+    for host_name, multi_result in host_results:
+        aggregated[host_name] = multi_result
+
+    return aggregated
+
+def run(nr, task, num_workers=1000, name=None, **kwargs):
+    '''
+    Synchronous entry point for run_async, for use like nr.run(task=...).
+    The number of hosts in flight is also limited by the open files limit (ulimit -n).
+    '''
+    return asyncio.run(run_async(nr, task, num_workers=num_workers, name=name, **kwargs))
+
+def main():
+    import sys
+    from nornir import InitNornir
+    from nr_report import StreamReporter
+    from nr_routeros_general import filter_target, command_line_target
+
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+    arguments = [arg for arg in sys.argv[2:] if '=' not in arg]
+    num_workers = int(arguments[0]) if arguments else 1000
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    # Gather the routeros version from every host
+    result = run(nr, async_get_ros_version, num_workers=num_workers)
+    reporter = StreamReporter()
+    reporter.report(result)
+
+if __name__ == "__main__":
+    main()
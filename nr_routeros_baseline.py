@@ -4,54 +4,79 @@ This script sets baseline configuration on routers, including:
 - Configure SNMP communities
 - Configure remote logging
 - Create a 'netauto' user
+
+The configuration of each stage is described by a *_rules function returning the
+config_item arguments that apply it.  nr_compliance checks the same rules against the
+stored config exports, without connecting to the routers.
+
+Usage: nr_routeros_baseline.py <hostname|all|selectors> [--noncompliant]
+
+With --noncompliant, each stage only runs on the hosts whose stored export violates it.
 """
 
 import sys
 from nornir import InitNornir
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
 from nornir_routeros.plugins.tasks import *
 from nr_routeros_general import *
+from nr_reachability import prune_unreachable
+from nr_budget import HostGuard
+from nr_metrics import TimingProcessor, write_metrics
+from nr_report import StreamReporter
+from nr_fact_cache import FactCache
+from nr_lazy_facts import install_lazy_facts
+
+def ntp_rules(host, ros_major_version=None):
+    '''
+    Returns the config_item arguments that enable and configure the NTP client.
+    '''
+    if ros_major_version == '6':
+        return [
+            {
+                'path': '/system/ntp/client',
+                'where': {},
+                'properties': {
+                    'enabled': 'yes',
+                    'server-dns-names': '0.pool.ntp.org,1.pool.ntp.org',
+                },
+            },
+        ]
+    elif ros_major_version == '7':
+        return [
+            {
+                'path': '/system/ntp/client/servers',
+                'where': {
+                    'address': 'pool.ntp.org',
+                },
+                'properties': {
+                    'address': 'pool.ntp.org',
+                },
+                'add_if_missing': True,
+            },
+            {
+                'path': '/system/ntp/client',
+                'where': {},
+                'properties': {
+                    'enabled': 'yes',
+                },
+            },
+        ]
+
+    return []
 
 def configure_ntp(task: Task) -> Result:
     '''
     Enables and configures NTP client on the device.
-    
+
     Reference configuration:
     /system ntp client
     set enabled=yes primary-ntp=5.145.135.89 secondary-ntp=94.16.122.254 \
     server-dns-names=0.pool.ntp.org,1.pool.ntp.org
     '''
-    if task.host.data['ros_major_version'] == '6':
-        task.run(
-            task=routeros_config_item,
-            path='/system/ntp/client',
-            where={},
-            properties={
-                'enabled': 'yes',
-                'server-dns-names': '0.pool.ntp.org,1.pool.ntp.org',
-            }
-        )
-    elif task.host.data['ros_major_version'] == '7':
+    for rule in ntp_rules(task.host, task.host.data['ros_major_version']):
         task.run(
-            task=routeros_config_item,
-            path='/system/ntp/client/servers',
-            where={
-                'address': 'pool.ntp.org'
-            },
-            properties={
-                'address': 'pool.ntp.org',
-            },
-            add_if_missing=True
-        )
-
-        task.run(
-            task=routeros_config_item,
-            path='/system/ntp/client',
-            where={},
-            properties={
-                'enabled': 'yes',
-            }
+            task=config_item,
+            **rule,
         )
 
     return Result(
@@ -59,10 +84,45 @@ def configure_ntp(task: Task) -> Result:
         result=f"NTP enabled and configured on {task.host}",
     )
 
+def snmp_rules(host, ros_major_version=None):
+    '''
+    Returns the config_item arguments that enable and configure SNMP.
+    '''
+    # Set site as string preceding first '-' in hostname, unless the inventory index already set it
+    site = host.data['site'] if 'site' in host.data else site_from_name(host.name)
+
+    return [
+        {
+            'path': '/snmp/community',
+            'where': {
+                'name': f'{SNMP_COMMUNITY}',
+            },
+            'properties': {
+                'name': f'{SNMP_COMMUNITY}',
+                'authentication-password': f'{SNMP_COMMUNITY}',
+                'authentication-protocol': 'MD5',
+                'encryption-password': f'{SNMP_COMMUNITY}',
+                'encryption-protocol': 'AES',
+                'security': 'private',
+                'addresses': TRUSTED_ADDRESSES
+            },
+            'add_if_missing': True,
+        },
+        {
+            'path': '/snmp',
+            'where': {},
+            'properties': {
+                'contact': 'admin@wiaw.net',
+                'enabled': 'yes',
+                'location': site,
+            },
+        },
+    ]
+
 def configure_snmp(task: Task) -> Result:
     '''
     Enables and configures SNMP on the device.
-    
+
     Reference configuration:
     /snmp community
     set [ find default=yes ] disabled=yes
@@ -73,48 +133,63 @@ def configure_snmp(task: Task) -> Result:
     /snmp
     set contact={SNMP_CONTACT} enabled=yes location={site}
     '''
-    
-    # Set site as string preceding first '-' in hostname
-    site = str(task.host).split('-')[0]
-
-    task.run(
-        task=routeros_config_item,
-        path='/snmp/community',
-        where={
-            'name': f'{SNMP_COMMUNITY}',
-        },
-        properties={
-            'name': f'{SNMP_COMMUNITY}',
-            'authentication-password': f'{SNMP_COMMUNITY}',
-            'authentication-protocol': 'MD5',
-            'encryption-password': f'{SNMP_COMMUNITY}',
-            'encryption-protocol': 'AES',
-            'security': 'private',
-            'addresses': TRUSTED_ADDRESSES
-        },
-        add_if_missing=True
-    )
-
-    task.run(
-        task=routeros_config_item,
-        path='/snmp',
-        where={},
-        properties={
-            'contact': 'admin@wiaw.net',
-            'enabled': 'yes',
-            'location': site,
-        }
-    )
+    for rule in snmp_rules(task.host):
+        task.run(
+            task=config_item,
+            **rule,
+        )
 
     return Result(
         host=task.host,
         result=f"SNMP enabled and configured on {task.host}",
     )
 
+def remote_logging_rules(host, ros_major_version=None):
+    '''
+    Returns the config_item arguments that enable and configure remote logging.
+    '''
+    rules = [
+        {
+            'name': 'Create logging action',
+            'path': '/system/logging/action',
+            'where': {
+                'name': 'remote',
+            },
+            'properties': {
+                'remote': REMOTE_LOGGING_TARGET,
+                'remote-port': '514',
+                'src-address': f'{host.hostname}',
+                'syslog-facility': 'daemon',
+                'syslog-severity': 'auto',
+                'syslog-time-format': 'bsd-syslog',
+                'target': 'remote',
+            },
+        },
+    ]
+
+    # One remote logging rule per topic
+    for topic in ['critical', 'info', 'error', 'warning']:
+        rules.append({
+            'name': f'Create {topic} logging action',
+            'path': '/system/logging',
+            'where': {
+                'topics': topic,
+                'action': 'remote',
+            },
+            'properties': {
+                'topics': topic,
+                'action': 'remote',
+                'disabled': 'no',
+            },
+            'add_if_missing': True,
+        })
+
+    return rules
+
 def configure_remote_logging(task: Task) -> Result:
     '''
     Enables and configures remote logging on the device.
-    
+
     Reference configuration:
     /system logging action
     set 3 bsd-syslog=no name=remote remote={REMOTE_LOGGING_TARGET} remote-port=514 \
@@ -127,93 +202,59 @@ def configure_remote_logging(task: Task) -> Result:
     add action=remote disabled=no prefix="" topics=error
     add action=remote disabled=no prefix="" topics=warning
     '''
+    for rule in remote_logging_rules(task.host):
+        task.run(
+            task=config_item,
+            **rule,
+        )
 
-    task.run(
-        task=routeros_config_item,
-        name='Create logging action',
-        path='/system/logging/action',
-        where={
-            'name': 'remote',
-        },
-        properties={
-            'remote': REMOTE_LOGGING_TARGET,
-            'remote-port': '514',
-            'src-address': f'{task.host.hostname}',
-            'syslog-facility': 'daemon',
-            'syslog-severity': 'auto',
-            'syslog-time-format': 'bsd-syslog',
-            'target': 'remote',
-        }
-    )
-
-    task.run(
-        task=routeros_config_item,
-        name='Create critical logging action',
-        path='/system/logging',
-        where={
-            'topics': 'critical',
-            'action': 'remote',
-        },
-        properties={
-            'topics': 'critical',
-            'action': 'remote',
-            'disabled': 'no',
-        },
-        add_if_missing=True
-    )
-
-    task.run(
-        task=routeros_config_item,
-        name='Create info logging action',
-        path='/system/logging',
-        where={
-            'topics': 'info',
-            'action': 'remote',
-        },
-        properties={
-            'topics': 'info',
-            'action': 'remote',
-            'disabled': 'no',
-        },
-        add_if_missing=True
+    return Result(
+        host=task.host,
+        result=f"Remote logging enabled and configured on {task.host}",
     )
 
-    task.run(
-        task=routeros_config_item,
-        name='Create error logging action',
-        path='/system/logging',
-        where={
-            'topics': 'error',
-            'action': 'remote',
-        },
-        properties={
-            'topics': 'error',
-            'action': 'remote',
-            'disabled': 'no',
-        },
-        add_if_missing=True
-    )
+def ip_services_rules(host, ros_major_version=None):
+    '''
+    Returns the config_item arguments that configure IP services and their access rules.
+    '''
+    rules = []
+
+    # Disable the unencrypted services
+    for service in ['telnet', 'ftp', 'www']:
+        rules.append({
+            'path': '/ip/service',
+            'where': {
+                'name': service,
+            },
+            'properties': {
+                'disabled': 'yes',
+            },
+        })
+
+    # Allow ssh, api and winbox from the trusted addresses only
+    for service in ['ssh', 'api', 'winbox']:
+        rules.append({
+            'path': '/ip/service',
+            'where': {
+                'name': service,
+            },
+            'properties': {
+                'address': TRUSTED_ADDRESSES,
+                'disabled': 'no',
+            },
+        })
 
-    task.run(
-        task=routeros_config_item,
-        name='Create warning logging action',
-        path='/system/logging',
-        where={
-            'topics': 'warning',
-            'action': 'remote',
+    rules.append({
+        'path': '/ip/service',
+        'where': {
+            'name': 'api-ssl',
         },
-        properties={
-            'topics': 'warning',
-            'action': 'remote',
-            'disabled': 'no',
+        'properties': {
+            'disabled': 'yes',
         },
-        add_if_missing=True
-    )
+    })
 
-    return Result(
-        host=task.host,
-        result=f"Remote logging enabled and configured on {task.host}",
-    )
+    return rules
 
 def configure_ip_services(task: Task) -> Result:
     '''
@@ -229,138 +270,80 @@ def configure_ip_services(task: Task) -> Result:
     set winbox address={TRUSTED_ADDRESSES} disabled=no
     set api-ssl disabled=yes
     '''
+    for rule in ip_services_rules(task.host):
+        task.run(
+            task=config_item,
+            **rule,
+        )
 
-    # Configure telnet
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'telnet',
-        },
-        properties={
-            'disabled': 'yes',
-        },
-    )
-
-    # Configure ftp
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'ftp',
-        },
-        properties={
-            'disabled': 'yes',
-        },
-    )
-
-    # Configure www
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'www',
-        },
-        properties={
-            'disabled': 'yes',
-        },
-    )
-
-    # Configure ssh
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'ssh',
-        },
-        properties={
-            'address': TRUSTED_ADDRESSES,
-            'disabled': 'no',
-        },
+    return Result(
+        host=task.host,
+        result=f"IP services and access rules configured on {task.host}",
     )
 
-    # Configure api
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'api',
-        },
-        properties={
-            'address': TRUSTED_ADDRESSES,
-            'disabled': 'no',
-        },
-    )
+# The baseline stages in the order they run, and the rules each one applies
+BASELINE_STAGES = {
+    'configure_ntp': (configure_ntp, ntp_rules),
+    'configure_snmp': (configure_snmp, snmp_rules),
+    'configure_remote_logging': (configure_remote_logging, remote_logging_rules),
+    'configure_ip_services': (configure_ip_services, ip_services_rules),
+}
 
-    # Configure winbox
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'winbox',
-        },
-        properties={
-            'address': TRUSTED_ADDRESSES,
-            'disabled': 'no',
-        },
-    )
+def run_baseline(nr, gather_facts=True, violations=None):
+    '''
+    Runs the baseline stages against an already initialized and filtered inventory.
+    Set gather_facts to False if get_ros_version has already been run on this inventory.
+    violations optionally limits each stage to the hosts that violate it, as returned by
+    nr_compliance.check_fleet ({host name: {stage name: [violations]}}).
+    '''
+    # Facts are fetched on first use (from the fact cache when it is fresh), so only
+    # the routeros major version is gathered, and only by the tasks that read it.
+    if gather_facts:
+        install_lazy_facts(nr, cache=FactCache())
 
-    # Configure api-ssl
-    task.run(
-        task=routeros_config_item,
-        path='/ip/service',
-        where={
-            'name': 'api-ssl',
-        },
-        properties={
-            'disabled': 'yes',
-        },
-    )
+    # Run tasks
+    for stage_name, (stage, rules) in BASELINE_STAGES.items():
+        stage_nr = nr
+        if violations is not None:
+            stage_nr = nr.filter(filter_func=lambda host: stage_name in violations.get(host.name, {}))
 
-    return Result(
-        host=task.host,
-        result=f"IP services and access rules configured on {task.host}",
-    )
+        stage_nr.run(
+            task=stage,
+        )
 
 def main():
     # initialize Nornir
     nr = InitNornir()
 
-    # Save the first argument passed to the script as a variable called target if sys.argv[1] exists
-    target = sys.argv[1] if len(sys.argv) > 1 else None
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
 
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        pass
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='routeros'))
-        print(f'filtered inventory to {target}')
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
 
-    # Run tasks
-    result = nr.run(
-        task=get_ros_version,
-    )
-    print_result(result)
+    # With --noncompliant, check the stored exports first and only configure what they violate
+    violations = None
+    if '--noncompliant' in sys.argv[2:]:
+        from nr_compliance import check_fleet, print_violations
+        violations = check_fleet(nr)
+        print_violations(violations)
+        nr = nr.filter(filter_func=lambda host: bool(violations.get(host.name)))
 
-    result = nr.run(
-        task=configure_ntp,
-    )
-    print_result(result)
+    # Leave out hosts that don't answer on their management ports
+    nr = prune_unreachable(nr, services=('api',))
 
-    result = nr.run(
-        task=configure_snmp,
-    )
-    print_result(result)
+    # Bound the time each host can take, and stop sending work to hosts that keep failing.
+    # Record the time spent in each task, and print one line per host as tasks finish.
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_routeros_baseline')
+    nr = nr.with_processors([HostGuard(), timing, reporter])
 
-    result = nr.run(
-        task=configure_remote_logging,
-    )
-    print_result(result)
+    run_baseline(nr, violations=violations)
 
-    result = nr.run(
-        task=configure_ip_services,
-    )
-    print_result(result)
+    # Print the summary table and save task timings
+    reporter.print_summary()
+    reporter.close()
+    write_metrics(timing, 'nr_routeros_baseline')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
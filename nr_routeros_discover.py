@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+"""
+This script discovers devices by crawling the IP neighbor tables of the routers, starting
+from the routers of the inventory, and writes the devices that are not in the inventory
+yet as candidate hosts.yaml entries.
+
+The crawl is breadth-first: all routers of one hop are read at the same time (at most
+num_workers at once) over the async RouterOS API, each with a single batch of reads of its
+identity, interface MAC addresses and neighbors.  The neighbors are deduplicated by MAC
+address and identity, so a router seen on several links is one device, and a router is
+never read twice.  Each device gets a group from its platform, version and board
+(DISCOVERY_PLATFORM_GROUPS), and only routeros devices are crawled further, with the
+credentials of the inventory router the crawl started from.  Hosts of groups that aren't
+in groups.yaml are written commented out.
+
+Usage: nr_routeros_discover.py <hostname|all|selectors> [--depth 10] [--workers 100] [--output discovered_hosts.yaml]
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import re
+import sys
+import time
+import config
+from nornir import InitNornir
+from nr_routeros_general import filter_target, command_line_target
+from nr_routeros_async import api_client_for_host
+from nr_logging import setup_logging
+
+# Group assigned to a discovered device, by the first rule whose patterns all match the
+# platform, version and board fields of its neighbor announcement.  SwOS on CRS boards
+# announces the MikroTik platform like RouterOS, with a 1.x or 2.x version.
+DISCOVERY_PLATFORM_GROUPS = getattr(config, 'DISCOVERY_PLATFORM_GROUPS', [
+    ({'platform': r'swos'}, 'swos'),
+    ({'board': r'^css\d'}, 'swos'),
+    ({'platform': r'mikrotik', 'version': r'^[12]\.'}, 'swos'),
+    ({'platform': r'airos|ubiquiti|ubnt'}, 'airos'),
+    ({'platform': r'mikrotik|routeros'}, 'routeros'),
+])
+
+# Hops from the inventory routers, and routers read at the same time
+DISCOVERY_DEPTH = getattr(config, 'DISCOVERY_DEPTH', 10)
+DISCOVERY_WORKERS = getattr(config, 'DISCOVERY_WORKERS', 100)
+
+# The reads sent to each crawled router, by tag
+CRAWL_READS = {
+    'identity': ('/system/identity', None, ['name']),
+    'interfaces': ('/interface', None, ['mac-address']),
+    'neighbors': ('/ip/neighbor', None, ['mac-address', 'address', 'address4', 'identity', 'platform', 'version', 'board', 'interface']),
+}
+
+def normalize_mac(mac):
+    '''
+    Returns a MAC address as 4C:5E:0C:00:00:09, whatever separators it was written with.
+    '''
+    digits = re.sub(r'[^0-9A-Fa-f]', '', mac or '').upper()
+    if len(digits) != 12:
+        return None
+
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+def neighbor_address(neighbor):
+    '''
+    Returns the IPv4 address of a neighbor.  RouterOS 7 has it in address4.
+    '''
+    for key in ('address4', 'address'):
+        address = neighbor.get(key, '')
+        if re.fullmatch(r'\d{1,3}(\.\d{1,3}){3}', address):
+            return address
+
+    return None
+
+def platform_group(platform, version, board):
+    '''
+    Returns the group of a device from its neighbor announcement, or None.
+    '''
+    fields = {'platform': (platform or '').lower(), 'version': (version or '').lower(), 'board': (board or '').lower()}
+    for patterns, group in DISCOVERY_PLATFORM_GROUPS:
+        if all(re.search(pattern, fields[field]) for field, pattern in patterns.items()):
+            return group
+
+    return None
+
+class Discovery:
+    '''
+    The devices found by a crawl, indexed by MAC address, identity and address so each
+    device is only recorded once.
+    '''
+    def __init__(self):
+        self.devices = []
+        self.macs = {}
+        self.identities = {}
+        self.addresses = {}
+
+    def find(self, identity=None, macs=(), address=None):
+        for mac in macs:
+            if mac in self.macs:
+                return self.macs[mac]
+        if identity and identity in self.identities:
+            return self.identities[identity]
+        if address and address in self.addresses:
+            return self.addresses[address]
+
+        return None
+
+    def index(self, device):
+        for mac in device['mac_addresses']:
+            self.macs[mac] = device
+        if device['identity']:
+            self.identities[device['identity']] = device
+        if device['address']:
+            self.addresses[device['address']] = device
+
+    def add(self, identity=None, macs=(), address=None, **fields):
+        '''
+        Returns (device, new) for a device seen with the given identity, MAC addresses and
+        address.  A known device gets the details it was missing.
+        '''
+        macs = {mac for mac in macs if mac}
+        device = self.find(identity, macs, address)
+        new = device is None
+
+        if new:
+            device = {
+                'identity': identity,
+                'address': address,
+                'mac_addresses': set(),
+                'platform': '',
+                'version': '',
+                'board': '',
+                'group': None,
+                'depth': None,
+                'seed': None,
+                'seen_from': None,
+                'in_inventory': False,
+                'crawled': False,
+                'error': None,
+            }
+            self.devices.append(device)
+
+        device['mac_addresses'] |= macs
+        device['identity'] = device['identity'] or identity
+        device['address'] = device['address'] or address
+        for key, value in fields.items():
+            if value and not device.get(key):
+                device[key] = value
+
+        self.index(device)
+        return device, new
+
+async def crawl_router(device, client_factory, semaphore):
+    '''
+    Reads the identity, interface MAC addresses and neighbors of a router in one batch.
+    '''
+    async with semaphore:
+        async with client_factory(device['address'], device['seed']) as api:
+            return await api.batch(CRAWL_READS)
+
+async def crawl(discovery, seeds, client_factory=None, depth=DISCOVERY_DEPTH, num_workers=DISCOVERY_WORKERS):
+    '''
+    Crawls the neighbor tables breadth-first from the seed devices, adding every device
+    found to discovery.  Routeros devices up to depth hops from a seed are crawled.
+    '''
+    client_factory = client_factory or api_client_for_address
+    semaphore = asyncio.Semaphore(num_workers)
+
+    frontier = seeds
+    for hop in range(depth + 1):
+        frontier = [device for device in frontier if not device['crawled'] and device['address']]
+        if not frontier:
+            break
+
+        for device in frontier:
+            device['crawled'] = True
+
+        replies = await asyncio.gather(
+            *[crawl_router(device, client_factory, semaphore) for device in frontier],
+            return_exceptions=True,
+        )
+
+        next_frontier = []
+        for device, reply in zip(frontier, replies):
+            if isinstance(reply, Exception):
+                device['error'] = f'{type(reply).__name__}: {reply}'
+                logging.warning('Failed to crawl %s: %s', device['address'], device['error'], extra={'host': device['identity']})
+                continue
+
+            # The router's own identity and MAC addresses, so its neighbors don't report it as new
+            identity = reply['identity'][0].get('name') if reply['identity'] else None
+            if identity:
+                device['identity'] = device['identity'] or identity
+                discovery.identities[identity] = device
+            device['mac_addresses'] |= {normalize_mac(item.get('mac-address')) for item in reply['interfaces']} - {None}
+            discovery.index(device)
+
+            for neighbor in reply['neighbors']:
+                neighbor_device, new = discovery.add(
+                    identity=neighbor.get('identity') or None,
+                    macs=[normalize_mac(neighbor.get('mac-address'))],
+                    address=neighbor_address(neighbor),
+                    platform=neighbor.get('platform'),
+                    version=neighbor.get('version'),
+                    board=neighbor.get('board'),
+                )
+                if not new:
+                    continue
+
+                neighbor_device['group'] = platform_group(neighbor_device['platform'], neighbor_device['version'], neighbor_device['board'])
+                neighbor_device['depth'] = hop + 1
+                neighbor_device['seed'] = device['seed']
+                neighbor_device['seen_from'] = device['identity'] or device['address']
+                if neighbor_device['group'] == 'routeros' and hop < depth:
+                    next_frontier.append(neighbor_device)
+
+        logging.info('Crawled hop %d: %d routers, %d devices known', hop, len(frontier), len(discovery.devices))
+        frontier = next_frontier
+
+    return discovery
+
+def api_client_for_address(address, seed):
+    '''
+    Builds an AsyncRouterOsApi for a discovered router, with the credentials and API
+    settings of the inventory router the crawl started from.
+    '''
+    api = api_client_for_host(seed)
+    api.hostname = address
+    return api
+
+def discover(nr, client_factory=None, depth=DISCOVERY_DEPTH, num_workers=DISCOVERY_WORKERS):
+    '''
+    Crawls from every router of the inventory and returns the Discovery.  Devices that are in
+    the inventory (by name, identity or address) have in_inventory set.
+    '''
+    discovery = Discovery()
+
+    seeds = []
+    for host in nr.inventory.hosts.values():
+        device, new = discovery.add(identity=host.name, address=host.hostname)
+        device.update({'group': 'routeros', 'depth': 0, 'seed': host, 'in_inventory': True})
+        seeds.append(device)
+
+    asyncio.run(crawl(discovery, seeds, client_factory=client_factory, depth=depth, num_workers=num_workers))
+
+    return discovery
+
+def candidate_name(device):
+    '''
+    Returns the inventory name of a discovered device: its identity, or its MAC address.
+    '''
+    if device['identity']:
+        return re.sub(r'[^\w.-]+', '-', device['identity']).strip('-')
+
+    return 'mac-' + sorted(device['mac_addresses'])[0].replace(':', '').lower()
+
+def candidate_hosts(discovery, inventory_hosts):
+    '''
+    Returns {name: host entry} of the discovered devices that have an address and a group
+    and are not in the inventory yet.
+    '''
+    inventory_addresses = {host.hostname for host in inventory_hosts.values()}
+
+    candidates = {}
+    for device in discovery.devices:
+        if device['in_inventory'] or not device['address'] or device['group'] is None:
+            continue
+
+        name = candidate_name(device)
+        if name in inventory_hosts or device['address'] in inventory_addresses:
+            continue
+
+        candidates[name] = {
+            'hostname': device['address'],
+            'groups': [device['group']],
+            'data': {
+                'mac_address': sorted(device['mac_addresses'])[0] if device['mac_addresses'] else '',
+                'platform': device['platform'],
+                'version': device['version'],
+                'board': device['board'],
+                'discovered_from': device['seen_from'],
+            },
+        }
+
+    return candidates
+
+def write_candidates(candidates, path, groups=None):
+    '''
+    Writes candidate hosts in the hosts.yaml format.  Strings are written as JSON strings,
+    which YAML reads as double quoted scalars.  Hosts of a group that isn't in groups (the
+    inventory's groups) are written commented out, since InitNornir refuses unknown groups.
+    '''
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    with open(path, 'w') as f:
+        f.write(f'# Discovered by nr_routeros_discover.py at {now}.  Review, add credentials, and copy to hosts.yaml.\n---\n')
+        for name, entry in sorted(candidates.items()):
+            unknown = [group for group in entry['groups'] if groups is not None and group not in groups]
+            prefix = '# ' if unknown else ''
+            if unknown:
+                f.write(f'# {name}: group {", ".join(unknown)} is not in groups.yaml, add it there to use this host\n')
+
+            f.write(f'{prefix}{name}:\n')
+            f.write(f'{prefix}  hostname: {json.dumps(entry["hostname"])}\n')
+            f.write(f'{prefix}  groups:\n')
+            for group in entry['groups']:
+                f.write(f'{prefix}    - {group}\n')
+            f.write(f'{prefix}  data:\n')
+            for key, value in entry['data'].items():
+                f.write(f'{prefix}    {key}: {json.dumps(value)}\n')
+            f.write('\n')
+
+def option(name, default):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+def main():
+    setup_logging('nr_routeros_discover')
+
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    seeds = filter_target(nr, target)
+
+    started = time.perf_counter()
+    discovery = discover(
+        seeds,
+        depth=int(option('--depth', DISCOVERY_DEPTH)),
+        num_workers=int(option('--workers', DISCOVERY_WORKERS)),
+    )
+
+    # The whole inventory, not only the seeds, decides which devices are new
+    candidates = candidate_hosts(discovery, nr.inventory.hosts)
+    output = option('--output', 'discovered_hosts.yaml')
+    write_candidates(candidates, output, groups=nr.inventory.groups)
+
+    # Print a summary of the crawl
+    crawled = [device for device in discovery.devices if device['crawled']]
+    failed = [device for device in crawled if device['error']]
+    for device in failed:
+        print(f'- {device["identity"] or device["address"]}: {device["error"]}')
+
+    groups = {}
+    for entry in candidates.values():
+        groups[entry['groups'][0]] = groups.get(entry['groups'][0], 0) + 1
+    unknown = sum(1 for device in discovery.devices if device['group'] is None)
+    commented = sum(count for group, count in groups.items() if group not in nr.inventory.groups)
+
+    print(f'== discovery: {len(discovery.devices)} devices, {len(crawled)} routers crawled ({len(failed)} failed), '
+          f'{unknown} with an unknown platform, in {time.perf_counter() - started:.1f}s')
+    print(f'== {len(candidates)} new hosts ({", ".join(f"{count} {group}" for group, count in sorted(groups.items())) or "none"}) written to {output}'
+          f'{f", {commented} commented out (group not in groups.yaml)" if commented else ""}')
+
+if __name__ == "__main__":
+    main()
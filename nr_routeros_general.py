@@ -1,39 +1,177 @@
 #!/bin/bash
 from nornir_routeros.plugins.tasks import *
 from nornir.core.task import Task, Result
+import os
+import signal
 import subprocess
+import time
 from config import *
 from nornir.core.filter import F
-
-def ssh_command(task, command) -> Result:
+from nr_routeros_rest import CONNECTION_NAME as REST_CONNECTION_NAME, routeros_rest_config_item
+from nr_budget import find_guard, transport_timeout, SSH_TIMEOUT, SSH_CONNECT_TIMEOUT
+from nr_metrics import TRANSPORT_METRICS
+from nr_host_records import Interface, IpAddress, compact
+from nr_inventory_index import filter_target, command_line_target, site_from_name, role_from_name
+
+# Options for reusing a single SSH connection per device across all commands in a run
+SSH_CONTROL_OPTIONS = '-o ControlMaster=auto -o ControlPath=/tmp/nr-ssh-%r@%h:%p -o ControlPersist=120'
+
+# Properties read for each item of the fact tasks.  Only these are sent by the router.
+# Interfaces and IP addresses are kept as compact records of these properties (nr_host_records).
+RESOURCE_FIELDS = ['version', 'board-name']
+INTERFACE_FIELDS = list(Interface.FIELDS)
+IP_ADDRESS_FIELDS = list(IpAddress.FIELDS)
+
+def ssh_command(task, command, timeout=None) -> Result:
     '''
     Runs a command on the device using the systems's SSH command and returns the output of the command as result.
-    Connect using subprocess.run and SSH.
+    Connect using subprocess and SSH.  The connection is kept open by an SSH control master,
+    so later commands to the same device in the same run skip the connection setup.
+    The command is killed after timeout seconds (SSH_TIMEOUT, or less if the host's time budget is almost used up).
     '''
+    timeout = transport_timeout(find_guard(task.nornir), task.host.name, timeout or SSH_TIMEOUT)
+
     username = task.host.username
     password = task.host.password
 
     # Generate the full command to run on the device
-    full_command = f'sshpass -p {password} ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null {username}@{task.host.hostname} "{command}" '
+    full_command = f'sshpass -p {password} ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null {SSH_CONTROL_OPTIONS} -o ConnectTimeout={SSH_CONNECT_TIMEOUT} {username}@{task.host.hostname} "{command}" '
 
-    # Run the command and save the output to result
-    result = subprocess.run(
+    # Run the command and save the output to result.  It runs in its own session,
+    # so the shell, sshpass and ssh can be killed together on timeout.
+    process = subprocess.Popen(
         full_command,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=True,
-        shell=True)
+        shell=True,
+        start_new_session=True)
+
+    started = time.perf_counter()
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        TRANSPORT_METRICS.record(task.host.hostname, 'ssh', bytes_sent=len(command), error=True)
+        raise
+
+    TRANSPORT_METRICS.record(
+        task.host.hostname,
+        'ssh',
+        bytes_sent=len(command),
+        bytes_received=len(stdout) + len(stderr),
+        rtt=time.perf_counter() - started,
+        error=process.returncode != 0,
+    )
+
+    # sshpass exits with 5 when the password is refused
+    if process.returncode == 5:
+        TRANSPORT_METRICS.auth_failure(task.host.hostname, 'ssh')
 
     # Return the result
-    return Result(host=task.host, result=result.stdout)
+    return Result(host=task.host, result=stdout)
+
+def get_transport(host):
+    '''
+    Returns the transport used to manage the host: 'api' (binary API, the default) or 'rest'.
+    Set with the transport key in the host's (or its groups') data.
+    '''
+    return host.get('transport', 'api')
+
+def routeros_read(task: Task, path, proplist=None, query=None) -> Result:
+    '''
+    Reads the items of a menu like routeros_get, but lets the router do the filtering.
+    proplist is a list of the properties to return (.proplist), and query is a dictionary of
+    property values the returned items must match (?property=value).
+    '''
+    if get_transport(task.host) == 'rest':
+        rest = task.host.get_connection(REST_CONNECTION_NAME, task.nornir.config)
+        items = rest.get(path, query=query, proplist=proplist)
+    else:
+        api = task.host.get_connection('routerosapi', task.nornir.config)
+
+        # The routeros_api library adds the leading dot to proplist.  It doesn't expose
+        # byte counts, so only requests and round trip times are recorded.
+        arguments = {'proplist': ','.join(proplist)} if proplist else {}
+        started = time.perf_counter()
+        items = api.get_resource(path).call('print', arguments, query or {})
+        TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', rtt=time.perf_counter() - started)
+
+    return Result(
+        host=task.host,
+        result=items,
+    )
+
+def routeros_batch_read(task: Task, reads) -> Result:
+    '''
+    Reads several menus over the host's shared binary API connection in one round trip
+    window: every print is sent with its own tag before any reply is read.
+    reads is a {name: (path, query, proplist)} dictionary.  Returns {name: [items]}.
+    '''
+    api = task.host.get_connection('routerosapi', task.nornir.config)
+
+    started = time.perf_counter()
+    promises = {
+        name: api.get_resource(path).call_async('print', {'proplist': ','.join(proplist)} if proplist else {}, query or {})
+        for name, (path, query, proplist) in reads.items()
+    }
+    items = {name: list(promise.get()) for name, promise in promises.items()}
+    TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', rtt=time.perf_counter() - started, requests=len(reads))
+
+    return Result(
+        host=task.host,
+        result=items,
+    )
+
+def config_item(task: Task, path, where, properties, add_if_missing=False) -> Result:
+    '''
+    Configures an item like routeros_config_item, over the host's transport (binary API or REST).
+    '''
+    if get_transport(task.host) == 'rest':
+        return routeros_rest_config_item(task, path=path, where=where, properties=properties, add_if_missing=add_if_missing)
+
+    # routeros_config_item reads the item, and when it changes it, sets or adds it and reads it
+    # back.  Like routeros_read, only requests and round trip times are recorded.
+    started = time.perf_counter()
+    try:
+        result = routeros_config_item(task, path=path, where=where, properties=properties, add_if_missing=add_if_missing)
+    except Exception:
+        TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', error=True)
+        raise
+    requests = 3 if result.changed and not task.is_dry_run() else 1
+    rtt = (time.perf_counter() - started) / requests
+    for _ in range(requests):
+        TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', rtt=rtt)
+
+    return result
+
+def run_command(task: Task, path, command, **kwargs) -> Result:
+    '''
+    Runs a command like routeros_command, over the host's transport (binary API or REST).
+    '''
+    if get_transport(task.host) == 'rest':
+        rest = task.host.get_connection(REST_CONNECTION_NAME, task.nornir.config)
+        return Result(host=task.host, result=rest.command(path, command, **kwargs))
+
+    started = time.perf_counter()
+    try:
+        result = routeros_command(task, path=path, command=command, **kwargs)
+    except Exception:
+        TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', error=True)
+        raise
+    TRANSPORT_METRICS.record(task.host.hostname, 'routeros_api', rtt=time.perf_counter() - started)
+
+    return result
 
 def get_ros_version(task: Task) -> Result:
     '''
     Returns the version of the routeros software running on the device.
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/system/resource',
+        proplist=['version'],
     )
 
     # Parse the result to get the version (full and major)
@@ -52,11 +190,12 @@ def get_hardware(task: Task) -> Result:
     Returns the hardware type of the router (the board-name).
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/system/resource',
+        proplist=['board-name'],
     )
 
-    # Parse the result to get the version (full and major)
+    # Parse the result to get the hardware type
     hardware = result.result[0]['board-name']
 
     # Set the host.data dictionary to include the hardware type
@@ -67,17 +206,20 @@ def get_hardware(task: Task) -> Result:
         result=hardware,
     )
 
-def get_interfaces(task: Task) -> Result:
+def get_interfaces(task: Task, query=None) -> Result:
     '''
-    Returns the interfaces of the router.
+    Returns the interfaces of the router.  Only the properties in INTERFACE_FIELDS are read.
+    query optionally limits the interfaces read, for example {'type': 'ether'}.
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/interface',
+        proplist=INTERFACE_FIELDS,
+        query=query,
     )
 
-    # Parse the result to get the interfaces
-    interfaces = result.result
+    # Parse the result to get the interfaces, as compact records
+    interfaces = compact('interfaces', result.result)
 
     # Set the host.data dictionary to include the interfaces
     task.host.data['interfaces'] = interfaces
@@ -91,11 +233,11 @@ def get_site(task: Task) -> Result:
     '''
     Set the site in the host's data based on the name of the host.
     '''
-    # Get the name of the host
-    hostname = task.host.name
-
-    # Get the site (everything preceding the first dash)
-    site = hostname.split('-')[0]
+    # Get the site (everything preceding the first dash), unless the inventory index already set it
+    if 'site' in task.host.data:
+        site = task.host.data['site']
+    else:
+        site = site_from_name(task.host.name)
 
     #Set the host.data dictionary to include the site
     task.host.data['site'] = site
@@ -109,16 +251,15 @@ def get_role(task: Task) -> Result:
     '''
     Returns the role of the router (based on the name of the device).
     '''
+    # Get the role (everything after the first dash without the host index), unless the inventory index already set it
+    if 'role' in task.host.data:
+        role = task.host.data['role']
+    else:
+        role = role_from_name(task.host.name)
 
-    # Get the name of the host
-    hostname = task.host.name
+    if role is None:
+        raise ValueError(f'cannot get the role from the name of {task.host.name}')
 
-    # Get the role (everything after the first dash and before the second dash)
-    role = hostname.split('-')[1].split('-')[0]
-
-    # Remove any trailing number characters from the role (host index)
-    role = role.rstrip('0123456789')
-    
     # Set the host.data dictionary to include the role
     task.host.data['role'] = role
 
@@ -132,8 +273,9 @@ def get_serial(task: Task) -> Result:
     Get the serial number of the device.
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/system/routerboard',
+        proplist=['serial-number'],
     )
 
     # Parse the result to get the serial number
@@ -149,15 +291,16 @@ def get_serial(task: Task) -> Result:
 
 def get_ip_addresses(task: Task) -> Result:
     '''
-    Get the IP addresses of the device.
+    Get the IP addresses of the device.  Only the properties in IP_ADDRESS_FIELDS are read.
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/ip/address',
+        proplist=IP_ADDRESS_FIELDS,
     )
 
-    # Parse the result to get the IP addresses
-    ip_addresses = result.result
+    # Parse the result to get the IP addresses, as compact records
+    ip_addresses = compact('ip_addresses', result.result)
 
     # Set the host.data dictionary to include the IP addresses
     task.host.data['ip_addresses'] = ip_addresses
@@ -167,13 +310,15 @@ def get_ip_addresses(task: Task) -> Result:
         result=ip_addresses,
     )
 
-def get_vlans(task: Task) -> Result:
+def get_vlans(task: Task, proplist=None, query=None) -> Result:
     '''
-    Get the VLANs of the device.
+    Get the VLANs of the device.  proplist and query optionally limit the properties and VLANs read.
     '''
     result = task.run(
-        task=routeros_get,
+        task=routeros_read,
         path='/interface/vlan',
+        proplist=proplist,
+        query=query,
     )
 
     # Parse the result to get the VLANs
@@ -189,15 +334,20 @@ def get_vlans(task: Task) -> Result:
 
 def get_config(task: Task) -> Result:
     '''
-    Returns the configuration of the device.
+    Returns the configuration of the device.  Hosts using the REST transport export over
+    HTTPS instead of SSH.
     '''
-    result = task.run(
-        task=ssh_command,
-        command='/export verbose'
-    )
-
-    # Parse the result to get the config
-    config = result.result
+    if get_transport(task.host) == 'rest':
+        rest = task.host.get_connection(REST_CONNECTION_NAME, task.nornir.config)
+        config = rest.execute('/export verbose')
+    else:
+        result = task.run(
+            task=ssh_command,
+            command='/export verbose'
+        )
+
+        # Parse the result to get the config
+        config = result.result
 
     # Remove lines that start with '#'
     config = '\n'.join([line for line in config.split('\n') if not line.startswith('#')])
@@ -6,11 +6,16 @@ saves it to a git repository, makes a commit, and pushes the changes to the remo
 import sys
 from nornir import InitNornir
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
 from nornir_routeros.plugins.tasks import *
 import subprocess
 from config import *
 from nr_routeros_general import *
+from nr_reachability import prune_unreachable
+from nr_budget import HostGuard
+from nr_metrics import TimingProcessor, write_metrics
+from nr_report import StreamReporter
+from nr_config_index import update_config_index
+from nr_config_diff import diff_exports, summarize
 import datetime
 
 def find_config_and_commit(task: Task) -> Result:
@@ -21,10 +26,9 @@ def find_config_and_commit(task: Task) -> Result:
     '''
     # Get the config.  If the config is None or empty, return an error.
     try:
-        result = task.run(
+        task.run(
             task=get_config,
         )
-        print_result(result)
 
         config = task.host.data['config']
 
@@ -49,9 +53,11 @@ def find_config_and_commit(task: Task) -> Result:
     except FileNotFoundError:
         old_config = ''
 
-    # Compare the new config with the old config. If they are different, move the new config to the CONFIGS_DIR directory
-    # and make a commit.
-    if config != old_config:
+    # Compare the new config with the old config. If they differ in more than the volatile lines (the export
+    # timestamp) or the order of items, move the new config to the CONFIGS_DIR directory and make a commit.
+    changes = diff_exports(old_config, config) if config != old_config else []
+    changed = bool(changes)
+    if changed:
         # Get current date and time in a readable format
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -59,11 +65,15 @@ def find_config_and_commit(task: Task) -> Result:
         subprocess.run(f'mv {CONFIGS_DIR}/staging/{task.host.name}.rsc {CONFIGS_DIR}/{task.host.name}.rsc', shell=True)
 
         # Make a commit
-        subprocess.run(f'cd {CONFIGS_DIR} && git add {task.host.name}.rsc && git commit -m "config updated on {task.host.name} at {now}"', shell=True)
+        subprocess.run(f'cd {CONFIGS_DIR} && git add {task.host.name}.rsc && git commit -m "config updated on {task.host.name} at {now}: {summarize(changes)}"', shell=True)
+
+    # The config is saved, don't keep it in memory for the rest of the run
+    del task.host.data['config']
 
     return Result(
         host=task.host,
         result=f'Successfully committed config for {task.host.name}',
+        changed=changed,
     )
 
 def push_config():
@@ -72,34 +82,30 @@ def push_config():
     '''
     subprocess.run(f'cd {CONFIGS_DIR} && git push origin master', shell=True)
 
-def main():
-    # initialize Nornir
-    nr = InitNornir()
-
-    # Save the first argument passed to the script as a variable called target if sys.argv[1] exists
-    target = sys.argv[1] if len(sys.argv) > 1 else None
-
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        nr = nr.filter(F(groups__contains='routeros'))
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='routeros'))
-        print(f'filtered inventory to {target}')
-
+def run_get_config(nr, gather_facts=True):
+    '''
+    Runs the config backup stages against an already initialized and filtered inventory.
+    Set gather_facts to False if get_ros_version has already been run on this inventory.
+    '''
     # Run tasks
-    ros_version_result = nr.run(
-        task=get_ros_version,
-    )
-    print_result(ros_version_result)
+    if gather_facts:
+        nr.run(
+            task=get_ros_version,
+        )
 
     config_result = nr.run(
         task=find_config_and_commit,
     )
-    print_result(config_result)
 
     # Print a bulleted list of hosts for which tasks failed
-    for host in ros_version_result.failed_hosts:
-        print(f'- {host}: failed to connect or get ROS version')
+    for host in config_result.failed_hosts:
+        print(f'- {host}: failed to connect or get config')
+
+    # Update the search index for the configs that were committed
+    changed_hosts = [host for host, multi_result in config_result.items() if multi_result.changed]
+    if changed_hosts:
+        update_config_index(changed_hosts)
+        print(f'config index updated for {len(changed_hosts)} hosts')
 
     # Push config to remote repository
     try:
@@ -108,5 +114,31 @@ def main():
     except Exception as e:
         print(f'failed to push config: {e}')
 
+def main():
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    # Leave out hosts that don't answer on their management ports
+    nr = prune_unreachable(nr, services=('api', 'ssh'))
+
+    # Bound the time each host can take, and stop sending work to hosts that keep failing.
+    # Record the time spent in each task, and print one line per host as tasks finish.
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_routeros_get_config')
+    nr = nr.with_processors([HostGuard(), timing, reporter])
+
+    run_get_config(nr)
+
+    # Print the summary table and save task timings
+    reporter.print_summary()
+    reporter.close()
+    write_metrics(timing, 'nr_routeros_get_config')
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,25 +6,20 @@ from cgi import print_arguments
 import sys
 from nornir import InitNornir
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
 from nornir_routeros.plugins.tasks import *
 from nr_routeros_general import *
+from nr_report import StreamReporter
 from shlex import shlex
+from nr_logging import setup_logging
+from nr_host_records import Neighbor
 import logging
 import json
 
-logging.basicConfig(filename='logs/nr_mikrotik_get_neighbors.py', level=logging.DEBUG)
+setup_logging('nr_mikrotik_get_neighbors')
 
-NEIGHBOR_ESSENTIAL_FIELDS = [
-    'mac-address',
-    'address',
-    'identity',
-    'platform',
-    'version',
-    'board',
-    'neighbor-of',
-    'interface',
-]
+# The neighbor properties that are kept, as compact Neighbor records:
+# mac-address, address, identity, platform, version, board, neighbor-of, interface
+NEIGHBOR_ESSENTIAL_FIELDS = list(Neighbor.FIELDS)
 
 def parse_key_value_pairs(text):
     '''
@@ -38,13 +33,13 @@ def parse_key_value_pairs(text):
     return_dict = {}
 
     for key_value_pair in lexer:
-        logging.debug(f'Processing key_value_pair: {key_value_pair}')
+        logging.debug('Processing key_value_pair: %s', key_value_pair)
 
         try:
             key, value = key_value_pair.split('=', 1)
             return_dict[key] = value
         except:
-            logging.error(f'Error parsing key_value_pair: {key_value_pair}')
+            logging.error('Error parsing key_value_pair: %s', key_value_pair)
             pass
 
     return return_dict
@@ -67,7 +62,7 @@ def parse_neighbors_to_dict(neighbors, neighbor_of=None):
             continue
 
         # Debug neighbor_entry
-        logging.info(f'Processing neighbor_entry on {neighbor_of}: {neighbor_entry}')
+        logging.debug('Processing neighbor_entry: %s', neighbor_entry, extra={'host': neighbor_of})
 
         # Remove preceding space
         neighbor_entry = neighbor_entry.lstrip()
@@ -94,8 +89,8 @@ def parse_neighbors_to_dict(neighbors, neighbor_of=None):
             if field not in neighbor_dict.keys():
                 neighbor_dict[field] = ''
 
-        # Add this neighbor_dict to the neighbors_dict, indexed by the address
-        neighbors_dict[neighbor_dict['address']] = neighbor_dict
+        # Add this neighbor to the neighbors_dict as a compact record, indexed by the address
+        neighbors_dict[neighbor_dict['address']] = Neighbor(neighbor_dict)
 
     return neighbors_dict
 
@@ -107,7 +102,6 @@ def get_neighbors(task: Task) -> Result:
         task=ssh_command,
         command='/ip neighbor print detail without-paging'
     )
-    print_result(result)
 
     # Parse the result to get the neighbors
     neighbors = result.result
@@ -124,20 +118,22 @@ def main():
     # initialize Nornir
     nr = InitNornir()
 
-    # Save the first argument passed to the script as a variable called target
-    target = sys.argv[1]
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
 
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        pass
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='routeros'))
-        print(f'filtered inventory to {target}')
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    # Print one line per host as the neighbors are read, full results go to the reports directory
+    reporter = StreamReporter('nr_routeros_get_neighbors')
+    nr = nr.with_processors([reporter])
 
     # Run tasks
     result = nr.run(
         task=get_neighbors,
     )
+    reporter.print_summary()
+    reporter.close()
 
     # Define an all_neighbors dictionary
     all_neighbors = {}
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+This script runs several routeros workflows in one process, sharing a single Nornir
+inventory, the open API and SSH connections to each device, and the gathered host facts.
+
+Usage: nr_routeros_nightly.py <hostname|all|selectors> [job ...]
+Jobs run in the order given.  If no jobs are given, all jobs in JOBS are run.
+"""
+
+import sys
+from nornir import InitNornir
+from nr_routeros_general import *
+from nr_reachability import prune_unreachable
+from nr_budget import HostGuard
+from nr_metrics import TimingProcessor, write_metrics
+from nr_report import StreamReporter
+from nr_logging import setup_logging
+from nr_fact_cache import get_cached_ros_version
+from nr_routeros_get_config import run_get_config
+from nr_routeros_baseline import run_baseline
+from nr_routeros_pull_to_nautobot import run_pull_to_nautobot
+
+# Available jobs, in the order they run by default, and the arguments they run with.
+# run_jobs gathers the routeros version first, so the jobs that would gather it skip it.
+JOBS = {
+    'get_config': (run_get_config, {'gather_facts': False}),
+    'baseline': (run_baseline, {'gather_facts': False}),
+    'pull_to_nautobot': (run_pull_to_nautobot, {}),
+}
+
+def run_jobs(nr, jobs):
+    '''
+    Gathers the routeros version once, then runs each job against the same inventory.
+    Connections opened by the first job are reused by the following jobs.  Each job starts
+    with every host again and with its own HostGuard, like a separate run of its script.
+    '''
+    # Gather facts shared by all jobs, reading them from the fact cache when they are fresh
+    facts_result = nr.run(
+        task=get_cached_ros_version,
+    )
+
+    # Run each job, skipping the fact gathering already done above
+    for job in jobs:
+        print(f'running job {job}')
+
+        # Hosts that failed the previous job, or used up its budget, get a new chance.
+        # Hosts whose routeros version couldn't be read stay skipped.
+        nr.data.reset_failed_hosts()
+        nr.data.failed_hosts.update(facts_result.failed_hosts)
+        job_nr = nr.with_processors([HostGuard() if isinstance(processor, HostGuard) else processor for processor in nr.processors])
+
+        run_job, arguments = JOBS[job]
+        run_job(job_nr, **arguments)
+
+def main():
+    setup_logging('nr_routeros_nightly')
+
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+
+    # Any remaining arguments are the jobs to run
+    jobs = [arg for arg in sys.argv[2:] if '=' not in arg] or list(JOBS.keys())
+    for job in jobs:
+        if job not in JOBS:
+            print(f'unknown job {job}, choose from: {", ".join(JOBS.keys())}')
+            sys.exit(1)
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    # Leave out hosts that don't answer on their management ports
+    nr = prune_unreachable(nr, services=('api', 'ssh'))
+
+    # Bound the time each host can take, and stop sending work to hosts that keep failing.
+    # Record the time spent in each task, and print one line per host as tasks finish.
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_routeros_nightly')
+    nr = nr.with_processors([HostGuard(), timing, reporter])
+
+    # Run the jobs and close all connections at the end of the run
+    try:
+        run_jobs(nr, jobs)
+    finally:
+        nr.close_connections()
+        reporter.print_summary()
+        reporter.close()
+        write_metrics(timing, 'nr_routeros_nightly')
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,33 @@
 #!/usr/bin/python3
 """
 This script gets device info and saves it to Nautobot.
+Only hosts whose data changed since their last sync are pushed; add --full to push everything.
+
+Usage: nr_routeros_pull_to_nautobot.py <hostname|all|selectors> [--full]
 """
 
 from ast import Num
 import sys
 from nornir import InitNornir
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
 from nornir_routeros.plugins.tasks import *
 from config import *
 from nr_routeros_general import *
+from nr_reachability import prune_unreachable
+from nr_budget import HostGuard, find_guard, check_deadline
+from nr_metrics import TimingProcessor, write_metrics, instrument_nautobot
+from nr_report import StreamReporter
+from nr_routeros_async import get_facts_batched
 from pynautobot import api
+from nr_logging import setup_logging
+from nr_nautobot_graphql import get_nb_devices, nb_changes
+from nr_host_records import release_host_data
+from nr_sync_state import SyncState, SYNC_CLASSES, host_hashes
+import ipaddress
 import logging
 
-logging.basicConfig(filename='logs/nr_pull_to_nautobot.log', level=logging.DEBUG)
+# Prefixes looked up per Nautobot request by sync_nb_prefixes
+NB_FILTER_BATCH = 50
 
 def translate_mt_interface_type(interface):
     '''
@@ -42,21 +55,22 @@ def translate_mt_interface_type(interface):
 def get_mikrotik_info(task: Task) -> Result:
     '''
     Gets routeros version, hardware, interfaces, and site from the device by calling other functions.
+    The device facts are read together in one batch of pipelined API requests.
     '''
-    # Get the routeros version
-    routeros_version_result = task.run(
-        task=get_ros_version,
-    )
-
-    # Get the hardware type
-    hardware_result = task.run(
-        task=get_hardware,
-    )
-
-    # Get the interfaces
-    interfaces_result = task.run(
-        task=get_interfaces,
-    )
+    # Get the routeros version, hardware type, serial number, interfaces and IP addresses.
+    # REST hosts read them one by one over their pooled keep-alive connection.
+    if get_transport(task.host) == 'rest':
+        facts_result = task.run(
+            task=get_ros_version,
+        )
+        for fact_task in [get_hardware, get_serial, get_interfaces, get_ip_addresses]:
+            task.run(
+                task=fact_task,
+            )
+    else:
+        facts_result = task.run(
+            task=get_facts_batched,
+        )
 
     # Get the site
     site_result = task.run(
@@ -68,23 +82,13 @@ def get_mikrotik_info(task: Task) -> Result:
         task=get_role,
     )
 
-    # Get the serial number
-    serial_result = task.run(
-        task=get_serial,
-    )
-
-    # Get the IP addresses
-    ip_addresses_result = task.run(
-        task=get_ip_addresses,
-    )
-
     # Create a string summary of the info gathered
-    summary = f'''RouterOS version: {routeros_version_result.result}
-    Hardware: {hardware_result.result}
+    summary = f'''RouterOS version: {facts_result.result}
+    Hardware: {task.host.data['hardware']}
     Interfaces: gathered
     Site: {site_result.result}
     Role: {role_result.result}
-    Serial: {serial_result.result}
+    Serial: {task.host.data['serial']}
     IP Addresses: gathered'''
 
     return Result(
@@ -92,53 +96,51 @@ def get_mikrotik_info(task: Task) -> Result:
         result=summary,
     )
 
-def create_nb_site(task: Task, nautobot: api) -> Result:
+def fleet_values(nr, key):
     '''
-    Create a site in Nautobot based on the site name in the host's data.
+    Returns the sorted distinct values of host.data[key] of every host that hasn't failed.
     '''
-    # Get the site name from the host's data
-    site = task.host.data['site']
+    return sorted({
+        host.data[key] for host in nr.inventory.hosts.values()
+        if host.name not in nr.data.failed_hosts and key in host.data
+    })
 
-    # Check if the site already exists in Nautobot
-    nb_site = nautobot.dcim.sites.get(name=site)
+def create_missing_nb_objects(endpoint, field, values, **fields):
+    '''
+    Creates the objects of a Nautobot endpoint whose field has one of values and that don't
+    exist yet, with the other fields given.  Existing objects are looked up NB_FILTER_BATCH
+    per request, and the missing ones are created in one request.  Returns the number created.
+    '''
+    existing = set()
+    for start in range(0, len(values), NB_FILTER_BATCH):
+        for record in endpoint.filter(**{field: values[start:start + NB_FILTER_BATCH]}):
+            existing.add(getattr(record, field))
 
-    # Create the site in Nautobot if it doesn't exist
-    if not nb_site:
-        nautobot.dcim.sites.create(
-            name=site,
-            status='active',
-        )
+    to_create = [{field: value, **fields} for value in values if value not in existing]
+    if to_create:
+        endpoint.create(to_create)
 
-    return Result(
-        host=task.host,
-        result=f'id: {nb_site.id}',
-    )
+    return len(to_create)
 
-def create_nb_device_type(task: Task, nautobot: api) -> Result:
+def sync_nb_sites(nr, nautobot: api):
     '''
-    Create a device type in Nautobot based on the hardware type in the host's data.
+    Creates the sites of the whole fleet (the site in each host's data) in Nautobot.  Runs once
+    for the inventory before the per-host stages, so hosts of the same site don't race each
+    other to create it.  Returns the number of sites created.
     '''
-    # Get the hardware type from the host's data
-    hardware = task.host.data['hardware']
+    return create_missing_nb_objects(nautobot.dcim.sites, 'name', fleet_values(nr, 'site'), status='active')
 
-    # Check if the device type already exists in Nautobot
-    nb_device_type = nautobot.dcim.device_types.get(model=hardware)
-
-    # Create the device type in Nautobot if it doesn't exist
-    if not nb_device_type:
-        nautobot.dcim.device_types.create(
-            model=hardware,
-            manufacturer={'name':'MikroTik'},
-        )
-    
-    return Result(
-        host=task.host,
-        result=f'id: {nb_device_type.id}',
-    )
+def sync_nb_device_types(nr, nautobot: api):
+    '''
+    Creates the device types of the whole fleet (the hardware in each host's data) in Nautobot.
+    Runs once for the inventory, like sync_nb_sites.  Returns the number of device types created.
+    '''
+    return create_missing_nb_objects(nautobot.dcim.device_types, 'model', fleet_values(nr, 'hardware'), manufacturer={'name': 'MikroTik'})
 
-def create_nb_device(task: Task, nautobot: api) -> Result:
+def create_nb_device(task: Task, nautobot: api, nb_devices) -> Result:
     '''
     Creates a device in Nautobot based on the site, hardware, and role in the host's data.
+    nb_devices is the snapshot of the devices in Nautobot from get_nb_devices.
     '''
     # Get the site name from the host's data
     site = task.host.data['site']
@@ -152,93 +154,130 @@ def create_nb_device(task: Task, nautobot: api) -> Result:
     # Get the serial number from the host's data
     serial = task.host.data['serial']
 
-    # Check if the device already exists in Nautobot
-    device = nautobot.dcim.devices.get(name=task.host.name)
+    # The fields the device should have in Nautobot
+    wanted = {
+        'device_type': {'model': model},
+        'site': {'name': site},
+        'status': 'active',
+        'device_role': {'name': role},
+        'serial': serial,
+    }
+
+    # Check if the device already exists in Nautobot (read with get_nb_devices)
+    device = nb_devices.get(task.host.name)
 
-    # Create the device in Nautobot if it doesn't exist
+    # Create the device in Nautobot if it doesn't exist, and add it to the snapshot for the next stages
     if not device:
-        device = nautobot.dcim.devices.create(
+        nb_device = nautobot.dcim.devices.create(
             name=task.host.name,
-            device_type={'model': model},
-            site={'name': site},
-            status='active',
-            device_role={'name': role},
-            serial=serial,
+            **wanted,
         )
-    # Update the device if it does exist
+        device = nb_devices[task.host.name] = {'id': nb_device.id, 'name': task.host.name, 'interfaces': []}
+    # Update the device if it does exist and differs
     else:
-        device.update({
-            'device_type': {'model': model},
-            'site': {'name': site},
-            'status': 'active',
-            'device_role': {'name': role},
-            'serial': serial,
-        })
+        changes = nb_changes(device, wanted)
+        if changes:
+            nautobot.dcim.devices.update(device['id'], changes)
 
     return Result(
         host=task.host,
-        result=f'id: {device.id}',
+        result=f'id: {device["id"]}',
     )
 
-def create_nb_prefixes(task: Task, nautobot: api) -> Result:
+def fleet_prefixes(nr):
     '''
-    Create prefixes in Nautobot based on the IP addresses in the host's data.
+    Returns {prefix: status} for the networks of the IP addresses of every host that hasn't failed.
+    A prefix is active if any host has an enabled address in it, deprecated otherwise.
     '''
-    # Get the IP addresses from the host's data
-    ip_addresses = task.host.data['ip_addresses']
+    prefixes = {}
 
-    # Loop through the IP addresses
-    for ip_address in ip_addresses:
-        # Get the IP address
-        address = ip_address['address']
+    for host in nr.inventory.hosts.values():
+        if host.name in nr.data.failed_hosts:
+            continue
 
-        # Get the subnet length from the CIDR-notation address
-        subnet_length = int(address.split('/')[1])
+        for ip_address in host.data.get('ip_addresses', []):
+            # Find the network in CIDR notation, the same for every address in it
+            prefix = str(ipaddress.ip_interface(ip_address['address']).network)
 
-        # Find the subnet network address in CIDR notation based on the network property and subnet length
-        subnet_network = ip_address['network'] + '/' + str(subnet_length)
+            # Set status based on disabled status of the IP address
+            if ip_address['disabled'] == 'false':
+                prefixes[prefix] = 'active'
+            else:
+                prefixes.setdefault(prefix, 'deprecated')
 
-        # Set status based on disabled status of the IP address
-        if ip_address['disabled'] == 'false':
-            status = 'active'
-        else:
-            status = 'deprecated'
+    return prefixes
 
-        # Check if the prefix already exists in Nautobot
-        nb_prefix_filter = nautobot.ipam.prefixes.filter(prefix=subnet_network)
-        if len(nb_prefix_filter) > 0:
-            nb_prefix = nb_prefix_filter[0]
+def nb_status(record):
+    '''
+    Returns the status of a Nautobot record as a lowercase slug (Nautobot 1.x nests it as {value, label}, 2.x as {name}).
+    '''
+    status = dict(record).get('status')
+    if isinstance(status, dict):
+        status = status.get('value') or status.get('name')
 
-            # Delete duplicate matches
-            if len(nb_prefix_filter) > 1:
-                for prefix in nb_prefix_filter[1:]:
-                    prefix.delete()
-        else:
-            nb_prefix = None
+    return str(status).lower() if status else None
+
+def sync_nb_prefixes(nr, nautobot: api):
+    '''
+    Creates, updates and de-duplicates the prefixes of the whole fleet in Nautobot with bulk
+    requests.  Runs once for the inventory instead of once per host, so a network shared by
+    several routers is only synced once.  Returns the number of prefixes created, updated,
+    deleted (duplicates) and unchanged.
+    '''
+    prefixes = fleet_prefixes(nr)
+    counts = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    # Look up the existing prefixes, NB_FILTER_BATCH per request
+    existing = {}
+    names = sorted(prefixes)
+    for start in range(0, len(names), NB_FILTER_BATCH):
+        for nb_prefix in nautobot.ipam.prefixes.filter(prefix=names[start:start + NB_FILTER_BATCH]):
+            existing.setdefault(str(nb_prefix.prefix), []).append(nb_prefix)
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    for prefix, status in prefixes.items():
+        matches = existing.get(prefix)
 
         # Create the prefix in Nautobot if it doesn't exist
-        if not nb_prefix:
-            nautobot.ipam.prefixes.create(
-                status=status,
-                prefix=str(subnet_network),
-            )
-        # Update the prefix if it does exist
-        else:
-            nb_prefix.update({
-                'status': status,
-            })
+        if not matches:
+            to_create.append({'prefix': prefix, 'status': status})
+            continue
 
-    return Result(
-        host=task.host,
-        result=True,
-    )
+        # Keep the first match and delete duplicate matches
+        to_delete.extend(nb_prefix.id for nb_prefix in matches[1:])
 
-def create_nb_interfaces(task: Task, nautobot: api) -> Result:
+        # Update the prefix if its status changed
+        if nb_status(matches[0]) != status:
+            to_update.append({'id': matches[0].id, 'status': status})
+        else:
+            counts['unchanged'] += 1
+
+    if to_delete:
+        nautobot.ipam.prefixes.delete(to_delete)
+        counts['deleted'] = len(to_delete)
+    if to_create:
+        nautobot.ipam.prefixes.create(to_create)
+        counts['created'] = len(to_create)
+    if to_update:
+        nautobot.ipam.prefixes.update(to_update)
+        counts['updated'] = len(to_update)
+
+    logging.info('Synced %d prefixes: %s', len(prefixes), counts)
+    return counts
+
+def create_nb_interfaces(task: Task, nautobot: api, nb_devices) -> Result:
     '''
     Create interfaces in Nautobot based on the interfaces in the host's data.
+    Existing interfaces are read from the nb_devices snapshot, and changes are written in bulk.
     '''
-    # Get the interfaces from the host's data
+    # Get the interfaces from the host's data, and the device's interfaces in Nautobot
     interfaces = task.host.data['interfaces']
+    nb_device = nb_devices[task.host.name]
+
+    to_create = []
+    to_update = []
 
     # Loop through the interfaces
     for interface in interfaces:
@@ -255,44 +294,31 @@ def create_nb_interfaces(task: Task, nautobot: api) -> Result:
         int_type = translate_mt_interface_type(interface)
 
         # Check if the interface already exists in Nautobot
-        # Use default-name to filter the interface, otherwise use name (allows updating names instead of creating new)
-        logging.debug(f'Checking for interface {name} on device {task.host.name} with mac {interface["mac-address"]}')
+        # Use default-name to find the interface, otherwise use name (allows updating names instead of creating new)
+        logging.debug('Checking for interface %s with mac %s', name, interface['mac-address'], extra={'host': task.host.name})
         if 'default-name' in interface.keys():
-            nb_interface = nautobot.dcim.interfaces.get(
-                cf_default_name=interface['default-name'],
-                device=task.host.name,
-                mac_address=interface['mac-address'],
-            )
+            matches = [
+                nb_interface for nb_interface in nb_device['interfaces']
+                if nb_interface['custom_fields'].get('default_name') == interface['default-name']
+                and str(nb_interface['mac_address'] or '').lower() == interface['mac-address'].lower()
+            ]
         else:
-            nb_interface = nautobot.dcim.interfaces.get(
-                name=name,
-                device=task.host.name,
-            )
-        logging.debug(f'nb_interface: {nb_interface}')
+            matches = []
+        # Fall back to the name, which is unique per device
+        if not matches:
+            matches = [nb_interface for nb_interface in nb_device['interfaces'] if nb_interface['name'] == name]
+        nb_interface = matches[0] if matches else None
+        logging.debug('nb_interface: %s', nb_interface and nb_interface['id'], extra={'host': task.host.name})
 
         # Set blank default-name if no name exists
         if 'default-name' not in interface.keys():
             interface['default-name'] = ''
 
-        # Create or update the interface in Nautobot
+        # Create the interface in Nautobot if it doesn't exist
         if not nb_interface:
-            try:
-                logging.debug(f'Creating interface {name} on device {task.host.name}')
-                nautobot.dcim.interfaces.create(
-                    name=name,
-                    status='active',
-                    description=description,
-                    mac_address=interface['mac-address'],
-                    #mode='access',
-                    #tags=[vlan],
-                    type=int_type,
-                    device={'name': task.host.name},
-                )
-            except Exception as e:
-                pass
-        # Update the interface if it does exist
-        else:
-            nb_interface.update({
+            logging.debug('Creating interface %s', name, extra={'host': task.host.name})
+            to_create.append({
+                'name': name,
                 'status': 'active',
                 'description': description,
                 'mac_address': interface['mac-address'],
@@ -302,21 +328,82 @@ def create_nb_interfaces(task: Task, nautobot: api) -> Result:
                 'device': {'name': task.host.name},
                 'custom_fields': {'default_name': interface['default-name']},
             })
+        # Update the interface if it does exist and differs
+        else:
+            changes = nb_changes(nb_interface, {
+                'status': 'active',
+                'description': description,
+                'mac_address': interface['mac-address'],
+                #'mode': 'access',
+                #'tags': [vlan],
+                'type': int_type,
+                'custom_fields': {'default_name': interface['default-name']},
+            })
+            if changes:
+                to_update.append({'id': nb_interface['id'], **changes})
+
+    # Create the new interfaces in one request.  If Nautobot refuses the batch, create them
+    # one by one, and fail the host after the others are synced if it refuses any of them,
+    # so the host's sync state isn't saved and the interfaces are tried again on the next run.
+    created = []
+    failed = []
+    if to_create:
+        try:
+            created = list(zip(to_create, nautobot.dcim.interfaces.create(to_create)))
+        except Exception:
+            guard = find_guard(task.nornir)
+            for data in to_create:
+                check_deadline(guard, task.host.name)
+                try:
+                    created.append((data, nautobot.dcim.interfaces.create(**data)))
+                except Exception as e:
+                    logging.error('Failed to create interface %s: %s', data['name'], e, extra={'host': task.host.name})
+                    failed.append(data['name'])
+
+    # Add the new interfaces to the snapshot, for create_nb_ip_addresses
+    for data, nb_interface in created:
+        nb_device['interfaces'].append({
+            **data,
+            'id': nb_interface.id,
+            'ip_addresses': [],
+        })
+
+    # Update the changed interfaces in one request
+    if to_update:
+        nautobot.dcim.interfaces.update(to_update)
+
+    if failed:
+        raise Exception(f'failed to create interfaces: {", ".join(failed)}')
 
     return Result(
         host=task.host,
         result=True,
     )
 
-def create_nb_ip_addresses(task: Task, nautobot: api) -> Result:
+def create_nb_ip_addresses(task: Task, nautobot: api, nb_devices) -> Result:
     '''
     Create IP addresses in Nautobot based on the IP addresses in the host's data.
+    The device's interfaces and the addresses assigned to them are read from the nb_devices
+    snapshot; only addresses not assigned to the device yet are looked up one by one.
     '''
     # Get the IP addresses from the host's data
     ip_addresses = task.host.data['ip_addresses']
 
-    # Loop through the IP addresses
+    # Get the device's interfaces and their addresses in Nautobot
+    nb_interfaces = {}
+    nb_assigned = {}
+    for nb_interface in nb_devices[task.host.name]['interfaces']:
+        nb_interfaces.setdefault(nb_interface['name'], nb_interface)
+        for nb_ip_address in nb_interface['ip_addresses']:
+            nb_assigned.setdefault(nb_ip_address['address'], nb_ip_address)
+
+    to_update = []
+    guard = find_guard(task.nornir)
+
+    # Loop through the IP addresses, each of which can take a few requests
     for ip_address in ip_addresses:
+        check_deadline(guard, task.host.name)
+
         # Get the IP address
         address = ip_address['address']
 
@@ -345,114 +432,180 @@ def create_nb_ip_addresses(task: Task, nautobot: api) -> Result:
         else:
             description = ''
 
-        # Check if the IP address already exists in Nautobot
-        nb_ip_address_filter = nautobot.ipam.ip_addresses.filter(address=address)
-        if len(nb_ip_address_filter) > 0:
-            nb_ip_address = nb_ip_address_filter[0]
+        # Get the interface object
+        nb_interface = nb_interfaces[ip_address['interface']]
 
-            # Delete duplicate matches
-            if len(nb_ip_address_filter) > 1:
-                for ip_address in nb_ip_address_filter[1:]:
-                    ip_address.delete()
-        else:
-            nb_ip_address = None
+        # Check if the IP address is already assigned to the device in Nautobot
+        nb_ip_address = nb_assigned.get(address)
 
-        # Create the IP address in Nautobot if it doesn't exist
+        # Otherwise check if the IP address already exists anywhere in Nautobot
         if not nb_ip_address:
-            nb_ip_address = nautobot.ipam.ip_addresses.create(
-                address=address,
-                status=status,
-            )
-
-        # Get the interface object
-        nb_interface = nautobot.dcim.interfaces.get(
-            name=ip_address['interface'],
-            device=task.host.name,
-        )
-        
-        # Update the IP address and assign it to interface
-        nb_ip_address.update({
+            nb_ip_address_filter = nautobot.ipam.ip_addresses.filter(address=address)
+            if len(nb_ip_address_filter) > 0:
+                nb_ip_address = {'id': nb_ip_address_filter[0].id}
+
+                # Delete duplicate matches
+                if len(nb_ip_address_filter) > 1:
+                    for duplicate in nb_ip_address_filter[1:]:
+                        duplicate.delete()
+
+            # Create the IP address in Nautobot if it doesn't exist
+            else:
+                nb_ip_address = {'id': nautobot.ipam.ip_addresses.create(
+                    address=address,
+                    status=status,
+                ).id}
+
+        # Update the IP address and assign it to interface, if it differs
+        changes = nb_changes(nb_ip_address, {
             'status': status,
             'description': description,
             'assigned_object_type': 'dcim.interface',
-            'assigned_object_id': nb_interface.id,
+            'assigned_object_id': nb_interface['id'],
             'role': role,
         })
+        if changes:
+            to_update.append({'id': nb_ip_address['id'], **changes})
 
-def main():
+    # Update the changed IP addresses in one request
+    if to_update:
+        nautobot.ipam.ip_addresses.update(to_update)
+
+    return Result(
+        host=task.host,
+        result=True,
+    )
+
+def sync_changes(nr, sync_state, full_sync=False):
+    '''
+    Hashes the gathered data of every host that hasn't failed and compares it with the host's
+    last successful sync.  Returns ({host name: hashes}, {host name: set of changed object
+    classes}).  With full_sync every object class of every host is changed.
+    '''
+    hashes = {}
+    changed = {}
+    for host in nr.inventory.hosts.values():
+        if host.name not in nr.data.failed_hosts:
+            hashes[host.name] = host_hashes(host.data)
+            changed[host.name] = set(SYNC_CLASSES) if full_sync else sync_state.changed(host.name, hashes[host.name])
+
+    return hashes, changed
+
+def changed_hosts_of(nr, changed, object_class):
+    '''
+    Returns the inventory filtered to the hosts whose object_class changed, from sync_changes.
     '''
+    return nr.filter(filter_func=lambda host: object_class in changed.get(host.name, ()))
+
+def run_pull_to_nautobot(nr, nautobot=None, full_sync=False, sync_state=None):
+    '''
+    Runs the Nautobot sync stages against an already initialized and filtered inventory.
+    The write stages only run for the hosts and object classes whose data changed since their
+    last successful sync (see nr_sync_state), unless full_sync is set.
+
     1. Gather info
-    2. Create sites
-    3. Create device_types
+    2. Create the sites of the whole fleet
+    3. Create the device_types of the whole fleet
     4. Create devices
     5. Create interfaces
-    6. Create prefixes
+    6. Sync prefixes of the whole fleet
     7. Create IP addresses (assign to device)
     '''
 
-    # initialize Nornir
-    nr = InitNornir()
-
-    # Save the first argument passed to the script as a variable called target if sys.argv[1] exists
-    target = sys.argv[1] if len(sys.argv) > 1 else None
-
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        pass
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='routeros'))
-        print(f'filtered inventory to {target}')
-
     # initialize pynautobot api
-    nautobot = api(token=NB_TOKEN, url=NB_URL)
+    if nautobot is None:
+        nautobot = api(token=NB_TOKEN, url=NB_URL)
+
+    # Count requests, bytes and round trip times to Nautobot
+    instrument_nautobot(nautobot)
 
     # Gather info
-    result = nr.run(
+    nr.run(
         task=get_mikrotik_info,
     )
-    print_result(result)
 
-    # Create a site in Nautobot
-    result = nr.run(
-        task=create_nb_site,
-        nautobot=nautobot,
-    )
-    print_result(result)
+    # Hash the gathered data and compare it with the last successful sync
+    sync_state = sync_state or SyncState(nautobot_url=nautobot.base_url)
+    hashes, changed = sync_changes(nr, sync_state, full_sync)
 
-    # Create a device type in Nautobot
-    result = nr.run(
-        task=create_nb_device_type,
-        nautobot=nautobot,
-    )
-    print_result(result)
+    def changed_hosts(object_class):
+        return changed_hosts_of(nr, changed, object_class)
+
+    unchanged = sum(1 for classes in changed.values() if not classes)
+    print(f'== sync state: {len(changed) - unchanged} hosts changed, {unchanged} unchanged{" (full sync)" if full_sync else ""}')
+
+    # Create the sites and device types of the changed devices in Nautobot, once for the whole fleet
+    sites = sync_nb_sites(changed_hosts('device'), nautobot)
+    device_types = sync_nb_device_types(changed_hosts('device'), nautobot)
+    print(f'== sync_nb_sites: {sites} created, sync_nb_device_types: {device_types} created')
+
+    # Read the devices to sync, with their interfaces and IP addresses, in a few GraphQL queries
+    nb_devices = get_nb_devices(nautobot, names=sorted(name for name, classes in changed.items() if classes))
 
     # Create a device in Nautobot
-    result = nr.run(
+    changed_hosts('device').run(
         task=create_nb_device,
         nautobot=nautobot,
+        nb_devices=nb_devices,
     )
-    print_result(result)
 
     # Create interfaces in Nautobot
-    result = nr.run(
+    changed_hosts('interfaces').run(
         task=create_nb_interfaces,
         nautobot=nautobot,
+        nb_devices=nb_devices,
     )
-    print_result(result)
 
-    # Create prefixes in Nautobot
-    result = nr.run(
-        task=create_nb_prefixes,
-        nautobot=nautobot,
-    )
-    print_result(result)
+    # Sync the prefixes of the whole fleet to Nautobot at once, if any host's addresses changed
+    if any('ip_addresses' in classes for classes in changed.values()):
+        counts = sync_nb_prefixes(nr, nautobot)
+        print(f'== sync_nb_prefixes: {counts["created"]} created, {counts["updated"]} updated, '
+              f'{counts["deleted"]} duplicates deleted, {counts["unchanged"]} unchanged')
 
     # Create IP addresses in Nautobot
-    result = nr.run(
+    changed_hosts('ip_addresses').run(
         task=create_nb_ip_addresses,
         nautobot=nautobot,
+        nb_devices=nb_devices,
     )
-    print_result(result)
+
+    # No later stage reads the gathered interfaces and addresses, or the Nautobot snapshot
+    release_host_data(nr, ['interfaces', 'ip_addresses'])
+    nb_devices.clear()
+
+    # Remember what was synced for the hosts that didn't fail
+    for host_name, synced in hashes.items():
+        if host_name not in nr.data.failed_hosts:
+            sync_state.save(host_name, synced)
+
+def main():
+    setup_logging('nr_pull_to_nautobot')
+
+    # initialize Nornir
+    nr = InitNornir()
+
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
+
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target)
+
+    # Leave out hosts that don't answer on their management ports
+    nr = prune_unreachable(nr, services=('api',))
+
+    # Bound the time each host can take, and stop sending work to hosts that keep failing.
+    # Record the time spent in each task, and print one line per host as tasks finish.
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_routeros_pull_to_nautobot')
+    nr = nr.with_processors([HostGuard(), timing, reporter])
+
+    # --full pushes every host and object class again, whether it changed or not
+    run_pull_to_nautobot(nr, full_sync='--full' in sys.argv[2:])
+
+    # Print the summary table and save task timings
+    reporter.print_summary()
+    reporter.close()
+    write_metrics(timing, 'nr_routeros_pull_to_nautobot')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
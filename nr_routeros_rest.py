@@ -0,0 +1,179 @@
+"""
+RouterOS v7 REST API transport.
+
+Registers a 'routerosrest' Nornir connection plugin that talks to the built-in /rest API
+over HTTPS, using one pooled keep-alive requests session per host.  Hosts use it instead of
+the binary API (and instead of SSH for exports) when their data has transport: rest, for
+example through the routeros_rest group in groups.yaml.
+
+Connection extras:
+    verify_ssl:     verify the router's certificate (default True)
+    timeout:        timeout in seconds for each request (default 10)
+    pool_maxsize:   number of keep-alive connections kept open to the host (default 4)
+    retries:        number of retries on connection errors (default 2)
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from nornir.core.plugins.connections import ConnectionPluginRegister
+from nornir.core.task import Task, Result
+from nr_metrics import TRANSPORT_METRICS
+
+CONNECTION_NAME = 'routerosrest'
+REST_PORT = 443
+REST_TIMEOUT = 10
+
+# Values that mean the same thing in config commands and in print output
+BOOLEAN_VALUES = {'yes': 'true', 'no': 'false'}
+
+class RouterOsRestError(Exception):
+    '''
+    Raised when the REST API answers with an error status.
+    '''
+    pass
+
+class RouterOsRestClient:
+    '''
+    Client for the RouterOS REST API.  Paths use the same form as the binary API (/ip/address).
+    '''
+    def __init__(self, hostname, username, password, port=None, verify_ssl=True,
+                 timeout=REST_TIMEOUT, pool_maxsize=4, retries=2):
+        self.hostname = hostname
+        self.base_url = f'https://{hostname}:{port or REST_PORT}/rest'
+        self.timeout = timeout
+
+        # Keep-alive connections are reused from the pool for every request to this host
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.session.verify = verify_ssl
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retries)
+        self.session.mount('https://', adapter)
+        TRANSPORT_METRICS.connected(hostname, 'routeros_rest')
+
+    def request(self, method, path, **kwargs):
+        response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+
+        TRANSPORT_METRICS.record(
+            self.hostname,
+            'routeros_rest',
+            bytes_sent=len(response.request.body or b''),
+            bytes_received=len(response.content),
+            rtt=response.elapsed.total_seconds(),
+            error=response.status_code >= 400,
+        )
+        if response.status_code == 401:
+            TRANSPORT_METRICS.auth_failure(self.hostname, 'routeros_rest')
+
+        if response.status_code >= 400:
+            try:
+                error = response.json()
+                message = error.get('detail') or error.get('message')
+            except ValueError:
+                message = response.text
+            raise RouterOsRestError(f'{method} {path}: {response.status_code} {message}')
+
+        return response.json() if response.content else None
+
+    def get(self, path, query=None, proplist=None):
+        '''
+        Returns the items of a menu as a list of dictionaries, optionally filtered by query
+        and limited to the properties in proplist.
+        '''
+        params = dict(query or {})
+        if proplist:
+            params['.proplist'] = ','.join(proplist)
+
+        items = self.request('GET', path, params=params)
+
+        # Menus without items (/system/resource) return a single object
+        return items if isinstance(items, list) else [items]
+
+    def set(self, path, properties, item_id=None):
+        '''
+        Sets properties on an item (or on a menu without items if item_id is None).
+        '''
+        if item_id is None:
+            return self.request('POST', f'{path}/set', json=properties)
+        return self.request('PATCH', f'{path}/{item_id}', json=properties)
+
+    def add(self, path, properties):
+        '''
+        Adds an item to a menu and returns it.
+        '''
+        return self.request('PUT', path, json=properties)
+
+    def command(self, path, command, **kwargs):
+        '''
+        Runs a command (check-for-updates, enable, ...) on a menu.
+        '''
+        return self.request('POST', f'{path}/{command}', json=kwargs)
+
+    def execute(self, script):
+        '''
+        Runs a console script and returns its output as a string.
+        '''
+        result = self.request('POST', '/execute', json={'script': script, 'as-string': ''})
+        return result.get('ret', '') if result else ''
+
+    def close(self):
+        self.session.close()
+
+class RouterOsRest:
+    '''
+    Nornir connection plugin for the RouterOS REST API.
+    '''
+    def open(self, hostname, username, password, port, platform, extras=None, configuration=None):
+        extras = extras or {}
+
+        self.connection = RouterOsRestClient(
+            hostname=hostname,
+            username=username,
+            password=password,
+            port=port,
+            verify_ssl=extras.get('verify_ssl', True),
+            timeout=extras.get('timeout', REST_TIMEOUT),
+            pool_maxsize=extras.get('pool_maxsize', 4),
+            retries=extras.get('retries', 2),
+        )
+
+    def close(self):
+        self.connection.close()
+
+ConnectionPluginRegister.register(CONNECTION_NAME, RouterOsRest)
+
+def normalize_value(value):
+    return BOOLEAN_VALUES.get(value, value)
+
+def routeros_rest_config_item(task: Task, path, where, properties, add_if_missing=False) -> Result:
+    '''
+    REST version of routeros_config_item.  Finds the item matching where and sets the properties
+    that differ.  If no item matches and add_if_missing is True, the item is added.
+    '''
+    rest = task.host.get_connection(CONNECTION_NAME, task.nornir.config)
+    items = rest.get(path, query=where)
+
+    if len(items) > 1:
+        raise ValueError(f'{len(items)} items in {path} match {where}')
+
+    # Add the item if it doesn't exist
+    if not items:
+        if not add_if_missing:
+            return Result(host=task.host, result=f'no item in {path} matches {where}', changed=False)
+        if not task.is_dry_run():
+            rest.add(path, properties)
+        return Result(host=task.host, result=f'added to {path}: {properties}', changed=True)
+
+    # Only set the properties that differ from the current config
+    current = items[0]
+    changes = {
+        key: value for key, value in properties.items()
+        if normalize_value(current.get(key)) != normalize_value(value)
+    }
+    if changes and not task.is_dry_run():
+        rest.set(path, changes, item_id=current.get('.id'))
+
+    return Result(
+        host=task.host,
+        result=f'set in {path}: {changes}' if changes else f'{path} already configured',
+        changed=bool(changes),
+    )
@@ -10,6 +10,7 @@ from nornir_utils.plugins.functions import print_result
 from nornir_routeros.plugins.tasks import routeros_config_item
 from nornir_routeros.plugins.tasks import routeros_command
 from nr_routeros_general import *
+from nr_fact_cache import FactCache, get_cached_ros_version
 import datetime
 
 def set_update_branch(task: Task) -> Result:
@@ -18,7 +19,7 @@ def set_update_branch(task: Task) -> Result:
     '''
     if task.host.data['ros_major_version'] == '6':
         task.run(
-            task=routeros_config_item,
+            task=config_item,
             path='/system/package/update',
             where={},
             properties={
@@ -27,7 +28,7 @@ def set_update_branch(task: Task) -> Result:
         )
     elif task.host.data['ros_major_version'] == '7':
         task.run(
-            task=routeros_config_item,
+            task=config_item,
             path='/system/package/update',
             where={},
             properties={
@@ -46,13 +47,13 @@ def update(task: Task) -> Result:
     '''
 
     task.run(
-        task=routeros_command,
+        task=run_command,
         path='/system/package/update',
         command='check-for-updates',
     )
 
     task.run(
-        task=routeros_command,
+        task=run_command,
         path='/system/package/update',
         command='download',
     )
@@ -68,7 +69,7 @@ def enable_ipv6(task: Task) -> Result:
     '''
     if task.host.data['ros_major_version'] == '6':
         task.run(
-            task=routeros_command,
+            task=run_command,
             path='/system/package',
             command='enable',
             numbers='ipv6',
@@ -81,14 +82,16 @@ def enable_ipv6(task: Task) -> Result:
 
 def schedule_reboot(task: Task) -> Result:
     '''
-    Schedules reboot for 3:00 AM the next day
+    Schedules reboot for 3:00 AM the next day.  The cached routeros version of the host is
+    dropped, and a version fetched before the reboot expires at the reboot.
     '''
     # Get tomorrow's date in the format MMM/DD/YYYY using datetime
     tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+    reboot_at = datetime.datetime.combine(tomorrow.date(), datetime.time(3, 0))
     tomorrow = tomorrow.strftime('%b/%d/%Y')
 
     task.run(
-        task=routeros_config_item,
+        task=config_item,
         path='/system/scheduler',
         where={
             'name': 'reboot-for-update',
@@ -103,6 +106,9 @@ def schedule_reboot(task: Task) -> Result:
         add_if_missing=True
     )
 
+    # The upgrade changes the version, so baseline and compliance must not use the cached one
+    FactCache().invalidate(task.host.name, ['ros_version', 'ros_major_version'], at=reboot_at.timestamp())
+
     return Result(
         host=task.host,
         result=f"Reboot scheduled {task.host}",
@@ -115,9 +121,9 @@ def main():
     # Using the first argument passed to the script as the hostname, filter a single host from the inventory
     target = nr.filter(name=sys.argv[1]).filter(F(groups__contains='routeros'))
 
-    # Gather info
+    # Gather info, reading the routeros version from the fact cache when it is fresh
     result = target.run(
-        task=get_ros_version,
+        task=get_cached_ros_version,
     )
     print_result(result)
 
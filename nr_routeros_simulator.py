@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+"""
+Local RouterOS API simulator for load testing.
+
+Speaks the RouterOS binary API on one TCP port and simulates many routers at once.  The
+router a connection talks to is picked from the login name (sim-<index>), so a whole
+simulated fleet can share 127.0.0.1 and one port.  Each router has realistic
+/system/resource, /system/routerboard, /interface, /ip/address and /ip/neighbor data,
+plus the menus the baseline and update tasks configure.  Every command waits the
+configured latency before it is answered; tagged commands are answered concurrently,
+like a real router.
+
+Usage: nr_routeros_simulator.py [--port 18728] [--hosts 1000] [--latency 0.02] [--vlans 20]
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import random
+import secrets
+from nr_routeros_async import encode_sentence, read_sentence
+
+SIM_PORT = 18728
+SIM_USERNAME_PREFIX = 'sim-'
+
+BOARDS = ['CCR1036-8G-2S+', 'CCR2004-1G-12S+2XS', 'RB4011iGS+', 'hEX S', 'CRS326-24G-2S+']
+VERSIONS = ['6.48.6 (long-term)', '6.49.10 (long-term)', '7.11.2 (stable)', '7.13.5 (stable)']
+
+def sim_username(index):
+    return f'{SIM_USERNAME_PREFIX}{index}'
+
+def sim_hostname(index):
+    '''
+    Returns the inventory name of simulated router index, in the site-roleN form the tasks expect.
+    '''
+    return f'site{index // 10}-{"core" if index % 10 == 0 else "edge"}{index % 10 + 1}'
+
+def make_router(index, hosts, vlans=20):
+    '''
+    Builds the menus of simulated router index as {path: [items]}.
+    '''
+    rng = random.Random(index)
+    mac_base = 0x4C5E0C000000 + index * 256
+
+    def mac(offset):
+        value = f'{mac_base + offset:012X}'
+        return ':'.join(value[i:i + 2] for i in range(0, 12, 2))
+
+    # Physical ports, a bridge, and VLAN interfaces
+    interfaces = []
+    for port in range(1, 9):
+        interfaces.append({'name': f'ether{port}', 'default-name': f'ether{port}', 'type': 'ether', 'mac-address': mac(port), 'mtu': '1500', 'running': 'true', 'disabled': 'false'})
+    for port in range(1, 3):
+        interfaces.append({'name': f'sfp-sfpplus{port}', 'default-name': f'sfp-sfpplus{port}', 'type': 'ether', 'mac-address': mac(8 + port), 'mtu': '1500', 'running': 'true', 'disabled': 'false'})
+    interfaces.append({'name': 'bridge', 'type': 'bridge', 'mac-address': mac(1), 'mtu': 'auto', 'running': 'true', 'disabled': 'false'})
+    for vlan in range(vlans):
+        interfaces.append({'name': f'vlan{100 + vlan}', 'type': 'vlan', 'mac-address': mac(1), 'mtu': '1500', 'running': 'true', 'disabled': 'false', 'comment': f'customer {vlan}'})
+
+    # A loopback, a transit /30 to the next router, and one /28 per VLAN
+    loopback = ipaddress.ip_address('10.255.0.0') + index
+    transit = ipaddress.ip_network('10.254.0.0/30')
+    transit = ipaddress.ip_network(f'{transit.network_address + 4 * index}/30')
+    addresses = [
+        {'address': f'{loopback}/32', 'network': str(loopback), 'interface': 'bridge', 'disabled': 'false', 'comment': 'loopback'},
+        {'address': f'{transit.network_address + 1}/30', 'network': str(transit.network_address), 'interface': 'sfp-sfpplus1', 'disabled': 'false'},
+    ]
+    for vlan in range(vlans):
+        network = ipaddress.ip_network(f'{ipaddress.ip_address("10.0.0.0") + 16 * (index * vlans + vlan)}/28')
+        addresses.append({'address': f'{network.network_address + 1}/28', 'network': str(network.network_address), 'interface': f'vlan{100 + vlan}', 'disabled': 'false' if vlan % 7 else 'true'})
+
+    # Neighbors are the previous and next routers in the ring
+    neighbors = []
+    for offset, interface in [(-1, 'sfp-sfpplus2'), (1, 'sfp-sfpplus1')]:
+        other = (index + offset) % hosts
+        neighbors.append({
+            'interface': interface,
+            'address': str(ipaddress.ip_address('10.255.0.0') + other),
+            'mac-address': f'{0x4C5E0C000000 + other * 256 + 9:012X}',
+            'identity': sim_hostname(other),
+            'platform': 'MikroTik',
+            'version': VERSIONS[other % len(VERSIONS)],
+            'board': BOARDS[other % len(BOARDS)],
+        })
+
+    version = VERSIONS[index % len(VERSIONS)]
+
+    return {
+        '/system/resource': [{'version': version, 'board-name': BOARDS[index % len(BOARDS)], 'uptime': f'{rng.randint(1, 300)}d', 'cpu-load': str(rng.randint(0, 40)), 'free-memory': '536870912', 'architecture-name': 'arm64'}],
+        '/system/routerboard': [{'routerboard': 'true', 'model': BOARDS[index % len(BOARDS)], 'serial-number': f'SIM{index:08d}', 'current-firmware': version.split(' ')[0]}],
+        '/system/identity': [{'name': sim_hostname(index)}],
+        '/interface': interfaces,
+        '/interface/vlan': [{'name': f'vlan{100 + vlan}', 'vlan-id': str(100 + vlan), 'interface': 'bridge'} for vlan in range(vlans)],
+        '/ip/address': addresses,
+        '/ip/neighbor': neighbors,
+        '/system/ntp/client': [{'enabled': 'false'}],
+        '/system/ntp/client/servers': [],
+        '/snmp': [{'enabled': 'false', 'contact': '', 'location': ''}],
+        '/snmp/community': [{'name': 'public', 'default': 'true', 'addresses': '::/0'}],
+        '/system/logging/action': [{'name': 'memory', 'target': 'memory'}, {'name': 'remote', 'target': 'remote', 'remote': '0.0.0.0', 'remote-port': '514'}],
+        '/system/logging': [{'topics': topic, 'action': 'memory', 'disabled': 'false'} for topic in ['info', 'error', 'warning', 'critical']],
+        '/ip/service': [{'name': name, 'port': port, 'disabled': 'false', 'address': ''} for name, port in [('telnet', '23'), ('ftp', '21'), ('www', '80'), ('ssh', '22'), ('www-ssl', '443'), ('api', '8728'), ('winbox', '8291'), ('api-ssl', '8729')]],
+        '/system/package/update': [{'channel': 'long-term', 'installed-version': version.split(' ')[0]}],
+        '/system/package': [{'name': 'ipv6', 'disabled': 'true'}],
+        '/system/scheduler': [],
+    }
+
+class RouterOsSimulator:
+    '''
+    Serves the RouterOS API for hosts simulated routers.  Routers are built on first login.
+    '''
+    def __init__(self, hosts=1000, latency=0.0, vlans=20):
+        self.hosts = hosts
+        self.latency = latency
+        self.vlans = vlans
+        self.routers = {}
+        self.connections = 0
+        self.commands = 0
+
+    def router(self, index):
+        if index not in self.routers:
+            self.routers[index] = make_router(index, self.hosts, self.vlans)
+
+        return self.routers[index]
+
+    def execute(self, router, words):
+        '''
+        Runs one command against a router's menus.  Returns the reply sentences (without tags).
+        '''
+        path, _, command = words[0].rpartition('/')
+        attributes = {}
+        query = {}
+        for word in words[1:]:
+            if word.startswith('='):
+                key, _, value = word[1:].partition('=')
+                attributes[key] = value
+            elif word.startswith('?'):
+                key, _, value = word[1:].partition('=')
+                query[key] = value
+
+        if path not in router:
+            if command in ('check-for-updates', 'download', 'enable', 'disable', 'reboot'):
+                return [['!done']]
+            return [['!trap', '=message=no such command prefix'], ['!done']]
+
+        items = router[path]
+        for number, item in enumerate(items):
+            item.setdefault('.id', f'*{number + 1:X}')
+
+        if command == 'print':
+            proplist = attributes.get('.proplist')
+            proplist = proplist.split(',') if proplist else None
+            replies = []
+            for item in items:
+                if all(item.get(key) == value for key, value in query.items()):
+                    fields = proplist or item.keys()
+                    replies.append(['!re'] + [f'={key}={item[key]}' for key in fields if key in item])
+            return replies + [['!done']]
+
+        if command == 'set':
+            item_id = attributes.pop('.id', None)
+            targets = [item for item in items if item_id is None or item['.id'] == item_id]
+            if not targets:
+                return [['!trap', '=message=no such item'], ['!done']]
+            for item in targets:
+                item.update(attributes)
+            return [['!done']]
+
+        if command == 'add':
+            item = dict(attributes, **{'.id': f'*{len(items) + 1:X}'})
+            items.append(item)
+            return [['!done', f'=ret={item[".id"]}']]
+
+        if command == 'remove':
+            router[path] = [item for item in items if item['.id'] != attributes.get('.id')]
+            return [['!done']]
+
+        return [['!done']]
+
+    async def answer(self, writer, router, words, tag):
+        '''
+        Answers one command after the simulated latency.
+        '''
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        tag_words = [f'.tag={tag}'] if tag is not None else []
+        replies = self.execute(router, words)
+        writer.write(b''.join(encode_sentence(reply + tag_words) for reply in replies))
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        router = None
+        pending = set()
+
+        try:
+            while True:
+                words = await read_sentence(reader)
+                if not words:
+                    continue
+                self.commands += 1
+
+                tag = None
+                for word in words:
+                    if word.startswith('.tag='):
+                        tag = word[5:]
+                words = [word for word in words if not word.startswith('.tag=')]
+
+                # Any password is accepted, the login name picks the simulated router.
+                # A login without a name asks for the pre-6.43 challenge.
+                if words[0] == '/login':
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    tag_words = [f'.tag={tag}'] if tag is not None else []
+                    name = next((word[6:] for word in words if word.startswith('=name=')), '')
+                    if not name:
+                        writer.write(encode_sentence(['!done', f'=ret={secrets.token_hex(16)}'] + tag_words))
+                    elif not name.startswith(SIM_USERNAME_PREFIX) or not name[len(SIM_USERNAME_PREFIX):].isdigit():
+                        writer.write(encode_sentence(['!trap', '=message=invalid user name or password (6)'] + tag_words) + encode_sentence(['!done'] + tag_words))
+                    else:
+                        router = self.router(int(name[len(SIM_USERNAME_PREFIX):]) % self.hosts)
+                        writer.write(encode_sentence(['!done'] + tag_words))
+                    continue
+
+                if router is None:
+                    writer.write(encode_sentence(['!fatal', 'not logged in']))
+                    break
+
+                # Tagged commands are answered concurrently, untagged ones in order
+                if tag is None:
+                    await self.answer(writer, router, words, tag)
+                else:
+                    answer = asyncio.create_task(self.answer(writer, router, words, tag))
+                    pending.add(answer)
+                    answer.add_done_callback(pending.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=SIM_PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of RouterOS API hosts')
+    parser.add_argument('--listen', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=SIM_PORT)
+    parser.add_argument('--hosts', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each reply')
+    parser.add_argument('--vlans', type=int, default=20, help='VLAN interfaces per router')
+    args = parser.parse_args()
+
+    simulator = RouterOsSimulator(hosts=args.hosts, latency=args.latency, vlans=args.vlans)
+    print(f'simulating {args.hosts} routers on {args.listen}:{args.port}, log in as {sim_username(0)}..{sim_username(args.hosts - 1)}')
+    asyncio.run(simulator.serve(args.listen, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,24 @@ import sys # for catching arugments
 from nornir import InitNornir
 from nornir_routeros.plugins.tasks import *
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
-from nornir.core.filter import F
 from config import *
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 import logging
+from nr_logging import setup_logging
+from nr_metrics import TimingProcessor, write_metrics, TRANSPORT_METRICS
+from nr_report import StreamReporter
+from nr_inventory_index import filter_target, command_line_target, site_from_name
+import time
 
-logging.basicConfig(filename='logs/nr_swos_snmp.log', level=logging.DEBUG)
+setup_logging('nr_swos_snmp')
 
 def get_site(task: Task) -> Result:
-    # Set the site in the host.data dictionary to the substring preceding the first dash in the host's name
-    task.host.data['site'] = task.host.name.split('-')[0]
-    logging.debug(f'Set site to {task.host.data["site"]}')
+    # Set the site in the host.data dictionary to the substring preceding the first dash in the host's name,
+    # unless the inventory index already set it
+    if 'site' not in task.host.data:
+        task.host.data['site'] = site_from_name(task.host.name)
+    logging.debug('Set site to %s', task.host.data['site'], extra={'host': task.host.name})
 
     return Result(
         host=task.host,
@@ -29,7 +34,7 @@ def get_site(task: Task) -> Result:
 def configure_snmp(task: Task) -> Result:
     try:
         # Send debug message to log file
-        logging.debug(f"Opening webdriver {task.host.name}")
+        logging.debug('Opening webdriver', extra={'host': task.host.name})
 
         # Set firefox to run in headless mode
         firefox_options = webdriver.firefox.options.Options()
@@ -37,10 +42,12 @@ def configure_snmp(task: Task) -> Result:
 
         wdriver = webdriver.Firefox(options=firefox_options)
         wdriver.implicitly_wait(5)
+        started = time.perf_counter()
         wdriver.get(f'http://{task.host.username}:{task.host.password}@{task.host.hostname}/index.html#snmp')
+        TRANSPORT_METRICS.record(task.host.hostname, 'swos_http', rtt=time.perf_counter() - started)
     except Exception as e:
         # Send debug message to log file
-        logging.debug(f"Failed to open webdriver {task.host.name}. Error: {e}")
+        logging.debug('Failed to open webdriver. Error: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f"Failed to open webdriver {task.host.name}. Error: {e}",
@@ -49,7 +56,7 @@ def configure_snmp(task: Task) -> Result:
     # Configure SNMP and log any errors
     try:
         # Send debug output to the log file
-        logging.debug(f'Configuring SNMP on {task.host.name}')
+        logging.debug('Configuring SNMP', extra={'host': task.host.name})
 
         # Enable SNMP checkbox
         enabled_button = wdriver.find_element(By.ID, 'en0')
@@ -71,7 +78,7 @@ def configure_snmp(task: Task) -> Result:
         location_input.clear()
         location_input.send_keys(task.host.data['site'])
     except Exception as e:
-        logging.error(f'Error configuring SNMP on {task.host.name}: {e}')
+        logging.error('Error configuring SNMP: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error configuring SNMP on {task.host.name}: {e}',
@@ -80,12 +87,12 @@ def configure_snmp(task: Task) -> Result:
     # Apply the changes and log any errors
     try:
         # Send debug output to the log file
-        logging.debug(f'Applying SNMP changes on {task.host.name}')
+        logging.debug('Applying SNMP changes', extra={'host': task.host.name})
 
         apply_button = wdriver.find_element(By.XPATH, '/html/body/table/tbody/tr[3]/td/div/table/tbody/tr[5]/td/div/div/a[1]')
         apply_button.click()
     except Exception as e:
-        logging.error(f'Error applying SNMP changes to {task.host.name}: {e}')
+        logging.error('Error applying SNMP changes: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error applying SNMP changes to {task.host.name}: {e}',
@@ -94,10 +101,10 @@ def configure_snmp(task: Task) -> Result:
     # Close the webdriver
     try:
         # Send debug output to the log file
-        logging.debug(f'Closing webdriver {task.host.name}')
+        logging.debug('Closing webdriver', extra={'host': task.host.name})
         wdriver.close()
     except:
-        logging.error(f'Error closing webdriver {task.host.name}')
+        logging.error('Error closing webdriver', extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error closing webdriver {task.host.name}',
@@ -113,13 +120,15 @@ def set_identity(task: Task) -> Result:
     # Open the webdriver to the system page
     try:
         # Send debug message to log file
-        logging.debug(f"Opening webdriver {task.host.name}")
+        logging.debug('Opening webdriver', extra={'host': task.host.name})
         wdriver = webdriver.Firefox()
         wdriver.implicitly_wait(5)
+        started = time.perf_counter()
         wdriver.get(f'http://{task.host.username}:{task.host.password}@{task.host.hostname}/index.html#system')
+        TRANSPORT_METRICS.record(task.host.hostname, 'swos_http', rtt=time.perf_counter() - started)
     except Exception as e:
         # Send debug message to log file
-        logging.debug(f"Failed to open webdriver {task.host.name}. Error: {e}")
+        logging.debug('Failed to open webdriver. Error: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f"Failed to open webdriver {task.host.name}. Error: {e}",
@@ -128,14 +137,14 @@ def set_identity(task: Task) -> Result:
     # Configure SNMP and log any errors
     try:
         # Send debug output to the log file
-        logging.debug(f'Configuring SNMP on {task.host.name}')
+        logging.debug('Configuring SNMP', extra={'host': task.host.name})
 
         # Set the identity
         identity_input = wdriver.find_element(By.XPATH, '/html/body/table/tbody/tr[3]/td/div/table[1]/tbody/tr[3]/td/input')
         identity_input.clear()
         identity_input.send_keys(task.host.name)
     except Exception as e:
-        logging.error(f'Error configuring identity on {task.host.name}: {e}')
+        logging.error('Error configuring identity: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error configuring identity on {task.host.name}: {e}',
@@ -144,12 +153,12 @@ def set_identity(task: Task) -> Result:
     # Apply the changes and log any errors
     try:
         # Send debug output to the log file
-        logging.debug(f'Applying changes on {task.host.name}')
+        logging.debug('Applying changes', extra={'host': task.host.name})
 
         apply_button = wdriver.find_element(By.XPATH, '/html/body/table/tbody/tr[3]/td/div/table/tbody/tr[5]/td/div/div/a[1]')
         apply_button.click()
     except Exception as e:
-        logging.error(f'Error applying changes on {task.host.name}: {e}')
+        logging.error('Error applying changes: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error applying changes on {task.host.name}: {e}',
@@ -158,10 +167,10 @@ def set_identity(task: Task) -> Result:
     # Close the webdriver
     try:
         # Send debug output to the log file
-        logging.debug(f'Closing webdriver {task.host.name}')
+        logging.debug('Closing webdriver', extra={'host': task.host.name})
         wdriver.close()
     except:
-        logging.error(f'Error closing webdriver {task.host.name}')
+        logging.error('Error closing webdriver', extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error closing webdriver {task.host.name}',
@@ -177,27 +186,31 @@ def main():
     # initialize Nornir
     nr = InitNornir()
 
-    # Save the first argument passed to the script as a variable called target if sys.argv[1] exists
-    target = sys.argv[1] if len(sys.argv) > 1 else None
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
 
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        pass
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='swos'))
-        print(f'filtered inventory to {target}')
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target, group='swos')
+
+    # Record the time spent in each task, and print one line per host as tasks finish
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_swos_baseline')
+    nr = nr.with_processors([timing, reporter])
 
     # Run tasks
     logging.debug('Running tasks')
-    result = nr.run(
+    nr.run(
         task=get_site,
     )
-    print_result(result)
 
-    result = nr.run(
+    nr.run(
         task=configure_snmp,
     )
-    print_result(result)
+
+    # Print the summary table and save task timings
+    reporter.print_summary()
+    reporter.close()
+    write_metrics(timing, 'nr_swos_baseline')
 
 if __name__ == "__main__":
     main()
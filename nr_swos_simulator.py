@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""
+Local stand-in for the SwOS web UI.
+
+Serves index.html with the SNMP (#snmp), System (#system) and Upgrade (#upgrade) pages
+laid out like SwOS, so the XPaths and link texts used by nr_swos_baseline and
+nr_swos_upgrade find the same elements, and the snmp.b, sys.b and upgrade data
+endpoints behind them, in the SwOS encoding ({en:0x01,com:'7075626c6963'}).
+
+Many switches share one port: the HTTP basic auth user name (sim-<index>) picks the
+switch, so a host's hostname is 127.0.0.1:<port>.  Every response can be delayed, and an
+upgrade makes the switch answer 503 for the configured upgrade duration, as if it were
+downloading and rebooting.
+
+Usage: nr_swos_simulator.py [--port 18081] [--switches 100] [--delay 0.05] [--upgrade-duration 30]
+"""
+
+import argparse
+import base64
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SWOS_SIM_PORT = 18081
+SWOS_USERNAME_PREFIX = 'sim-'
+
+SWOS_VERSION = '2.13'
+SWOS_UPGRADE_VERSION = '2.16'
+
+# Fields of each data endpoint that hold strings (hex encoded by SwOS)
+STRING_FIELDS = {'com', 'ci', 'loc', 'id', 'ver', 'brd'}
+
+# The SwOS page layout.  The table rows and cells match the XPaths of the SwOS tasks.
+INDEX_HTML = '''<!DOCTYPE html>
+<html><head><title>SwOS</title></head>
+<body><table><tbody>
+<tr><td>MikroTik SwOS</td></tr>
+<tr><td><a href="#system">System</a> <a href="#snmp">SNMP</a> <a href="#upgrade">Upgrade</a></td></tr>
+<tr><td><div id="page"></div></td></tr>
+</tbody></table>
+<script>
+function hex(s) { return Array.from(new TextEncoder().encode(s)).map(b => b.toString(16).padStart(2, '0')).join(''); }
+function unhex(h) { return new TextDecoder().decode(new Uint8Array((h.match(/../g) || []).map(b => parseInt(b, 16)))); }
+function parse(text) {
+  const data = {};
+  for (const m of text.matchAll(/(\\w+):(?:'([0-9a-f]*)'|0x([0-9a-f]+))/g)) data[m[1]] = m[2] !== undefined ? unhex(m[2]) : parseInt(m[3], 16);
+  return data;
+}
+function encode(data) {
+  return '{' + Object.entries(data).map(([k, v]) => typeof v === 'number' ? k + ':0x' + v.toString(16).padStart(2, '0') : k + ":'" + hex(v) + "'").join(',') + '}';
+}
+const APPLY = '<tr><td><div><div><a href="#" onclick="apply(); return false;">Apply All</a> <a href="#" onclick="load(); return false;">Discard Changes</a></div></div></td></tr>';
+const PAGES = {
+  snmp: ['snmp.b', d => '<table><tbody>' +
+    '<tr><td>Enabled <input type="checkbox" id="en0"' + (d.en ? ' checked' : '') + '></td></tr>' +
+    '<tr><td><input id="com" value="' + d.com + '"></td></tr>' +
+    '<tr><td><input id="ci" value="' + d.ci + '"></td></tr>' +
+    '<tr><td><input id="loc" value="' + d.loc + '"></td></tr>' + APPLY + '</tbody></table>',
+    () => ({en: document.getElementById('en0').checked ? 1 : 0, com: document.getElementById('com').value,
+            ci: document.getElementById('ci').value, loc: document.getElementById('loc').value})],
+  system: ['sys.b', d => '<table><tbody>' +
+    '<tr><td>Version ' + d.ver + '</td></tr>' +
+    '<tr><td>Board ' + d.brd + '</td></tr>' +
+    '<tr><td><input id="id" value="' + d.id + '"></td></tr>' +
+    '<tr><td></td></tr>' + APPLY + '</tbody></table>',
+    () => ({id: document.getElementById('id').value})],
+  upgrade: ['upgrade.b', d => '<table><tbody>' +
+    '<tr><td>Version ' + d.ver + '</td></tr>' +
+    '<tr><td><a href="#" onclick="upgrade(); return false;">Download &amp; Upgrade</a></td></tr>' +
+    '</tbody></table>', null],
+};
+function page() { return PAGES[location.hash.slice(1)] || PAGES.system; }
+function load() {
+  fetch(page()[0]).then(r => r.text()).then(t => { document.getElementById('page').innerHTML = page()[1](parse(t)); });
+}
+function apply() { fetch(page()[0], {method: 'POST', body: encode(page()[2]())}).then(load); }
+function upgrade() { fetch('upgrade.b', {method: 'POST', body: '{upg:0x01}'}); }
+window.addEventListener('hashchange', load);
+load();
+</script>
+</body></html>
+'''
+
+def swos_encode(data):
+    '''
+    Encodes a dictionary the way SwOS data endpoints do: numbers as 0x.., strings hex encoded.
+    '''
+    fields = []
+    for key, value in data.items():
+        if key in STRING_FIELDS:
+            fields.append(f"{key}:'{str(value).encode().hex()}'")
+        else:
+            fields.append(f'{key}:0x{int(value):02x}')
+
+    return '{' + ','.join(fields) + '}'
+
+def swos_decode(text):
+    '''
+    Decodes a SwOS data endpoint body into a dictionary.
+    '''
+    data = {}
+    for key, string, number in re.findall(r"(\w+):(?:'([0-9a-f]*)'|0x([0-9a-f]+))", text):
+        data[key] = bytes.fromhex(string).decode() if key in STRING_FIELDS else int(number, 16)
+
+    return data
+
+def sim_switch_name(index):
+    return f'site{index // 10}-sw{index % 10 + 1}'
+
+class SwosSimulator:
+    '''
+    Serves the SwOS pages for many simulated switches, and counts requests and applied changes.
+    '''
+    def __init__(self, switches=100, delay=0.0, upgrade_duration=30.0):
+        self.switches = switches
+        self.delay = delay
+        self.upgrade_duration = upgrade_duration
+        self.state = {}
+        self.requests = 0
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    def switch(self, index):
+        with self.lock:
+            if index not in self.state:
+                self.state[index] = {
+                    'snmp.b': {'en': 0, 'com': 'public', 'ci': '', 'loc': ''},
+                    'sys.b': {'id': f'MikroTik-{index}', 'ver': SWOS_VERSION, 'brd': 'CSS326-24G-2S+'},
+                    'upgrading_until': 0,
+                }
+
+            return self.state[index]
+
+    def authenticate(self, header):
+        '''
+        Returns the switch index of the basic auth user name, or None.  Any password is accepted.
+        '''
+        if not header or not header.startswith('Basic '):
+            return None
+
+        try:
+            username = base64.b64decode(header[6:]).decode().split(':', 1)[0]
+        except ValueError:
+            return None
+
+        if not username.startswith(SWOS_USERNAME_PREFIX) or not username[len(SWOS_USERNAME_PREFIX):].isdigit():
+            return None
+
+        return int(username[len(SWOS_USERNAME_PREFIX):]) % self.switches
+
+    def handle(self, method, path, switch, body):
+        '''
+        Answers one request for a switch.  Returns (status, content type, body).
+        '''
+        if time.monotonic() < switch['upgrading_until']:
+            return 503, 'text/plain', 'upgrading'
+        if switch['upgrading_until']:
+            switch['sys.b']['ver'] = SWOS_UPGRADE_VERSION
+
+        if path in ('/', '/index.html'):
+            return 200, 'text/html', INDEX_HTML
+
+        if path in ('/snmp.b', '/sys.b') and method == 'GET':
+            return 200, 'text/plain', swos_encode(switch[path[1:]])
+
+        if path in ('/snmp.b', '/sys.b') and method == 'POST':
+            with self.lock:
+                switch[path[1:]].update(
+                    {key: value for key, value in swos_decode(body).items() if key in switch[path[1:]] and key not in ('ver', 'brd')}
+                )
+                self.changes += 1
+            return 200, 'text/plain', ''
+
+        if path == '/upgrade.b' and method == 'GET':
+            return 200, 'text/plain', swos_encode({'ver': switch['sys.b']['ver']})
+
+        if path == '/upgrade.b' and method == 'POST':
+            with self.lock:
+                switch['upgrading_until'] = time.monotonic() + self.upgrade_duration
+                self.changes += 1
+            return 200, 'text/plain', ''
+
+        return 404, 'text/plain', 'not found'
+
+def make_handler(simulator):
+    class SwosRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def answer(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode() if length else ''
+
+            with simulator.lock:
+                simulator.requests += 1
+
+            if simulator.delay:
+                time.sleep(simulator.delay)
+
+            index = simulator.authenticate(self.headers.get('Authorization'))
+            if index is None:
+                status, content_type, text = 401, 'text/plain', 'unauthorized'
+            else:
+                status, content_type, text = simulator.handle(method, self.path.split('?')[0], simulator.switch(index), body)
+
+            data = text.encode()
+            self.send_response(status)
+            if status == 401:
+                self.send_header('WWW-Authenticate', 'Basic realm="CSS326-24G-2S+"')
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.answer('GET')
+
+        def do_POST(self):
+            self.answer('POST')
+
+    return SwosRequestHandler
+
+def start(port=SWOS_SIM_PORT, switches=100, delay=0.0, upgrade_duration=30.0):
+    '''
+    Starts the stand-in in a background thread.  Returns (simulator, server); stop it with server.shutdown().
+    '''
+    simulator = SwosSimulator(switches=switches, delay=delay, upgrade_duration=upgrade_duration)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(simulator))
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return simulator, server
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for the SwOS web UI of many switches')
+    parser.add_argument('--port', type=int, default=SWOS_SIM_PORT)
+    parser.add_argument('--switches', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before each response')
+    parser.add_argument('--upgrade-duration', type=float, default=30.0, help='seconds a switch is down after an upgrade')
+    args = parser.parse_args()
+
+    simulator, server = start(args.port, args.switches, args.delay, args.upgrade_duration)
+    print(f'simulating {args.switches} SwOS switches on 127.0.0.1:{args.port}, log in as sim-0..sim-{args.switches - 1}')
+    try:
+        while True:
+            time.sleep(60)
+            print(f'{simulator.requests} requests, {simulator.changes} changes applied')
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
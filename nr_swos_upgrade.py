@@ -7,21 +7,24 @@ import sys # for catching arugments
 from nornir import InitNornir
 from nornir_routeros.plugins.tasks import *
 from nornir.core.task import Task, Result
-from nornir_utils.plugins.functions import print_result
-from nornir.core.filter import F
 from config import *
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 import logging
+from nr_logging import setup_logging
 from time import sleep
+from nr_metrics import TimingProcessor, write_metrics, TRANSPORT_METRICS
+from nr_report import StreamReporter
+from nr_inventory_index import filter_target, command_line_target
+import time
 
-logging.basicConfig(filename='logs/nr_swos_snmp.log', level=logging.DEBUG)
+setup_logging('nr_swos_snmp')
 
 def upgrade_firmware(task: Task) -> Result:
     try:
         # Send debug message to log file
-        logging.debug(f"Opening webdriver {task.host.name}")
+        logging.debug('Opening webdriver', extra={'host': task.host.name})
 
         # Set firefox to run in headless mode
         firefox_options = webdriver.firefox.options.Options()
@@ -30,10 +33,12 @@ def upgrade_firmware(task: Task) -> Result:
         # Open webdriver
         wdriver = webdriver.Firefox(options=firefox_options)
         wdriver.implicitly_wait(5)
+        started = time.perf_counter()
         wdriver.get(f'http://{task.host.username}:{task.host.password}@{task.host.hostname}/index.html#upgrade')
+        TRANSPORT_METRICS.record(task.host.hostname, 'swos_http', rtt=time.perf_counter() - started)
     except Exception as e:
         # Send debug message to log file
-        logging.debug(f"Failed to open webdriver {task.host.name}. Error: {e}")
+        logging.debug('Failed to open webdriver. Error: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f"Failed to open webdriver {task.host.name}. Error: {e}",
@@ -42,7 +47,7 @@ def upgrade_firmware(task: Task) -> Result:
     # Begin the upgrade and log any errors
     try:
         # Send debug output to the log file
-        logging.debug(f' on {task.host.name}')
+        logging.debug('Beginning upgrade', extra={'host': task.host.name})
 
         upgrade_button = wdriver.find_element(By.LINK_TEXT, 'Download & Upgrade')
         upgrade_button.click()
@@ -51,7 +56,7 @@ def upgrade_firmware(task: Task) -> Result:
         sleep(60)
 
     except Exception as e:
-        logging.error(f'Error beginning upgrade on {task.host.name}: {e}')
+        logging.error('Error beginning upgrade: %s', e, extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error beginning upgrade on {task.host.name}: {e}',
@@ -60,10 +65,10 @@ def upgrade_firmware(task: Task) -> Result:
     # Close the webdriver
     try:
         # Send debug output to the log file
-        logging.debug(f'Closing webdriver {task.host.name}')
+        logging.debug('Closing webdriver', extra={'host': task.host.name})
         wdriver.close()
     except:
-        logging.error(f'Error closing webdriver {task.host.name}')
+        logging.error('Error closing webdriver', extra={'host': task.host.name})
         return Result(
             host=task.host,
             result=f'Error closing webdriver {task.host.name}',
@@ -79,23 +84,28 @@ def main():
     # initialize Nornir
     nr = InitNornir()
 
-    # Save the first argument passed to the script as a variable called target if sys.argv[1] exists
-    target = sys.argv[1] if len(sys.argv) > 1 else None
+    # Save the first argument passed to the script, with any selector words after it, as a variable called target
+    target = command_line_target()
 
-    # If target is 'all', continue. Otherwise, filter the inventory using target as a hostname
-    if target == 'all':
-        nr = nr.filter(F(groups__contains='swos'))
-    else:
-        nr = nr.filter(name=target).filter(F(groups__contains='swos'))
-        print(f'filtered inventory to {target}')
+    # If target is 'all', continue. Otherwise, filter the inventory to the hostname or selectors
+    nr = filter_target(nr, target, group='swos')
+
+    # Record the time spent in each task, and print one line per host as tasks finish
+    timing = TimingProcessor()
+    reporter = StreamReporter('nr_swos_upgrade')
+    nr = nr.with_processors([timing, reporter])
 
     # Run tasks
     logging.debug('Running tasks')
 
-    result = nr.run(
+    nr.run(
         task=upgrade_firmware,
     )
-    print_result(result)
+
+    # Print the summary table and save task timings
+    reporter.print_summary()
+    reporter.close()
+    write_metrics(timing, 'nr_swos_upgrade')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
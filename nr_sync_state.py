@@ -0,0 +1,110 @@
+"""
+Local snapshot of what the last successful Nautobot sync pushed for each host.
+
+The data the sync stages read from host.data is split into object classes (the device,
+its interfaces, its IP addresses) and each class is reduced to a hash of its canonical
+JSON form.  After a sync, the hashes of the hosts that didn't fail are stored per host in
+SYNC_STATE_DIR.  The next sync compares them with the freshly gathered data and only runs
+the write stages of the classes that changed.  A class also resyncs when a class it
+depends on changed (new device id, renamed interfaces), and everything resyncs when the
+Nautobot URL is not the one the state was recorded against.
+"""
+
+import hashlib
+import json
+import os
+import config
+
+# Directory holding one <host>.json file per host
+SYNC_STATE_DIR = getattr(config, 'SYNC_STATE_DIR', '~/.cache/nornir-mikrotik/sync')
+
+# The host.data keys each object class is built from
+SYNC_CLASSES = {
+    'device': ['site', 'role', 'hardware', 'serial'],
+    'interfaces': ['interfaces'],
+    'ip_addresses': ['ip_addresses'],
+}
+
+# Classes that have to be synced again when a class changes
+SYNC_DEPENDENCIES = {
+    'device': ['interfaces', 'ip_addresses'],
+    'interfaces': ['ip_addresses'],
+}
+
+def canonical(value):
+    '''
+    Returns value with dictionary keys sorted and lists in a fixed order, so the same data
+    read in a different order gives the same JSON.
+    '''
+    # Dictionaries and the compact records of nr_host_records
+    if isinstance(value, dict) or hasattr(value, 'keys'):
+        return {key: canonical(value[key]) for key in sorted(value.keys())}
+    if isinstance(value, list):
+        return sorted((canonical(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+def host_hashes(data):
+    '''
+    Returns {object class: hash} for a host's data.
+    '''
+    hashes = {}
+    for object_class, keys in SYNC_CLASSES.items():
+        text = json.dumps(canonical({key: data.get(key) for key in keys}), sort_keys=True, separators=(',', ':'), default=str)
+        hashes[object_class] = hashlib.sha256(text.encode()).hexdigest()
+
+    return hashes
+
+class SyncState:
+    '''
+    Reads and writes the sync state of hosts.  Each host has its own file, like the fact cache.
+    '''
+    def __init__(self, state_dir=SYNC_STATE_DIR, nautobot_url=''):
+        self.state_dir = os.path.expanduser(state_dir)
+        self.nautobot_url = nautobot_url
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def path(self, host_name):
+        return os.path.join(self.state_dir, f'{host_name}.json')
+
+    def load(self, host_name):
+        '''
+        Returns the {object class: hash} of the host's last successful sync to this Nautobot, or {}.
+        '''
+        try:
+            with open(self.path(host_name), 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+        if state.get('nautobot_url') != self.nautobot_url:
+            return {}
+
+        return state.get('hashes', {})
+
+    def changed(self, host_name, hashes):
+        '''
+        Returns the set of object classes whose hash differs from the last sync, with the classes depending on them.
+        '''
+        synced = self.load(host_name)
+        changed = {object_class for object_class, value in hashes.items() if synced.get(object_class) != value}
+
+        for object_class in list(changed):
+            changed.update(SYNC_DEPENDENCIES.get(object_class, []))
+
+        return changed
+
+    def save(self, host_name, hashes):
+        # Write to a temporary file and rename it, so a crash never leaves a half written file
+        tmp_path = self.path(host_name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'nautobot_url': self.nautobot_url, 'hashes': hashes}, f)
+        os.replace(tmp_path, self.path(host_name))
+
+    def invalidate(self, host_name):
+        '''
+        Removes the sync state of a host, so its next sync is a full one.
+        '''
+        try:
+            os.remove(self.path(host_name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,121 @@
+from nr_compliance import parse_command, section_path, parse_export, export_major_version, check_rule
+
+EXPORT_V6 = '''# oct/19/2026 02:00:01 by RouterOS 6.49.10
+/ip service
+set telnet disabled=yes
+set ftp disabled=yes
+set ssh address=10.0.0.0/8
+/snmp
+set contact=admin@example.net enabled=yes
+/snmp community
+set [ find default=yes ] addresses=10.0.0.0/8 name=public
+/system logging action
+add name=remote remote=10.0.0.5 target=remote
+/system logging
+add action=remote topics=critical,error
+/system ntp client
+set enabled=yes primary-ntp=10.0.0.1 server-dns-names=time.example.net
+'''
+
+EXPORT_V7 = '''# 2026-10-19 02:00:01 by RouterOS 7.15.3
+/ip service
+set telnet disabled=yes
+/system ntp client
+set enabled=yes
+/system ntp client servers
+add address=time.example.net
+/interface bridge port
+add bridge=bridge1 comment="uplink to core" \\
+    interface=ether1
+'''
+
+def test_parse_command_set_by_name():
+    assert parse_command('set telnet disabled=yes') == ('set', {'name': 'telnet'}, {'disabled': 'yes'})
+
+def test_parse_command_find_selector():
+    command, selector, properties = parse_command('set [ find default-name=ether1 ] name=uplink mtu=1500')
+
+    assert command == 'set'
+    assert selector == {'default-name': 'ether1'}
+    assert properties == {'name': 'uplink', 'mtu': '1500'}
+
+def test_parse_command_quoted_value():
+    command, selector, properties = parse_command('add comment="uplink \\"a\\" to core" name=vlan10')
+
+    assert command == 'add'
+    assert selector is None
+    assert properties == {'comment': 'uplink "a" to core', 'name': 'vlan10'}
+
+def test_parse_command_item_number():
+    assert parse_command('set 0 disabled=yes') == ('set', {}, {'disabled': 'yes'})
+
+def test_section_path_with_command():
+    assert section_path('/ip service set telnet disabled=yes') == ('/ip/service', 'set telnet disabled=yes')
+    assert section_path('/system ntp client') == ('/system/ntp/client', '')
+
+def test_continued_lines():
+    tree = parse_export(EXPORT_V7)
+
+    assert tree.items['/interface/bridge/port'] == [{'bridge': 'bridge1', 'comment': 'uplink to core', 'interface': 'ether1'}]
+
+def test_set_merges_into_named_item_and_settings():
+    tree = parse_export(EXPORT_V6)
+
+    assert tree.find('/ip/service', {'name': 'ssh'}) == [{'name': 'ssh', 'address': '10.0.0.0/8'}]
+    assert tree.settings['/snmp'] == {'contact': 'admin@example.net', 'enabled': 'yes'}
+
+def test_adds_with_the_same_name_are_kept():
+    tree = parse_export('/ip dns static\nadd address=1.1.1.1 name=foo.example\nadd address=2.2.2.2 name=foo.example\n')
+
+    assert [item['address'] for item in tree.find('/ip/dns/static', {'name': 'foo.example'})] == ['1.1.1.1', '2.2.2.2']
+
+def test_export_major_version():
+    assert export_major_version(parse_export(EXPORT_V6)) == '6'
+    assert export_major_version(parse_export(EXPORT_V7)) == '7'
+    assert export_major_version(parse_export('/ip service\nset telnet disabled=yes\n')) is None
+
+def test_check_rule_compliant():
+    tree = parse_export(EXPORT_V6)
+
+    assert check_rule(tree, {'path': '/ip/service', 'where': {'name': 'telnet'}, 'properties': {'disabled': 'yes'}}) == []
+
+def test_check_rule_section_settings():
+    tree = parse_export(EXPORT_V6)
+
+    assert check_rule(tree, {'path': '/snmp', 'where': {}, 'properties': {'enabled': 'yes'}}) == []
+
+def test_check_rule_property_differs():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/ip/service', 'where': {'name': 'ssh'}, 'properties': {'address': '192.168.0.0/16'}}
+
+    assert check_rule(tree, rule) == ['/ip/service name=ssh: address=10.0.0.0/8, want 192.168.0.0/16']
+
+def test_check_rule_missing_item():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/ip/service', 'where': {'name': 'api-ssl'}, 'properties': {'disabled': 'yes'}}
+
+    assert check_rule(tree, rule) == ['/ip/service name=api-ssl: missing']
+
+def test_check_rule_list_in_any_order():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/system/logging', 'where': {'action': 'remote'}, 'properties': {'topics': 'error,critical'}}
+
+    assert check_rule(tree, rule) == []
+
+def test_check_rule_default_disabled():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/system/logging/action', 'where': {'name': 'remote'}, 'properties': {'disabled': 'no'}}
+
+    assert check_rule(tree, rule) == []
+
+def test_check_rule_unset_property():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/ip/service', 'where': {'name': 'telnet'}, 'properties': {'address': '10.0.0.0/8'}}
+
+    assert check_rule(tree, rule) == ['/ip/service name=telnet: address is not set, want 10.0.0.0/8']
+
+def test_check_rule_sensitive_property_is_skipped():
+    tree = parse_export(EXPORT_V6)
+    rule = {'path': '/snmp/community', 'where': {'name': 'public'}, 'properties': {'authentication-password': 'secret'}}
+
+    assert check_rule(tree, rule) == []
@@ -0,0 +1,66 @@
+from nr_config_diff import diff_exports, summarize
+
+HEADER_OLD = '# 2026-10-18 02:00:01 by RouterOS 7.15.3\n'
+HEADER_NEW = '# 2026-10-19 02:00:02 by RouterOS 7.15.3\n'
+
+def test_header_only_is_no_change():
+    export = '/ip service\nset telnet disabled=yes\n'
+    assert diff_exports(HEADER_OLD + export, HEADER_NEW + export) == []
+
+def test_same_name_adds_are_separate_items():
+    old = HEADER_OLD + '/ip dns static\nadd address=1.1.1.1 name=foo.example\nadd address=2.2.2.2 name=foo.example\n'
+    new = HEADER_NEW + '/ip dns static\nadd address=3.3.3.3 name=foo.example\nadd address=2.2.2.2 name=foo.example\n'
+
+    changes = diff_exports(old, new)
+    assert len(changes) == 1
+    assert changes[0]['action'] == 'modified'
+    assert changes[0]['changes'] == {'address': ('1.1.1.1', '3.3.3.3')}
+
+def test_same_name_add_removed():
+    old = '/ip dns static\nadd address=1.1.1.1 name=foo.example\nadd address=2.2.2.2 name=foo.example\n'
+    new = '/ip dns static\nadd address=2.2.2.2 name=foo.example\n'
+
+    assert summarize(diff_exports(old, new)) == '1 removed'
+
+def test_reordered_queues_are_a_change():
+    old = '/queue simple\nadd name=q1 target=10.0.0.1/32\nadd name=q2 target=10.0.0.2/32\n'
+    new = '/queue simple\nadd name=q2 target=10.0.0.2/32\nadd name=q1 target=10.0.0.1/32\n'
+
+    assert diff_exports(old, new) != []
+
+def test_reordered_firewall_rules_are_a_change():
+    old = '/ip firewall filter\nadd action=accept chain=input protocol=icmp\nadd action=drop chain=input\n'
+    new = '/ip firewall filter\nadd action=drop chain=input\nadd action=accept chain=input protocol=icmp\n'
+
+    assert diff_exports(old, new) != []
+
+def test_reordered_address_list_is_no_change():
+    old = '/ip firewall address-list\nadd address=10.0.0.1 list=mgmt\nadd address=10.0.0.2 list=mgmt\n'
+    new = '/ip firewall address-list\nadd address=10.0.0.2 list=mgmt\nadd address=10.0.0.1 list=mgmt\n'
+
+    assert diff_exports(old, new) == []
+
+def test_reordered_keyed_items_are_no_change():
+    old = '/interface bridge port\nadd bridge=bridge1 interface=ether2\nadd bridge=bridge1 interface=ether3\n'
+    new = '/interface bridge port\nadd bridge=bridge1 interface=ether3\nadd bridge=bridge1 interface=ether2\n'
+
+    assert diff_exports(old, new) == []
+
+def test_continued_lines_are_no_change():
+    old = '/ip address\nadd address=10.0.0.1/24 interface=ether1 network=10.0.0.0\n'
+    new = '/ip address\nadd address=10.0.0.1/24 interface=ether1 \\\n    network=10.0.0.0\n'
+
+    assert diff_exports(old, new) == []
+
+def test_remove_and_disable_are_changes():
+    old = '/interface ethernet\nset [ find default-name=ether5 ] name=ether5\n'
+    new = old + '/interface\ndisable ether5\n/ip hotspot profile\nremove [ find default=yes ]\n'
+
+    changes = diff_exports(old, new)
+    assert {change['path'] for change in changes} == {'/interface', '/ip/hotspot/profile'}
+
+def test_unparsed_difference_is_a_change():
+    old = '/tool romon\nport add disabled=no\n'
+    new = '/tool romon\nport add disabled=yes\n'
+
+    assert diff_exports(old, new) != []
@@ -0,0 +1,99 @@
+from nr_nautobot_graphql import graphql_choice, graphql_status, normalize_device, nb_changes
+
+DEVICE = {
+    'id': 'd1',
+    'name': 'dal-core1',
+    'serial': None,
+    'status': {'slug': 'active'},
+    'site': {'id': 's1', 'name': 'Dallas', 'slug': 'dallas'},
+    'device_type': {'id': 't1', 'model': 'CCR2004-16G-2S+'},
+    'device_role': {'id': 'r1', 'name': 'core'},
+    'interfaces': [
+        {
+            'id': 'i1',
+            'name': 'ether1',
+            'type': 'A_1000BASE_T',
+            'mac_address': '00:00:00:00:00:01',
+            'description': None,
+            'status': {'slug': 'active'},
+            'cf_default_name': 'ether1',
+            'ip_addresses': [
+                {'id': 'a1', 'address': '10.0.0.1/32', 'description': 'loopback', 'role': 'LOOPBACK', 'status': {'slug': 'active'}},
+            ],
+        },
+        {
+            'id': 'i2',
+            'name': 'vlan10',
+            'type': 'VIRTUAL',
+            'mac_address': None,
+            'description': 'users',
+            'status': {'slug': 'active'},
+            'cf_default_name': None,
+            'ip_addresses': None,
+        },
+    ],
+}
+
+def test_graphql_choice():
+    assert graphql_choice('A_1000BASE_T') == '1000base-t'
+    assert graphql_choice('A_10GBASE_X_SFPP') == '10gbase-x-sfpp'
+    assert graphql_choice('VIRTUAL') == 'virtual'
+    assert graphql_choice('LOOPBACK') == 'loopback'
+
+def test_graphql_choice_leaves_rest_values():
+    assert graphql_choice('1000base-t') == '1000base-t'
+    assert graphql_choice('') == ''
+    assert graphql_choice(None) is None
+
+def test_graphql_status():
+    assert graphql_status({'slug': 'active'}) == 'active'
+    assert graphql_status('active') == 'active'
+    assert graphql_status(None) is None
+
+def test_normalize_device():
+    device = normalize_device(DEVICE)
+
+    assert device['serial'] == ''
+    assert device['status'] == 'active'
+    assert device['site'] == {'id': 's1', 'name': 'Dallas', 'slug': 'dallas'}
+    assert [interface['name'] for interface in device['interfaces']] == ['ether1', 'vlan10']
+
+def test_normalize_device_interfaces():
+    ether1, vlan10 = normalize_device(DEVICE)['interfaces']
+
+    assert ether1['type'] == '1000base-t'
+    assert ether1['description'] == ''
+    assert ether1['custom_fields'] == {'default_name': 'ether1'}
+    assert vlan10['type'] == 'virtual'
+    assert vlan10['ip_addresses'] == []
+
+def test_normalize_device_ip_addresses():
+    ip_address = normalize_device(DEVICE)['interfaces'][0]['ip_addresses'][0]
+
+    assert ip_address == {
+        'id': 'a1',
+        'address': '10.0.0.1/32',
+        'description': 'loopback',
+        'role': 'loopback',
+        'status': 'active',
+        'assigned_object_type': 'dcim.interface',
+        'assigned_object_id': 'i1',
+    }
+
+def test_normalized_device_matches_wanted_fields():
+    device = normalize_device(DEVICE)
+    wanted = {
+        'device_type': {'model': 'CCR2004-16G-2S+'},
+        'site': {'name': 'Dallas'},
+        'status': 'active',
+        'device_role': {'name': 'core'},
+        'serial': '',
+    }
+
+    assert nb_changes(device, wanted) == {}
+    assert nb_changes(device, {**wanted, 'serial': 'HEX0001'}) == {'serial': 'HEX0001'}
+
+def test_nb_changes_mac_address_case():
+    interface = normalize_device(DEVICE)['interfaces'][0]
+
+    assert nb_changes(interface, {'mac_address': '00:00:00:00:00:01'.upper()}) == {}
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+import pytest
+from nr_routeros_async import encode_length, encode_sentence, read_length, read_sentence, length_size, parse_sentence
+from nr_fact_cache import FactCache
+
+# Lengths at the edges of each encoded size: 1 to 5 bytes
+LENGTHS = [0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0xFFFFFFF, 0x10000000]
+
+def stream(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+def decode_length(data):
+    async def decode():
+        reader = stream(data)
+        length = await read_length(reader)
+        assert reader.at_eof()
+        return length
+
+    return asyncio.run(decode())
+
+def test_encode_length_documented_examples():
+    assert encode_length(0x7F) == b'\x7f'
+    assert encode_length(0x80) == b'\x80\x80'
+    assert encode_length(0x4000) == b'\xc0\x40\x00'
+    assert encode_length(0x200000) == b'\xe0\x20\x00\x00'
+    assert encode_length(0x10000000) == b'\xf0\x10\x00\x00\x00'
+
+@pytest.mark.parametrize('length', LENGTHS)
+def test_length_round_trip(length):
+    encoded = encode_length(length)
+
+    assert decode_length(encoded) == length
+    assert length_size(length) == len(encoded)
+
+def test_sentence_round_trip():
+    words = ['/interface/print', '=.proplist=name,comment', '?type=ether', '=comment=' + 'x' * 200, '=comment=fünf']
+    encoded = encode_sentence(words)
+    sizes = []
+
+    async def decode():
+        return await read_sentence(stream(encoded), sizes)
+
+    assert asyncio.run(decode()) == words
+    assert sizes == [len(encoded)]
+
+def test_parse_sentence():
+    words = ['!re', '.tag=3', '=name=ether1', '=comment=a=b', '=disabled=false']
+
+    assert parse_sentence(words) == ('!re', '3', {'name': 'ether1', 'comment': 'a=b', 'disabled': 'false'})
+    assert parse_sentence(['!done']) == ('!done', None, {})
+
+def test_fact_cache_fresh_fact(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 60})
+    cache.set('dal-core1', {'ros_version': '7.15.3'})
+
+    assert cache.get('dal-core1', 'ros_version') == '7.15.3'
+
+def test_fact_cache_ttl_0_is_not_stored(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 60, 'interfaces': 0})
+    cache.set('dal-core1', {'ros_version': '7.15.3', 'interfaces': []})
+
+    assert 'interfaces' not in cache.load('dal-core1')
+    with pytest.raises(KeyError):
+        cache.get('dal-core1', 'interfaces')
+
+def test_fact_cache_stale_fact(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 60})
+    cache.write('dal-core1', {'ros_version': {'value': '7.15.3', 'fetched': time.time() - 61}})
+
+    with pytest.raises(KeyError):
+        cache.get('dal-core1', 'ros_version')
+
+def test_fact_cache_missing_host_and_broken_file(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 60})
+    (tmp_path / 'dal-core1.json').write_text('{not json')
+
+    assert cache.load('dal-core1') == {}
+    with pytest.raises(KeyError):
+        cache.get('atl-edge1', 'ros_version')
+
+def test_fact_cache_invalidate_facts(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 60, 'serial': 60})
+    cache.set('dal-core1', {'ros_version': '7.15.3', 'serial': 'HEX0001'})
+    cache.invalidate('dal-core1', ['ros_version'])
+
+    assert cache.get('dal-core1', 'serial') == 'HEX0001'
+    with pytest.raises(KeyError):
+        cache.get('dal-core1', 'ros_version')
+
+def test_fact_cache_invalidate_host(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'serial': 60})
+    cache.set('dal-core1', {'serial': 'HEX0001'})
+    cache.invalidate('dal-core1')
+    cache.invalidate('dal-core1')
+
+    assert cache.load('dal-core1') == {}
+
+def test_fact_cache_value_fetched_before_a_scheduled_change(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'ros_version': 3600})
+    cache.invalidate('dal-core1', ['ros_version'], at=time.time() + 0.2)
+
+    # Fetched before the upgrade reboot: fresh until the reboot, stale after it
+    cache.set('dal-core1', {'ros_version': '7.15.3'})
+    assert cache.get('dal-core1', 'ros_version') == '7.15.3'
+    time.sleep(0.3)
+    with pytest.raises(KeyError):
+        cache.get('dal-core1', 'ros_version')
+
+    # Fetched after the reboot
+    cache.set('dal-core1', {'ros_version': '7.16'})
+    assert cache.get('dal-core1', 'ros_version') == '7.16'
+
+def test_fact_cache_file_is_json(tmp_path):
+    cache = FactCache(cache_dir=tmp_path, ttls={'hardware': 60})
+    cache.set('dal-core1', {'hardware': 'CCR2004-16G-2S+'})
+
+    assert json.loads((tmp_path / 'dal-core1.json').read_text())['hardware']['value'] == 'CCR2004-16G-2S+'
@@ -0,0 +1,147 @@
+import time
+import pytest
+from nornir.core import Nornir
+from nornir.core.inventory import Inventory, Hosts, Host, Groups, Defaults
+from nornir.core.task import Result
+from nornir.plugins.runners import SerialRunner
+from nr_budget import HostGuard, BudgetExceeded, CircuitOpen, find_guard, remaining_time, transport_timeout, check_deadline
+from nr_routeros_pull_to_nautobot import fleet_prefixes, sync_changes, changed_hosts_of
+from nr_sync_state import SyncState, host_hashes
+
+def make_nornir(host_data, processors=None):
+    hosts = Hosts({name: Host(name=name, data=data) for name, data in host_data.items()})
+    nr = Nornir(inventory=Inventory(hosts=hosts, groups=Groups(), defaults=Defaults()), runner=SerialRunner())
+    return nr.with_processors(processors) if processors else nr
+
+def ip(address, network, disabled='false'):
+    return {'address': address, 'network': network, 'interface': 'ether1', 'disabled': disabled}
+
+def failing(task):
+    raise RuntimeError('unreachable')
+
+def with_subtask(task):
+    task.run(task=lambda task: Result(host=task.host))
+    return Result(host=task.host)
+
+def test_guard_opens_circuit_after_max_failures():
+    guard = HostGuard(max_failures=2)
+    nr = make_nornir({'dal-core1': {}}, [guard])
+
+    nr.run(task=failing)
+    assert 'dal-core1' not in guard.open_circuits
+    nr.data.reset_failed_hosts()
+    nr.run(task=failing)
+
+    assert guard.failures['dal-core1'] == 2
+    assert 'dal-core1' in guard.open_circuits
+
+    # The circuit stays open for the rest of the run
+    nr.data.reset_failed_hosts()
+    result = nr.run(task=with_subtask)
+    assert isinstance(result['dal-core1'][0].exception, CircuitOpen)
+
+def test_guard_counts_a_failed_subtask_once():
+    guard = HostGuard(max_failures=10)
+    nr = make_nornir({'dal-core1': {}}, [guard])
+
+    nr.run(task=lambda task: task.run(task=failing))
+
+    assert guard.failures['dal-core1'] == 1
+
+def test_guard_refuses_subtasks_after_the_budget():
+    guard = HostGuard(budget=0)
+    nr = make_nornir({'dal-core1': {}}, [guard])
+
+    result = nr.run(task=with_subtask)
+
+    assert isinstance(result['dal-core1'][0].exception, BudgetExceeded)
+    assert 'dal-core1' in guard.open_circuits
+
+def test_guard_deadlines_are_per_instance():
+    short = HostGuard(budget=0.01)
+    long = HostGuard(budget=600)
+    make_nornir({'dal-core1': {}}, [short]).run(task=lambda task: Result(host=task.host))
+    make_nornir({'dal-core1': {}}, [long]).run(task=lambda task: Result(host=task.host))
+    time.sleep(0.02)
+
+    assert remaining_time(short, 'dal-core1') == 0
+    assert remaining_time(long, 'dal-core1') > 500
+    assert transport_timeout(long, 'dal-core1', 15) == 15
+    assert transport_timeout(short, 'dal-core1', 15) == 0
+    check_deadline(long, 'dal-core1')
+
+    short.reset()
+    assert remaining_time(short, 'dal-core1') is None
+
+def test_check_deadline():
+    guard = HostGuard(budget=0)
+    guard.deadlines['dal-core1'] = time.monotonic()
+
+    with pytest.raises(BudgetExceeded):
+        check_deadline(guard, 'dal-core1')
+
+    # Without a guard, or for a host without a budget, there is no deadline
+    check_deadline(None, 'dal-core1')
+    check_deadline(guard, 'atl-edge1')
+    assert transport_timeout(None, 'dal-core1', 15) == 15
+
+def test_find_guard():
+    guard = HostGuard()
+
+    assert find_guard(make_nornir({}, [guard])) is guard
+    assert find_guard(make_nornir({})) is None
+
+def test_fleet_prefixes():
+    nr = make_nornir({
+        'dal-core1': {'ip_addresses': [ip('10.0.0.1/24', '10.0.0.0'), ip('10.0.1.1/24', '10.0.1.0', disabled='true')]},
+        'dal-edge2': {'ip_addresses': [ip('10.0.0.2/24', '10.0.0.0', disabled='true'), ip('192.168.0.1/32', '192.168.0.1')]},
+        'atl-core1': {'ip_addresses': [ip('10.9.0.1/24', '10.9.0.0')]},
+        'atl-edge2': {},
+    })
+    nr.data.failed_hosts.add('atl-core1')
+
+    assert fleet_prefixes(nr) == {
+        '10.0.0.0/24': 'active',
+        '10.0.1.0/24': 'deprecated',
+        '192.168.0.1/32': 'active',
+    }
+
+def test_fleet_prefixes_active_wins_in_any_order():
+    nr = make_nornir({
+        'dal-core1': {'ip_addresses': [ip('10.0.0.1/24', '10.0.0.0', disabled='true')]},
+        'dal-edge2': {'ip_addresses': [ip('10.0.0.2/24', '10.0.0.0')]},
+        'dal-edge3': {'ip_addresses': [ip('10.0.0.3/24', '10.0.0.0', disabled='true')]},
+    })
+
+    assert fleet_prefixes(nr) == {'10.0.0.0/24': 'active'}
+
+def test_changed_hosts(tmp_path):
+    data = {
+        'site': 'dal', 'role': 'core', 'hardware': 'CCR2004', 'serial': 'HEX0001',
+        'interfaces': [{'name': 'ether1'}], 'ip_addresses': [ip('10.0.0.1/24', '10.0.0.0')],
+    }
+    nr = make_nornir({
+        'dal-core1': dict(data),
+        'dal-core2': dict(data, serial='HEX0002'),
+        'dal-core3': dict(data, ip_addresses=[]),
+        'dal-core4': dict(data),
+    })
+    nr.data.failed_hosts.add('dal-core4')
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(data))
+    state.save('dal-core2', host_hashes(data))
+    state.save('dal-core3', host_hashes(data))
+
+    hashes, changed = sync_changes(nr, state)
+
+    assert set(hashes) == {'dal-core1', 'dal-core2', 'dal-core3'}
+    assert changed == {
+        'dal-core1': set(),
+        'dal-core2': {'device', 'interfaces', 'ip_addresses'},
+        'dal-core3': {'ip_addresses'},
+    }
+    assert set(changed_hosts_of(nr, changed, 'device').inventory.hosts) == {'dal-core2'}
+    assert set(changed_hosts_of(nr, changed, 'ip_addresses').inventory.hosts) == {'dal-core2', 'dal-core3'}
+
+    _, changed = sync_changes(nr, state, full_sync=True)
+    assert set(changed_hosts_of(nr, changed, 'interfaces').inventory.hosts) == {'dal-core1', 'dal-core2', 'dal-core3'}
@@ -0,0 +1,87 @@
+from nr_sync_state import SyncState, host_hashes, canonical
+from nr_host_records import compact
+
+HOST_DATA = {
+    'site': 'dal',
+    'role': 'core',
+    'hardware': 'CCR2004-16G-2S+',
+    'serial': 'HEX0001',
+    'interfaces': [
+        {'name': 'ether1', 'type': 'ether', 'mac-address': '00:00:00:00:00:01'},
+        {'name': 'ether2', 'type': 'ether', 'mac-address': '00:00:00:00:00:02'},
+    ],
+    'ip_addresses': [
+        {'address': '10.0.0.1/24', 'network': '10.0.0.0', 'interface': 'ether1', 'disabled': 'false'},
+    ],
+    'ros_version': '7.15.3',
+}
+
+def with_data(**changes):
+    return {**HOST_DATA, **changes}
+
+def test_canonical_sorts_keys_and_lists():
+    assert canonical({'b': [2, 1], 'a': {'d': 1, 'c': 2}}) == {'a': {'c': 2, 'd': 1}, 'b': [1, 2]}
+
+def test_hashes_ignore_order():
+    reordered = with_data(interfaces=list(reversed(HOST_DATA['interfaces'])))
+
+    assert host_hashes(reordered) == host_hashes(HOST_DATA)
+
+def test_hashes_ignore_data_outside_the_classes():
+    assert host_hashes(with_data(ros_version='7.16')) == host_hashes(HOST_DATA)
+
+def test_hashes_of_compact_records_and_dicts_match():
+    records = with_data(interfaces=compact('interfaces', HOST_DATA['interfaces']))
+
+    assert host_hashes(records) == host_hashes(HOST_DATA)
+
+def test_hashes_change_per_class():
+    old = host_hashes(HOST_DATA)
+    new = host_hashes(with_data(serial='HEX0002'))
+
+    assert {object_class for object_class in old if old[object_class] != new[object_class]} == {'device'}
+
+def test_unknown_host_changed_everything(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+
+    assert state.changed('dal-core1', host_hashes(HOST_DATA)) == {'device', 'interfaces', 'ip_addresses'}
+
+def test_saved_host_unchanged(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(HOST_DATA))
+
+    assert state.changed('dal-core1', host_hashes(HOST_DATA)) == set()
+
+def test_ip_addresses_change_alone(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(HOST_DATA))
+    changed = with_data(ip_addresses=[{**HOST_DATA['ip_addresses'][0], 'disabled': 'true'}])
+
+    assert state.changed('dal-core1', host_hashes(changed)) == {'ip_addresses'}
+
+def test_interfaces_change_resyncs_ip_addresses(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(HOST_DATA))
+    renamed = with_data(interfaces=[{**HOST_DATA['interfaces'][0], 'name': 'wan'}, HOST_DATA['interfaces'][1]])
+
+    assert state.changed('dal-core1', host_hashes(renamed)) == {'interfaces', 'ip_addresses'}
+
+def test_device_change_resyncs_everything(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(HOST_DATA))
+
+    assert state.changed('dal-core1', host_hashes(with_data(site='atl'))) == {'device', 'interfaces', 'ip_addresses'}
+
+def test_other_nautobot_resyncs_everything(tmp_path):
+    SyncState(state_dir=tmp_path, nautobot_url='http://old').save('dal-core1', host_hashes(HOST_DATA))
+    state = SyncState(state_dir=tmp_path, nautobot_url='http://new')
+
+    assert state.changed('dal-core1', host_hashes(HOST_DATA)) == {'device', 'interfaces', 'ip_addresses'}
+
+def test_invalidate(tmp_path):
+    state = SyncState(state_dir=tmp_path)
+    state.save('dal-core1', host_hashes(HOST_DATA))
+    state.invalidate('dal-core1')
+    state.invalidate('dal-core1')
+
+    assert state.load('dal-core1') == {}